@@ -5,6 +5,8 @@ from enum import Enum
 import networkx as nx
 import numpy as np
 
+from skeleton.skeleton_graph import SkeletonGraph
+
 
 """
 Find the segments, lengths and tortuosity of a networkx graph by
@@ -36,8 +38,13 @@ class SegmentStats:
     Find statistics on a networkx graph of a skeleton
     Parameters
     ----------
-    Graph : networkx graph
-       networkx graph of a skeleton
+    Graph : networkx graph or SkeletonGraph
+       networkx graph of a skeleton, the disjoint graphs of a SkeletonGraph are converted to networkx
+       one at a time
+
+    spacing : tuple
+       physical size of a voxel along each dimension, lengths and displacements are in the same units.
+       The 'spacing' attribute of the graph by default, unit voxels if it has none
 
     Examples
     ------
@@ -85,7 +92,8 @@ class SegmentStats:
     tortuosity = curveLength / curveDisplacement
     contraction = curveDisplacement / curveLength (better becuase there is no change of instability (undefined) in case
                                                     of cycles)
-    Hausdorff Dimension = np.log(curveLength) / np.log(curveDisplacement)
+    Hausdorff Dimension = np.log(curveLength) / np.log(curveDisplacement), with the length and the displacement in
+                          units of voxels whatever the spacing, segments with a displacement of 1 voxel have none
     https://en.wikipedia.org/wiki/Hausdorff_dimension
     Type of subgraphs:
     0 = if graph a single node
@@ -95,8 +103,9 @@ class SegmentStats:
     4 = undirected cyclic graph
 
     """
-    def __init__(self, networkxGraph):
+    def __init__(self, networkxGraph, spacing=None):
         self.networkxGraph = networkxGraph
+        self.spacing = networkxGraph.graph.get('spacing') if spacing is None else tuple(spacing)
         # intitialize all the instance variables of SegmentStats class
         self.contractionDict = {}
         self.countDict = {}
@@ -114,7 +123,20 @@ class SegmentStats:
         self._visitedSources = []
         self._visitedPaths = []
         # list of _disjointGraphs
-        self._disjointGraphs = list(nx.connected_component_subgraphs(self.networkxGraph))
+        if isinstance(networkxGraph, SkeletonGraph):
+            componentNodes = networkxGraph.getComponentNodes()
+            self._disjointGraphs = (networkxGraph.toNetworkx(nodes) for nodes in componentNodes)
+            self._countDisjointGraphs = len(componentNodes)
+        else:
+            self._disjointGraphs = list(nx.connected_component_subgraphs(self.networkxGraph))
+            self._countDisjointGraphs = len(self._disjointGraphs)
+
+    def _getDistance(self, start, end):
+        # physical distance between two nodes
+        vect = np.subtract(end, start)
+        if self.spacing is not None:
+            vect = vect * self.spacing
+        return np.linalg.norm(vect)
 
     def _getLengthAndRemoveTracedPath(self, path, isCycle=False, remove=True):
         """
@@ -168,8 +190,7 @@ class SegmentStats:
                 item2 = path[index + 1]
             elif isCycle:
                 item2 = path[0]
-            vect = [j - i for i, j in zip(item, item2)]
-            length += np.linalg.norm(vect)
+            length += self._getDistance(item, item2)
             shortestPathEdges.append(tuple((item, item2)))
         if remove:
             self._subGraphSkeleton.remove_edges_from(shortestPathEdges)
@@ -234,10 +255,13 @@ class SegmentStats:
         else:
             self.countDict[source] = self.countDict[source] + 1
 
-    def _setHausdorffDimensionDict(self, source, target, length, displacement):
-        logDisplacement = np.log(displacement)
-        if logDisplacement != -np.inf or not np.allclose(logDisplacement, 0.0):
-            self.hausdorffDimensionDict[self.countDict[source], source, target] = np.log(length) / logDisplacement
+    def _setHausdorffDimensionDict(self, source, target, path):
+        # hausdorff dimension of the length and the displacement of a path in units of voxels, it does not change
+        # with the spacing, segments whose ends are face neighbors have a displacement of 1 voxel and none
+        length = np.linalg.norm(np.diff(np.array(path, dtype=np.float64), axis=0), axis=1).sum()
+        displacement = np.linalg.norm(np.subtract(target, source))
+        if displacement > 1:
+            self.hausdorffDimensionDict[self.countDict[source], source, target] = np.log(length) / np.log(displacement)
 
     def _singleCycle(self, cycle):
         """
@@ -278,12 +302,12 @@ class SegmentStats:
                     if countBranchNodesOnPath == 2 and isSegmentTraced:
                         self._setCountDict(sourceOnCycle)
                         curveLength = self._getLengthAndRemoveTracedPath(simplePath, remove=False)
-                        curveDisplacement = np.sqrt(np.sum((np.array(sourceOnCycle) - np.array(point)) ** 2))
+                        curveDisplacement = self._getDistance(sourceOnCycle, point)
                         nthSegment = self.countDict[sourceOnCycle]
                         self.lengthDict[nthSegment, sourceOnCycle, point] = curveLength
                         self.tortuosityDict[nthSegment, sourceOnCycle, point] = curveLength / curveDisplacement
                         self.contractionDict[nthSegment, sourceOnCycle, point] = curveDisplacement / curveLength
-                        self._setHausdorffDimensionDict(sourceOnCycle, point, curveLength, curveDisplacement)
+                        self._setHausdorffDimensionDict(sourceOnCycle, point, simplePath)
                         self._visitedPaths.append(simplePath)
                         self._sortedSegments.append(sortedSegment)
                     sourceOnCycle = point
@@ -305,12 +329,12 @@ class SegmentStats:
                     continue
                 self._setCountDict(sourceOnTree)
                 curveLength = self._getLengthAndRemoveTracedPath(simplePath)
-                curveDisplacement = np.sqrt(np.sum((np.array(sourceOnTree) - np.array(item)) ** 2))
+                curveDisplacement = self._getDistance(sourceOnTree, item)
                 nthSegment = self.countDict[sourceOnTree]
                 self.lengthDict[nthSegment, sourceOnTree, item] = curveLength
                 self.tortuosityDict[nthSegment, sourceOnTree, item] = curveLength / curveDisplacement
                 self.contractionDict[nthSegment, sourceOnTree, item] = curveDisplacement / curveLength
-                self._setHausdorffDimensionDict(sourceOnTree, item, curveLength, curveDisplacement)
+                self._setHausdorffDimensionDict(sourceOnTree, item, simplePath)
 
     def _tree(self):
         """
@@ -343,9 +367,12 @@ class SegmentStats:
         self.avgBranching = 0
         if len(self.countDict) != 0:
             self.avgBranching = sum(listCounts) / len(self.countDict)
-        ndd = nx.degree(self.networkxGraph)
-        self.countEndPoints = sum([1 for key, value in ndd.items() if value == 1])
-        self.countBranchPoints = sum([1 for key, value in ndd.items() if value > 2])
+        if isinstance(self.networkxGraph, SkeletonGraph):
+            degrees = self.networkxGraph.degree()
+        else:
+            degrees = np.array(list(nx.degree(self.networkxGraph).values()))
+        self.countEndPoints = int(np.sum(degrees == 1))
+        self.countBranchPoints = int(np.sum(degrees > 2))
 
     def setStats(self):
         """1) go through each of the disjoint graphs
@@ -356,7 +383,7 @@ class SegmentStats:
             self._branchToBranch
         """
         start = time.time()
-        countDisjointGraphs = len(self._disjointGraphs)
+        countDisjointGraphs = self._countDisjointGraphs
         for self._ithDisjointGraph, self._subGraphSkeleton in enumerate(self._disjointGraphs):
             self._findAccessComponentsDisjoint()
             if len(self._nodes) == 1:
@@ -1,3 +1,5 @@
+import numpy as np
+
 from metrics.segmentStats import SegmentStats
 from skeleton.skeleton_testlib import get_cycles_with_branches_protrude, get_single_voxel_lineNobranches, get_cycle_no_tree, get_disjoint_trees_no_cycle_3d
 
@@ -64,3 +66,25 @@ def test_treeNoCycle3D():
     assert stats.cycleInfoDict == {}, "cycleInfoDict must be empty, it is {}".format(stats.cycleInfoDict)
 
 
+def test_spacing():
+    # lengths are in the units of the spacing, tortuosity does not change with the scale
+    crosPairgraph = get_disjoint_trees_no_cycle_3d()
+    stats = SegmentStats(crosPairgraph)
+    stats.setStats()
+    crosPairgraph.graph['spacing'] = (2, 2, 2)
+    scaledStats = SegmentStats(crosPairgraph)
+    scaledStats.setStats()
+    assert scaledStats.lengthDict.keys() == stats.lengthDict.keys()
+    for key, length in stats.lengthDict.items():
+        np.testing.assert_allclose(scaledStats.lengthDict[key], 2 * length)
+        np.testing.assert_allclose(scaledStats.tortuosityDict[key], stats.tortuosityDict[key])
+    # hausdorff dimension is in units of voxels, it does not depend on the spacing and is at least 1
+    assert scaledStats.hausdorffDimensionDict.keys() == stats.hausdorffDimensionDict.keys()
+    for key, dimension in stats.hausdorffDimensionDict.items():
+        np.testing.assert_allclose(scaledStats.hausdorffDimensionDict[key], dimension)
+        assert dimension >= 1, "hausdorff dimension must be at least 1, it is {}".format(dimension)
+    lineGraph = get_single_voxel_lineNobranches()
+    stats = SegmentStats(lineGraph, spacing=(5, 1, 1))
+    stats.setStats()
+    for key, length in stats.isolatedEdgeInfoDict.items():
+        np.testing.assert_allclose(length, np.linalg.norm(np.subtract(key[1], key[0]) * (5, 1, 1)))
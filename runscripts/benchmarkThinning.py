@@ -0,0 +1,60 @@
+import sys
+import time
+
+import numpy as np
+
+from runscripts.phantom import createVesselLoop
+import skeleton.deletion_rules as deletion_rules
+from skeleton.bitVolume import BitVolume
+from skeleton.thinVolume import ENGINES, get_thinned
+
+"""
+Time get_thinned with every thinning engine and every deletion rule on the vessel loop phantom
+python -m runscripts.benchmarkThinning [step]
+step subsamples the 512 cube phantom along every axis, 4 by default
+"""
+
+
+def benchmarkEngines(binaryArr, engines=ENGINES):
+    # return dict of engine: seconds taken to thin binaryArr, checks all engines give the same result
+    times = {}
+    expectedResult = None
+    for engine in engines:
+        # engines that read bit-packed words are timed from a BitVolume, the others from a numpy array
+        inputArr = BitVolume.fromArray(binaryArr) if engine == 'bitsliced' else binaryArr.copy()
+        startTime = time.time()
+        result = get_thinned(inputArr, engine=engine)
+        times[engine] = time.time() - startTime
+        result = result.toArray() if isinstance(result, BitVolume) else result
+        if expectedResult is None:
+            expectedResult = result
+        assert np.array_equal(result, expectedResult), "{} gives a different result".format(engine)
+    return times
+
+
+def benchmarkRules(binaryArr, engine='config', rules=deletion_rules.RULES):
+    # return dict of rule: seconds taken to thin binaryArr with engine, checks all rules give the same result
+    times = {}
+    expectedResult = None
+    for rule in rules:
+        startTime = time.time()
+        result = get_thinned(binaryArr.copy(), engine=engine, rule=rule)
+        times[rule] = time.time() - startTime
+        if expectedResult is None:
+            expectedResult = result
+        assert np.array_equal(result, expectedResult), "{} gives a different result".format(rule)
+    return times
+
+
+if __name__ == '__main__':
+    step = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    binaryArr = createVesselLoop()[::step, ::step, ::step] > 128
+    times = benchmarkEngines(binaryArr)
+    print("{} voxels, {} foreground".format(binaryArr.size, binaryArr.sum()))
+    for engine, seconds in sorted(times.items(), key=lambda item: item[1]):
+        print("{:>10} {:8.2f} s".format(engine, seconds))
+    # the rule is looked up once per border point and direction, its memory is what has to stay in the cache
+    sizes = {'table': deletion_rules.get_lookup_array().nbytes, 'diagram': deletion_rules.get_deletion_diagram().nbytes}
+    for engine in ['config', 'frontier']:
+        for rule, seconds in sorted(benchmarkRules(binaryArr, engine).items()):
+            print("{:>10} {:>8} {:8.2f} s {:>10} bytes".format(engine, rule, seconds, sizes[rule]))
@@ -3,14 +3,27 @@ from distutils.extension import Extension
 from Cython.Distutils import build_ext
 
 import skeleton.io_tools
+import skeleton.thinning_extension
+
+
+class build_ext_with_hash(build_ext):
+    # extensions built in place are saved with the hash of their source, the stale ones are not loaded
+    def run(self):
+        build_ext.run(self)
+        if self.inplace:
+            for extension in self.extensions:
+                skeleton.thinning_extension.write_source_hash(self.get_ext_fullpath(extension.name))
+
 
 path = skeleton.io_tools.module_relative_path('skeleton/thinning.pyx')
 ext_modules = [
     Extension('skeleton.thinning',
               [path],
+              extra_compile_args=['-fopenmp'],
+              extra_link_args=['-fopenmp'],
               )]
 setup(
     name='skeleton.thinning',
-    cmdclass={'build_ext': build_ext},
+    cmdclass={'build_ext': build_ext_with_hash},
     ext_modules=ext_modules
 )
@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+"""
+Resampling of binary volumes to a new grid one slab of z slices at a time, the input is
+interpolated with the same quadratic spline as ndimage.zoom(..., order=2, prefilter=False) but only a
+slab of the output and the input slices under it, with a halo, are in memory as floats at a time
+"""
+
+# input slices read on each side of the ones under a slab, the spline of order 2 reads one on each
+# side of a point, ndimage reads further near the edges of its input
+HALO = 4
+
+# interpolated value over which an output voxel is foreground, points half way between a foreground and a
+# background voxel interpolate to 0.5 give or take the rounding of their coordinate and are all background
+THRESHOLD = 0.5 + 1e-9
+
+
+def get_resampled_shape(shape, zoom):
+    # shape of the output of ndimage.zoom
+    return tuple(int(round(extent * factor)) for extent, factor in zip(shape, zoom))
+
+
+def _get_scale(shape, outputShape):
+    # input coordinate increment of one output voxel along each axis, corners of input and output are aligned
+    return np.array([(extent - 1) / (outputExtent - 1) if outputExtent > 1 else 1
+                     for extent, outputExtent in zip(shape, outputShape)])
+
+
+def _resample_slab(binaryArr, output, scale, start, stop):
+    # resample output slices start..stop - 1 from the input slices under them
+    firstInput = max(int(np.floor(start * scale[0])) - HALO, 0)
+    stopInput = min(int(np.ceil((stop - 1) * scale[0])) + HALO + 1, binaryArr.shape[0])
+    slab = np.asarray(binaryArr[firstInput:stopInput])
+    if stopInput == binaryArr.shape[0] and len(slab) > 1:
+        # the last output slice is on the last input slice, its coordinate in the slab can round past it
+        # and out of the input, the slice past it is mirrored as ndimage does inside the input
+        slab = np.concatenate([slab, slab[-2:-1]])
+    offset = np.zeros(binaryArr.ndim)
+    offset[0] = start * scale[0] - firstInput
+    interpolated = ndimage.affine_transform(slab, np.diag(scale), offset=offset,
+                                            output_shape=(stop - start,) + output.shape[1:],
+                                            output=np.float64, order=2, prefilter=False)
+    output[start:stop] = interpolated > THRESHOLD
+
+
+def resample_binary(binaryArr, zoom, output=None, slabSize=16, numThreads=1):
+    """
+    Return binary array resampled by zoom along each axis
+    Parameters
+    ----------
+    binaryArr : Numpy array
+        binary numpy array, can be memory-mapped, only the slices under a slab are read at a time
+
+    zoom : float or sequence
+        zoom factor along each axis, the output shape is the same as ndimage.zoom gives
+
+    output : Numpy array or str
+        boolean array of the output shape the result is written to, or path of a .npy file it is
+        memory-mapped to, a new array by default
+
+    slabSize : int
+        number of output z slices interpolated at a time
+
+    numThreads : int
+        number of slabs interpolated at once
+
+    Returns
+    -------
+    output : boolean Numpy array
+        True where the interpolated input is over THRESHOLD, ready to thin
+
+    Notes
+    -----
+    Peak memory is numThreads slabs of float64 output and their input slices on top of the output.
+    Unlike the boolean output of ndimage.zoom, which is True wherever the interpolated input is not exactly
+    0 and so grows the mask by a voxel around its surface, the interpolation is thresholded at 0.5.
+    ndimage.zoom also leaves the last slice of an axis empty when its coordinate rounds past the input, it is
+    always interpolated here
+    """
+    binaryArr = binaryArr if isinstance(binaryArr, np.ndarray) else np.asarray(binaryArr)
+    assert np.max(binaryArr) in [0, 1], "input must always be a binary array"
+    zoom = tuple(np.broadcast_to(zoom, (binaryArr.ndim,)))
+    outputShape = get_resampled_shape(binaryArr.shape, zoom)
+    if output is None:
+        output = np.zeros(outputShape, dtype=bool)
+    elif isinstance(output, str):
+        output = np.lib.format.open_memmap(output, mode='w+', dtype=bool, shape=outputShape)
+    assert output.shape == outputShape, "output must be of shape {}, it is {}".format(outputShape, output.shape)
+    scale = _get_scale(binaryArr.shape, outputShape)
+    slabs = [(start, min(start + slabSize, outputShape[0])) for start in range(0, outputShape[0], slabSize)]
+    if numThreads == 1:
+        for start, stop in slabs:
+            _resample_slab(binaryArr, output, scale, start, stop)
+    else:
+        with ThreadPoolExecutor(max_workers=numThreads) as executor:
+            # slabs write to slices of output that do not overlap
+            for future in [executor.submit(_resample_slab, binaryArr, output, scale, start, stop)
+                           for start, stop in slabs]:
+                future.result()
+    if isinstance(output, np.memmap):
+        output.flush()
+    return output
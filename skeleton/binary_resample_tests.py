@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import nose.tools
+import numpy as np
+from scipy import ndimage
+
+from skeleton.binary_resample import THRESHOLD, get_resampled_shape, resample_binary
+
+
+def _get_blobs(shape, seed=0):
+    # binary volume of random blobs
+    seeds = np.random.RandomState(seed).rand(*shape) > 0.97
+    return ndimage.binary_dilation(seeds, iterations=2)
+
+
+def _get_zoomed(binaryArr, zoom):
+    # the whole volume interpolated at once with ndimage.zoom and thresholded
+    return ndimage.zoom(binaryArr.astype(np.float64), zoom, order=2, prefilter=False) > THRESHOLD
+
+
+def _save(directory, binaryArr):
+    # path of binaryArr saved to directory
+    path = os.path.join(directory, "input.npy")
+    np.save(path, binaryArr)
+    return path
+
+
+def test_same_as_zoom():
+    for shape, zoom in [((40, 30, 20), (2.5, 1, 1)), ((23, 17, 19), (3.1, 0.7, 1.3)), ((50, 20, 20), 0.6)]:
+        binaryArr = _get_blobs(shape)
+        expected = _get_zoomed(binaryArr, zoom)
+        for slabSize in [1, 3, 16, 1000]:
+            for numThreads in [1, 3]:
+                yield (np.testing.assert_array_equal,
+                       resample_binary(binaryArr, zoom, slabSize=slabSize, numThreads=numThreads), expected)
+
+
+def test_memory_mapped_output():
+    binaryArr = _get_blobs((30, 20, 20), seed=1)
+    zoom = (2, 1, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "resampled.npy")
+        resampled = resample_binary(np.load(_save(directory, binaryArr), mmap_mode='r'), zoom, output=path, slabSize=4)
+        nose.tools.assert_equal(resampled.shape, get_resampled_shape(binaryArr.shape, zoom))
+        np.testing.assert_array_equal(np.load(path), _get_zoomed(binaryArr, zoom))
+        del resampled
+
+
+def test_preallocated_output():
+    binaryArr = _get_blobs((20, 20, 20), seed=2)
+    output = np.ones((50, 20, 20), dtype=bool)
+    nose.tools.assert_is(resample_binary(binaryArr, (2.5, 1, 1), output=output), output)
+    np.testing.assert_array_equal(output, _get_zoomed(binaryArr, (2.5, 1, 1)))
+    nose.tools.assert_raises(AssertionError, resample_binary, binaryArr, 2, output=output)
@@ -0,0 +1,104 @@
+import numpy as np
+
+from skeleton.generate_lookup_array import REVERSED_BITS
+
+"""
+Binary 3D volume packed 64 voxels per word along the last (fastest) axis, voxel (z, x, y) is
+bit y % 64 of word (z, x, y // 64). Bits past the last voxel of a row are always 0
+"""
+
+WORD_BITS = 64
+
+# number of 1 bits of every byte
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def count_bits(words, chunkSize=2 ** 20):
+    # number of 1 bits of words, chunkSize bytes at a time so no more than a chunk of counts is in memory
+    wordBytes = np.ascontiguousarray(words).view(np.uint8).ravel()
+    return sum(int(POPCOUNT[wordBytes[start:start + chunkSize]].sum(dtype=np.int64))
+               for start in range(0, wordBytes.size, chunkSize))
+
+
+class BitVolume:
+    def __init__(self, words, shape):
+        # words : np.uint64 array of shape (shape[0], shape[1], number of words per row)
+        # shape : (z, x, y) shape of the binary volume
+        assert len(shape) == 3, "BitVolume is 3D, shape is {}".format(shape)
+        assert words.shape == (shape[0], shape[1], -(-shape[2] // WORD_BITS)), \
+            "words of shape {} can not hold a volume of shape {}".format(words.shape, shape)
+        self.words = np.ascontiguousarray(words, dtype=np.uint64)
+        self.shape = tuple(shape)
+
+    @classmethod
+    def fromArray(cls, binaryArr):
+        # pack a 3D binary array, one z slice at a time so only the words and a slice are in memory
+        binaryArr = np.asarray(binaryArr)
+        shape = binaryArr.shape
+        words = np.zeros((shape[0], shape[1], -(-shape[2] // WORD_BITS)), dtype='<u8')
+        wordBytes = words.view(np.uint8)
+        for z in range(shape[0]):
+            packed = np.packbits(binaryArr[z] != 0, axis=-1)
+            wordBytes[z, :, :packed.shape[1]] = REVERSED_BITS[packed]
+        return cls(words.astype(np.uint64, copy=False), shape)
+
+    def toArray(self):
+        # unpack into a 3D boolean array
+        result = np.empty(self.shape, dtype=bool)
+        wordBytes = self.words.astype('<u8', copy=False).view(np.uint8)
+        for z in range(self.shape[0]):
+            result[z] = np.unpackbits(REVERSED_BITS[wordBytes[z]], axis=-1)[:, :self.shape[2]]
+        return result
+
+    def copy(self):
+        return BitVolume(self.words.copy(), self.shape)
+
+    def countNonzero(self):
+        # number of voxels that are 1
+        return count_bits(self.words)
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1] * self.shape[2]
+
+    def _getLastBits(self):
+        # word index and mask of the last voxel of every row
+        return (self.shape[2] - 1) // WORD_BITS, np.uint64(1 << ((self.shape[2] - 1) % WORD_BITS))
+
+    def getBorder(self, mode='reflect', cval=0):
+        """
+        Return BitVolume of the border points, voxels that are 1 and have at least one
+        voxel that is 0 in their 6 neighborhood, same as thinning.get_border_coords
+        mode is 'reflect' (repeat the edge voxels) or 'constant' (pad with cval)
+        """
+        assert mode in ['reflect', 'constant'], "mode must be either 'constant' or 'reflect', it is {}".format(mode)
+        words = self.words
+        one = np.uint64(1)
+        if mode == 'reflect':
+            padded = np.pad(words, ((1, 1), (1, 1), (0, 0)), mode='edge')
+            first = words[:, :, :1] & one
+            lastWord, lastMask = self._getLastBits()
+            last = (words[:, :, lastWord] & lastMask) != 0
+        else:
+            fill = np.uint64(0xFFFFFFFFFFFFFFFF if cval else 0)
+            padded = np.empty((words.shape[0] + 2, words.shape[1] + 2, words.shape[2]), dtype=np.uint64)
+            padded[...] = fill
+            padded[1:-1, 1:-1] = words
+            first = np.full(words.shape[:2] + (1,), cval, dtype=np.uint64)
+            lastWord, lastMask = self._getLastBits()
+            last = np.full(words.shape[:2], bool(cval), dtype=bool)
+        interior = words.copy()
+        interior &= padded[:-2, 1:-1]
+        interior &= padded[2:, 1:-1]
+        interior &= padded[1:-1, :-2]
+        interior &= padded[1:-1, 2:]
+        # neighbor at y - 1, bit 63 of the previous word carries into bit 0
+        previous = np.concatenate([first, words[:, :, :-1] >> np.uint64(WORD_BITS - 1)], axis=2)
+        interior &= (words << one) | previous
+        # neighbor at y + 1, bit 0 of the next word carries into bit 63, the last voxel of a row gets the padding
+        following = np.concatenate([words[:, :, 1:] << np.uint64(WORD_BITS - 1),
+                                    np.zeros(words.shape[:2] + (1,), dtype=np.uint64)], axis=2)
+        nextWords = (words >> one) | following
+        nextWords[:, :, lastWord] |= np.where(last, lastMask, np.uint64(0))
+        interior &= nextWords
+        return BitVolume(words & ~interior, self.shape)
@@ -0,0 +1,42 @@
+import numpy as np
+import scipy.ndimage as ndimage
+
+import pyximport; pyximport.install() # NOQA
+import skeleton.thinning as thinning
+import skeleton.thinVolume as thin_volume
+from skeleton.bitVolume import BitVolume, count_bits
+
+
+def get_rand_volumes():
+    # rows shorter than, as long as and longer than a word
+    return [np.random.randint(2, size=(5, 6, length), dtype=bool) for length in [1, 17, 63, 64, 65, 130]]
+
+
+def test_round_trip():
+    for arr in get_rand_volumes():
+        packed = BitVolume.fromArray(arr)
+        np.testing.assert_array_equal(packed.toArray(), arr)
+        assert packed.countNonzero() == arr.sum()
+        assert packed.words.nbytes * 8 < arr.nbytes + 64 * arr.shape[0] * arr.shape[1]
+        # chunks smaller than a word count the same bits
+        assert count_bits(packed.words, chunkSize=3) == arr.sum()
+
+
+def test_border():
+    for arr in get_rand_volumes():
+        points = np.ascontiguousarray(np.transpose(np.nonzero(arr)))
+        for mode, cval in [('reflect', 0), ('constant', 0), ('constant', 1)]:
+            expected_result = np.zeros(arr.shape, dtype=bool)
+            border = thinning.get_border_coords(arr.astype(np.uint64), points, mode, cval)
+            expected_result[tuple(border.T)] = True
+            np.testing.assert_array_equal(BitVolume.fromArray(arr).getBorder(mode, cval).toArray(), expected_result,
+                                          err_msg="{} {} {}".format(arr.shape, mode, cval))
+
+
+def test_get_thinned():
+    blob = ndimage.gaussian_filter(np.random.uniform(size=(20, 23, 70)), 2) > 0.5
+    for mode in ['reflect', 'constant']:
+        packed = BitVolume.fromArray(blob)
+        result = thin_volume.get_thinned(packed, mode=mode)
+        np.testing.assert_array_equal(result.toArray(), thin_volume.get_thinned(blob, mode=mode))
+        np.testing.assert_array_equal(packed.toArray(), blob)
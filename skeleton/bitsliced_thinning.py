@@ -0,0 +1,182 @@
+import time
+
+import numpy as np
+from scipy import ndimage
+
+import skeleton.rotational_operators as rotational_operators
+from skeleton.bitVolume import BitVolume, WORD_BITS, count_bits
+from skeleton.generate_lookup_array import get_deletion_function
+
+"""
+Bitsliced thinning, the templates of generate_lookup_array.Templates are evaluated as bitwise
+expressions over bit-packed words so every operation decides on 64 voxels of a row at once,
+without the lookup array
+
+The volume is kept padded by one voxel on each side as words of rows of shape[2] + 2 bits,
+voxel y of a row is bit y + 1 so the neighbors along a row are plain shifts of the words
+"""
+
+ONE = np.uint64(1)
+LAST_BIT = np.uint64(WORD_BITS - 1)
+
+
+def _get_letter_positions():
+    # for each direction, (z, x, y) increments of the neighbors that are the letters a..z of the templates,
+    # letter i is bit i of the configuration number the direction kernel gives
+    letterPositions = []
+    for kernel in rotational_operators.DIRECTIONS_LIST:
+        bits = [int(weight).bit_length() - 1 for weight in kernel.ravel()]
+        letterPositions.append([rotational_operators.POSITION_VECTORS[bits.index(letter)] for letter in range(26)])
+    return letterPositions
+
+
+LETTER_POSITIONS = _get_letter_positions()
+
+
+def _shift_rows(words, shift):
+    # words of the rows with every bit moved to the next (shift=1) or previous (shift=-1) voxel
+    # bits carry between neighboring words, the ones carried from one row to the next land on the
+    # first bit or past the last padding bit, which are never read as neighbors of a voxel
+    flat = np.ascontiguousarray(words).reshape(-1)
+    if shift == 1:
+        shifted = flat << ONE
+        shifted[1:] |= flat[:-1] >> LAST_BIT
+    else:
+        shifted = flat >> ONE
+        shifted[:-1] |= flat[1:] << LAST_BIT
+    return shifted.reshape(words.shape)
+
+
+def _get_row_mask(numWords, start, stop):
+    # words of a row with bits start..stop - 1 set
+    bits = np.zeros(numWords * WORD_BITS, dtype=bool)
+    bits[start:stop] = True
+    return BitVolume.fromArray(bits.reshape(1, 1, -1)).words[0, 0]
+
+
+class _PaddedWords:
+    def __init__(self, bitVolume, mode, cval):
+        self.shape = bitVolume.shape
+        self.reflect = mode == 'reflect'
+        numWords = -(-(self.shape[2] + 2) // WORD_BITS)
+        self.interiorMask = _get_row_mask(numWords, 1, self.shape[2] + 1)
+        self.firstMask = _get_row_mask(numWords, 0, 1)
+        self.lastMask = _get_row_mask(numWords, self.shape[2] + 1, self.shape[2] + 2)
+        fill = _get_row_mask(numWords, 0, self.shape[2] + 2) if cval and not self.reflect else 0
+        self.words = np.empty((self.shape[0] + 2, self.shape[1] + 2, numWords), dtype=np.uint64)
+        self.words[...] = fill
+        words = np.concatenate([bitVolume.words, np.zeros(self.shape[:2] + (numWords - bitVolume.words.shape[2],),
+                                                          dtype=np.uint64)], axis=-1)
+        self.interior[...] = _shift_rows(words, 1) | (self.interior & ~self.interiorMask)
+        self.updatePadding()
+
+    @property
+    def interior(self):
+        return self.words[1:-1, 1:-1]
+
+    def updatePadding(self):
+        # repeat the edge voxels in the padding of a 'reflect' volume, the padding of a 'constant' volume is fixed
+        if not self.reflect:
+            return
+        interior = self.interior
+        firstBit = _shift_rows(interior, -1) & self.firstMask
+        lastBit = _shift_rows(interior, 1) & self.lastMask
+        interior &= self.interiorMask
+        interior |= firstBit | lastBit
+        self.words[0] = self.words[1]
+        self.words[-1] = self.words[-2]
+        self.words[:, 0] = self.words[:, 1]
+        self.words[:, -1] = self.words[:, -2]
+
+    def getNeighbors(self, rows):
+        # function returning the words of the neighbor at (z, x, y) increments of the voxels in the
+        # interior rows (z indices, x indices), only the rows around them are read
+        zs, xs = rows
+        shiftedRows = {}
+
+        def neighbor(position):
+            if position[:2] not in shiftedRows:
+                words = self.words[zs + 1 + position[0], xs + 1 + position[1]]
+                shiftedRows[position[:2]] = {-1: _shift_rows(words, 1), 0: words, 1: _shift_rows(words, -1)}
+            return shiftedRows[position[:2]][position[2]]
+        return neighbor
+
+    def getBorder(self):
+        # interior foreground voxels with a background voxel in their 6 neighborhood
+        interior = self.interior.copy()
+        interior &= self.words[:-2, 1:-1]
+        interior &= self.words[2:, 1:-1]
+        interior &= self.words[1:-1, :-2]
+        interior &= self.words[1:-1, 2:]
+        interior &= _shift_rows(self.interior, 1)
+        interior &= _shift_rows(self.interior, -1)
+        return self.interior & ~interior & self.interiorMask
+
+    def toBitVolume(self):
+        words = _shift_rows(self.interior & self.interiorMask, -1)
+        return BitVolume(words[..., :-(-self.shape[2] // WORD_BITS)].copy(), self.shape)
+
+
+def _get_deletable(neighbor, direction):
+    # words of the voxels the templates of direction delete, none of them deletes a voxel with a single neighbor
+    letters = [neighbor(position) for position in LETTER_POSITIONS[direction]]
+    return get_deletion_function(letters, np.zeros_like(letters[0]))
+
+
+def get_thinned_bitsliced(bitVolume, mode='reflect', cval=0):
+    """
+    Return thinned output of the bitsliced engine
+    Parameters
+    ----------
+    bitVolume : bitVolume.BitVolume
+        3D bit-packed binary volume
+
+    mode : string
+        boundary mode, can be either 'constant' or 'reflect'
+
+    cval : int
+        value to pad with if mode is 'constant'
+
+    Returns
+    -------
+    result : bitVolume.BitVolume
+        thinned volume, same as thinning.cy_get_thinned_3d gives
+
+    Notes
+    -----
+    Border points are found at the start of every iteration, in every subiteration the border
+    points that are still foreground are evaluated before any of them is deleted. A row is only
+    evaluated if voxels were deleted around it in this or the last iteration, otherwise its
+    neighborhood is the same as in the same subiteration of the last iteration, when none of its
+    voxels were deleted
+    """
+    assert mode in ['reflect', 'constant'], "mode must be either 'constant' or 'reflect', it is {}".format(mode)
+    assert mode == 'reflect' or cval in [0, 1], "cval must be 0 or 1, it is {}".format(cval)
+    padded = _PaddedWords(bitVolume, mode, cval)
+    numVoxelsRemoved = 1
+    iterCount = 0
+    changedRows = np.ones(bitVolume.shape[:2], dtype=bool)
+    while numVoxelsRemoved > 0:
+        iterTime = time.time()
+        numVoxelsRemoved = 0
+        border = padded.getBorder()
+        borderRows = border.any(axis=-1)
+        previousChangedRows = changedRows
+        changedRows = np.zeros(bitVolume.shape[:2], dtype=bool)
+        for direction in range(12):
+            activeRows = ndimage.binary_dilation(previousChangedRows | changedRows, np.ones((3, 3), dtype=bool))
+            # templates are only evaluated on the active rows that have border points left
+            rows = np.nonzero(borderRows & activeRows)
+            candidates = border[rows] & padded.interior[rows]
+            hasCandidates = candidates.any(axis=-1)
+            if not hasCandidates.any():
+                continue
+            rows = tuple(indices[hasCandidates] for indices in rows)
+            deleted = candidates[hasCandidates] & _get_deletable(padded.getNeighbors(rows), direction)
+            padded.interior[rows] &= ~deleted
+            changedRows[rows] |= deleted.any(axis=-1)
+            padded.updatePadding()
+            numVoxelsRemoved += count_bits(deleted)
+        iterCount += 1
+        print("Finished iteration %i, %0.2f s, removed %i pixels" % (iterCount, time.time() - iterTime, numVoxelsRemoved))
+    return padded.toBitVolume()
@@ -0,0 +1,24 @@
+import numpy as np
+import scipy.ndimage as ndimage
+
+import skeleton.thinVolume as thin_volume
+from skeleton.bitVolume import BitVolume
+from skeleton.bitsliced_thinning import get_thinned_bitsliced
+
+
+def get_blobs():
+    # rows whose padded length is just under, at and over a word boundary
+    return [ndimage.gaussian_filter(np.random.uniform(size=(12, 14, length)), 2) > 0.5 for length in [5, 62, 63, 64, 100]]
+
+
+def test_same_as_table():
+    for blob in get_blobs():
+        for mode, cval in [('reflect', 0), ('constant', 0), ('constant', 1)]:
+            expected_result = thin_volume.get_thinned(blob.copy(), mode=mode, cval=cval, engine='convolve')
+            result = get_thinned_bitsliced(BitVolume.fromArray(blob), mode, cval).toArray()
+            np.testing.assert_array_equal(result, expected_result, err_msg="{} {} {}".format(blob.shape, mode, cval))
+
+
+def test_get_thinned_engine():
+    blob = get_blobs()[-1]
+    np.testing.assert_array_equal(thin_volume.get_thinned(blob, engine='bitsliced'), thin_volume.get_thinned(blob))
@@ -0,0 +1,31 @@
+import numpy as np
+
+import skeleton.decision_diagram as decision_diagram
+import skeleton.rotational_operators as rotational_operators
+
+
+def _walk(nodes, configs):
+    # walk the array of nodes from the root as thinning does
+    current = np.full(configs.shape, 2, dtype=np.int64)
+    while (current > 1).any():
+        internal = current > 1
+        current[internal] = nodes[current[internal], 1 + ((configs[internal] >> nodes[current[internal], 0]) & 1)]
+    return current.astype(bool)
+
+
+def test_deletion_diagram():
+    with np.load(rotational_operators.LOOKUP_ARRAY_PATH) as lua:
+        lookup_array = lua["lua"]
+    configs = np.concatenate([np.arange(2 ** 16), np.random.randint(2 ** 26, size=2 ** 18)])
+    for order in [decision_diagram.TEST_ORDER, tuple(range(26))]:
+        diagram, root = decision_diagram.get_deletion_diagram(order)
+        np.testing.assert_array_equal(diagram.evaluate(root, configs), lookup_array[configs])
+        nodes = diagram.toArray(root)
+        assert len(nodes) < 1000, "decision diagram should fit in the cache, it has {} nodes".format(len(nodes))
+        np.testing.assert_array_equal(_walk(nodes, configs), lookup_array[configs])
+
+
+def test_constant_functions():
+    diagram = decision_diagram.DecisionDiagram()
+    for value in [decision_diagram.FALSE, decision_diagram.TRUE]:
+        np.testing.assert_array_equal(_walk(diagram.toArray(value), np.arange(8)), bool(value))
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+
+import skeleton.decision_diagram as decision_diagram
+import skeleton.generate_lookup_array as generate_lookup_array
+import skeleton.rotational_operators as rotational_operators
+
+"""
+Deletion rules of the thinning engines, the bit-packed lookup array and the decision diagram of the
+templates. Plain python so the engines that do not need the compiled thinning extension can use them
+"""
+
+# 'table' looks the configuration numbers up in the lookup array, 'diagram' walks the decision diagram
+RULES = ('table', 'diagram')
+
+# bit-packed lookup array, memory-mapped by get_lookup_array on first use
+_PACKED_LOOKUP_ARRAY = None
+# decision diagram of the deletion rule, built by get_deletion_diagram on first use
+_DELETION_DIAGRAM = None
+
+
+def _get_packed_lookup_array():
+    # lookuparray.npz packed 8 configuration numbers per byte
+    with np.load(rotational_operators.LOOKUP_ARRAY_PATH) as lua:
+        return np.packbits(lua["lua"])
+
+
+def get_lookup_array():
+    """
+    Return the lookup array bit-packed, the voxel of configuration number c is deleted if bit 7 - c % 8
+    of byte c // 8 is set. The packed array (8 MB) is saved uncompressed next to lookuparray.npz the first
+    time it is needed and memory-mapped read only, so all the processes thinning at once share its pages.
+    lookuparray.npz is regenerated first if the templates changed since it was saved
+    """
+    global _PACKED_LOOKUP_ARRAY
+    if _PACKED_LOOKUP_ARRAY is None:
+        path = rotational_operators.PACKED_LOOKUP_ARRAY_PATH
+        try:
+            generate_lookup_array.update_lookup_array()
+        except OSError:
+            # read only installation, uses the lookup array it was installed with
+            pass
+        if (not os.path.exists(path) or
+                os.path.getmtime(path) < os.path.getmtime(rotational_operators.LOOKUP_ARRAY_PATH)):
+            packed = _get_packed_lookup_array()
+            try:
+                generate_lookup_array.write_atomically(path, lambda f: np.save(f, packed))
+            except OSError:
+                # read only installation, every process keeps its own copy
+                _PACKED_LOOKUP_ARRAY = packed
+                return packed
+        _PACKED_LOOKUP_ARRAY = np.load(path, mmap_mode='r')
+    return _PACKED_LOOKUP_ARRAY
+
+
+def get_deletion_diagram():
+    """
+    Return np.int32 array of (bit, low child, high child) of the nodes of the decision diagram of the
+    deletion rule, nodes 0 and 1 are the terminals (keep and delete) and node 2 is the root.
+    It is built from the templates, a couple of kilobytes against the 8 MB of the packed lookup array
+    """
+    global _DELETION_DIAGRAM
+    if _DELETION_DIAGRAM is None:
+        diagram, root = decision_diagram.get_deletion_diagram()
+        _DELETION_DIAGRAM = diagram.toArray(root)
+    return _DELETION_DIAGRAM
+
+
+def lookup(configs):
+    """
+    Return np.bool array, True where voxels of configuration numbers configs of the first direction are deleted
+    """
+    configs = np.asarray(configs, dtype=np.int64)
+    return ((get_lookup_array()[configs >> 3] >> (7 - (configs & 7))) & 1).astype(bool)
+
+
+def is_deletable(configs, rule='table'):
+    """
+    Return np.bool array, True where voxels of configuration numbers configs of the first direction
+    are deleted, decided by rule, one of RULES
+    """
+    assert rule in RULES, "rule must be one of {}, it is {}".format(RULES, rule)
+    if rule == 'table':
+        return lookup(configs)
+    configs = np.asarray(configs, dtype=np.int64)
+    diagram = get_deletion_diagram().astype(np.int64)
+    # every configuration number walks down from the root until it reaches a terminal
+    nodes = np.full(configs.shape, 2, dtype=np.int64)
+    internal = np.ones(configs.shape, dtype=bool)
+    while internal.any():
+        current = nodes[internal]
+        bits = (configs[internal] >> diagram[current, 0]) & 1
+        nodes[internal] = diagram[current, 1 + bits]
+        internal = nodes > 1
+    return nodes.astype(bool)
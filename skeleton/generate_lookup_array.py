@@ -1,8 +1,12 @@
 import functools
+import hashlib
+import inspect
+import os
+import tempfile
 
 import numpy as np
 
-from skeleton.rotational_operators import get_directions_list
+from skeleton.rotational_operators import get_directions_list, DIRECTIONS_LIST, LOOKUP_ARRAY_PATH
 
 """
 Following is an application of memoization - pre-generating a look up array.
@@ -17,87 +21,89 @@ Volume 61, Issue 4, July 1999, Pages 199-221 Attila Kuba, 1999
 
 
 class Templates:
+    # templates are bitwise expressions, the letters can be 0 or 1 or numpy arrays of bits or
+    # bit-packed words, every template has a letter that is not negated so on 0 and 1 the result is 0 or 1
     def __init__(self, *args):
         (self.a, self.b, self.c, self.d, self.e, self.f, self.g, self.h, self.i, self.j, self.k, self.l, self.m, self.n,
          self.o, self.p, self.q, self.r, self.s, self.t, self.u, self.v, self.w, self.x, self.y, self.z) = [arg for arg
                                                                                                             in args]
 
     def first_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.j) & (not self.k) & (not self.l) &
-                  (not self.r) & (not self.s) & (not self.t) & self.p &
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.j) & (~self.k) & (~self.l) &
+                  (~self.r) & (~self.s) & (~self.t) & self.p &
                   (self.d | self.e | self.f | self.m | self.n | self.u | self.v | self.w | self.g | self.h | self.i |
                    self.o | self.q | self.x | self.y | self.z))
         return result
 
     def second_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.d) & (not self.e) & (not self.f) &
-                  (not self.g) & (not self.h) & (not self.i) & self.v &
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.d) & (~self.e) & (~self.f) &
+                  (~self.g) & (~self.h) & (~self.i) & self.v &
                   (self.r | self.s | self.t | self.j | self.k | self.l | self.m | self.n | self.u | self.w |
                    self.o | self.p | self.q | self.x | self.y | self.z))
         return result
 
     def third_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.j) & (not self.k) & (not self.l) &
-                  (not self.r) & (not self.s) & (not self.t) & (not self.d) &
-                  (not self.e) & (not self.f) & (not self.g) & (not self.h) & (not self.i) & self.y & (self.m | self.n |
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.j) & (~self.k) & (~self.l) &
+                  (~self.r) & (~self.s) & (~self.t) & (~self.d) &
+                  (~self.e) & (~self.f) & (~self.g) & (~self.h) & (~self.i) & self.y & (self.m | self.n |
                   self.u | self.w | self.o | self.q | self.x | self.z))
         return result
 
     def fourth_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.k) & (not self.e) & (not (self.d & self.j)) &
-                  (not (self.l & self.f)) & self.p & self.v)
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.k) & (~self.e) & (~(self.d & self.j)) &
+                  (~(self.l & self.f)) & self.p & self.v)
         return result
 
     def fifth_template(self):
-        result = ((not self.a) & (not self.b) & (not self.k) & (not self.e) & self.c & self.v &
-                  self.p & (not (self.j & self.d)) & (self.l ^ self.f))
+        result = ((~self.a) & (~self.b) & (~self.k) & (~self.e) & self.c & self.v &
+                  self.p & (~(self.j & self.d)) & (self.l ^ self.f))
         return result
 
     def sixth_template(self):
-        result = (self.a & self.v & self.p & (not self.b) & (not self.c) & (not self.k) & (not self.e) &
-                  (not (self.l & self.f)) & (self.j ^ self.d))
+        result = (self.a & self.v & self.p & (~self.b) & (~self.c) & (~self.k) & (~self.e) &
+                  (~(self.l & self.f)) & (self.j ^ self.d))
         return result
 
     def seventh_template(self):
-        result = ((not self.a) & (not self.b) & (not self.k) & (not self.e) & self.n & self.v & self.p &
-                  (not (self.j & self.d)))
+        result = ((~self.a) & (~self.b) & (~self.k) & (~self.e) & self.n & self.v & self.p &
+                  (~(self.j & self.d)))
         return result
 
     def eighth_template(self):
-        result = ((not self.b) & (not self.c) & (not self.k) & (not self.e) & self.m & self.v & self.p &
-                  (not (self.l & self.f)))
+        result = ((~self.b) & (~self.c) & (~self.k) & (~self.e) & self.m & self.v & self.p &
+                  (~(self.l & self.f)))
         return result
 
     def ninth_template(self):
-        result = ((not self.b) & (not self.k) & (not self.e) & self.a & self.n & self.v & self.p & (self.j ^ self.d))
+        result = ((~self.b) & (~self.k) & (~self.e) & self.a & self.n & self.v & self.p & (self.j ^ self.d))
         return result
 
     def tenth_template(self):
-        result = ((not self.b) & (not self.k) & (not self.e) & self.c & self.m & self.v & self.p & (self.l ^ self.f))
+        result = ((~self.b) & (~self.k) & (~self.e) & self.c & self.m & self.v & self.p & (self.l ^ self.f))
         return result
 
     def eleventh_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.j) & (not self.k) & (not self.l) &
-                  (not self.r) & (not self.s) & (not self.t) & (not self.d) &
-                  (not self.e) & (not self.g) & (not self.h) & self.q & self.y)
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.j) & (~self.k) & (~self.l) &
+                  (~self.r) & (~self.s) & (~self.t) & (~self.d) &
+                  (~self.e) & (~self.g) & (~self.h) & self.q & self.y)
         return result
 
     def twelveth_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.j) & (not self.k) & (not self.l) &
-                  (not self.r) & (not self.s) & (not self.t) & (not self.e) &
-                  (not self.f) & (not self.h) & (not self.i) & self.o & self.y)
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.j) & (~self.k) & (~self.l) &
+                  (~self.r) & (~self.s) & (~self.t) & (~self.e) &
+                  (~self.f) & (~self.h) & (~self.i) & self.o & self.y)
         return result
 
     def thirteenth_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.j) & (not self.k) & (not self.r) &
-                  (not self.s) & (not self.d) & (not self.e) & (not self.f) &
-                  (not self.g) & (not self.h) & (not self.i) & self.w & self.y)
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.j) & (~self.k) & (~self.r) &
+                  (~self.s) & (~self.d) & (~self.e) & (~self.f) &
+                  (~self.g) & (~self.h) & (~self.i) & self.w & self.y)
         return result
 
     def fourteenth_template(self):
-        result = ((not self.a) & (not self.b) & (not self.c) & (not self.d) & (not self.e) & (not self.f) &
-                  (not self.g) & (not self.h) & (not self.i) &
-                  (not self.k) & (not self.l) & (not self.s) & (not self.t) & self.u & self.y)
+        result = ((~self.a) & (~self.b) & (~self.c) & (~self.d) & (~self.e) & (~self.f) &
+                  (~self.g) & (~self.h) & (~self.i) &
+                  (~self.k) & (~self.l) & (~self.s) & (~self.t) & self.u & self.y)
         return result
 
 
@@ -186,8 +192,139 @@ def generate_lookup_array(stop=2**26, direction=0):
     return lookup_array
 
 
+TEMPLATE_NAMES = ['first_template', 'second_template', 'third_template', 'fourth_template', 'fifth_template',
+                  'sixth_template', 'seventh_template', 'eighth_template', 'ninth_template', 'tenth_template',
+                  'eleventh_template', 'twelveth_template', 'thirteenth_template', 'fourteenth_template']
+
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# bits of every byte in reverse order, np.packbits puts the first bit in the most significant bit and words of
+# configuration numbers or voxels hold it in the least significant bit
+REVERSED_BITS = np.array([int('{:08b}'.format(value)[::-1], 2) for value in range(256)], dtype=np.uint8)
+
+
+def _get_letter_bits(direction):
+    # bit of the configuration number of the first direction kernel each of the template letters a..z is in direction,
+    # letter i is the neighbor the direction kernel gives the weight 2 ** i
+    first_bits = [int(weight).bit_length() - 1 for weight in DIRECTIONS_LIST[0].ravel()]
+    direction_bits = [int(weight).bit_length() - 1 for weight in DIRECTIONS_LIST[direction].ravel()]
+    return [first_bits[direction_bits.index(letter)] for letter in range(26)]
+
+
+def _get_bit_words(bit, start, stop):
+    # words of bit of the configuration numbers 64 * start to 64 * stop - 1, bit k of word w is configuration 64 * w + k
+    if bit < 6:
+        pattern = sum(1 << k for k in range(64) if (k >> bit) & 1)
+        return np.full(stop - start, pattern, dtype=np.uint64)
+    return ((np.arange(start, stop, dtype=np.uint64) >> np.uint64(bit - 6)) & np.uint64(1)) * ALL_ONES
+
+
+def get_deletion_function(letters, zero):
+    """
+    Returns the templates or-ed together on the letters a..z, the deletion rule every thinning engine evaluates,
+    a voxel with a single nonzero neighbor is never deleted
+    letters are any values with the operators &, | and ~ (words of configuration numbers or voxels, functions of
+    a decision diagram) and zero is the value of none of them
+    """
+    template = Templates(*letters)
+    deletion = functools.reduce(lambda x, y: x | y, [getattr(template, name)() for name in TEMPLATE_NAMES])
+    at_least_one = zero
+    at_least_two = zero
+    for letter in letters:
+        at_least_two = at_least_two | (at_least_one & letter)
+        at_least_one = at_least_one | letter
+    return deletion & ~(at_least_one & ~at_least_two)
+
+
+def generate_lookup_array_vectorized(stop=2**26, direction=0, block_size=2**16):
+    """
+    Returns lookuparray of a direction indexed by configuration numbers of the first direction kernel
+
+    Parameters
+    ----------
+    stop : int
+    integer describing the length of array
+
+    direction : int
+       describing nth rotation of cube to remove boundary voxels in a different direction
+
+    block_size : int
+       number of 64 bit words, each holding 64 configuration numbers, evaluated at once
+
+    Returns
+    -------
+    lookup_array : array
+        value at an index of the array = 0 => should not be deleted
+        value at an index of the array = 1 => should be deleted
+
+    Notes
+    ------
+    The templates are evaluated as bitwise expressions on words of 64 consecutive configuration
+    numbers, a table of 2 ** 26 configuration numbers takes a fraction of a second.
+    Thinning reads the neighborhood once and looks up the table of the first direction (lookuparray.npz)
+    at the configuration number of each direction kernel, the table of a direction here gives the same
+    flag at the configuration number of the first direction kernel.
+    generate_lookup_array rotates the neighborhood with the flipped convolution kernels instead, so its
+    table of the first direction is lookuparray.npz with the bits of the configuration numbers reversed
+    """
+    letter_bits = _get_letter_bits(direction)
+    num_words = -(-stop // 64)
+    lookup_array = np.empty(num_words * 64, dtype=bool)
+    for start in range(0, num_words, block_size):
+        block_stop = min(start + block_size, num_words)
+        letters = [_get_bit_words(bit, start, block_stop) for bit in letter_bits]
+        deletion_bytes = get_deletion_function(letters, np.zeros_like(letters[0])).astype('<u8', copy=False).view(np.uint8)
+        lookup_array[64 * start:64 * block_stop] = np.unpackbits(REVERSED_BITS[deletion_bytes])
+    return lookup_array[:stop]
+
+
+def get_templates_hash():
+    """
+    Returns hex digest of the source of the templates and the deletion rule built from them, shared by all
+    the thinning engines, saved with the lookup array to find out if the templates changed since it was generated
+    """
+    source = inspect.getsource(Templates) + inspect.getsource(get_deletion_function) + repr(TEMPLATE_NAMES)
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def write_atomically(path, write):
+    """
+    Calls write with an open binary file and moves the file to path once it is complete,
+    processes reading path at the same time never see a partly written file
+    """
+    fd, temporary_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1], dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def save_lookup_array(lookup_array, path=LOOKUP_ARRAY_PATH):
+    """
+    Saves lookup_array in the compressed format thinning loads, with the hash of the templates
+    """
+    write_atomically(path, lambda f: np.savez_compressed(f, lua=lookup_array, templates_hash=get_templates_hash()))
+
+
+def update_lookup_array(path=LOOKUP_ARRAY_PATH):
+    """
+    Regenerates and saves the lookup array of the first direction if the templates changed since it was saved
+    Returns True if it was regenerated
+    """
+    if os.path.exists(path):
+        with np.load(path) as lua:
+            if "templates_hash" in lua and str(lua["templates_hash"]) == get_templates_hash():
+                return False
+    save_lookup_array(generate_lookup_array_vectorized(), path)
+    return True
+
+
 if __name__ == '__main__':
     # generating and saving all the 12 lookuparrays
     for index in range(12):
-        lookup_array = generate_lookup_array(2 ** 26, index)
-        np.save("lookuparray%i.npy" % (index + 1), lookup_array)
+        lookup_array = generate_lookup_array_vectorized(2 ** 26, index)
+        save_lookup_array(lookup_array, "lookuparray%i.npz" % (index + 1))
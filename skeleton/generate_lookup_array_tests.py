@@ -1,6 +1,11 @@
+import os
+import tempfile
+
 import nose.tools
+import numpy as np
 
 import skeleton.generate_lookup_array as generate_lookup
+import skeleton.rotational_operators as rotational_operators
 
 
 def _helper_template_working(arr, template, equate_to=0):
@@ -43,3 +48,27 @@ def test_templates():
         _helper_template_working(ones_test_case, template)
         _helper_template_working(zeroes_test_case, template)
         _helper_template_working(template_cases[ith_template_case], template, 1)
+
+
+def test_generate_lookup_array_vectorized():
+    # table of the first direction is the saved lookup array
+    with np.load(rotational_operators.LOOKUP_ARRAY_PATH) as lua:
+        lookup_array = lua["lua"]
+    np.testing.assert_array_equal(generate_lookup.generate_lookup_array_vectorized(), lookup_array)
+    # table of a direction at the configuration number of the first kernel is the saved lookup array
+    # at the configuration number of the direction kernel
+    neighborhoods = (np.random.uniform(size=(2000, 27)) < 0.35).astype(np.uint64)
+    first_configs = neighborhoods.dot(rotational_operators.DIRECTIONS_LIST[0].ravel()).astype(np.int64)
+    for direction in [1, 6, 11]:
+        configs = neighborhoods.dot(rotational_operators.DIRECTIONS_LIST[direction].ravel()).astype(np.int64)
+        direction_lookup_array = generate_lookup.generate_lookup_array_vectorized(direction=direction)
+        np.testing.assert_array_equal(direction_lookup_array[first_configs], lookup_array[configs])
+
+
+def test_update_lookup_array():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "lookuparray.npz")
+        assert generate_lookup.update_lookup_array(path), "missing lookup array is generated"
+        assert not generate_lookup.update_lookup_array(path), "lookup array of the same templates is kept"
+        np.savez_compressed(path, lua=np.load(path)["lua"], templates_hash="old templates")
+        assert generate_lookup.update_lookup_array(path), "lookup array of other templates is regenerated"
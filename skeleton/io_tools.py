@@ -91,6 +91,17 @@ def loadStack(path, targetExtension="png", displayProgress=True):
     return stack
 
 
+def load_memmap(path, shape=None, dtype=np.uint8):
+    """
+    Return a read only memory-mapped array of a .npy file or of a raw file with given shape and dtype
+    Lets volumes larger than memory be read a part at a time, e.g. by thinVolume.get_thinned_tiled
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode='r')
+    assert shape is not None, "shape is needed to load a raw file {}".format(path)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
 def writeTransparentPngs(dirName, transparentValue=0):
 
     imNames = glob.glob(dirName + "*.png")
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 import nose.tools
 import numpy as np
 
@@ -17,3 +20,12 @@ def test_module_relative_path():
 
 def test_pad_int():
     np.testing.assert_array_equal(io_tools.padInt(5), "00000005")
+
+
+def test_load_memmap():
+    arr = np.random.randint(2, size=(5, 6, 7), dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as directory:
+        np.save(os.path.join(directory, "arr.npy"), arr)
+        arr.tofile(os.path.join(directory, "arr.raw"))
+        np.testing.assert_array_equal(io_tools.load_memmap(os.path.join(directory, "arr.npy")), arr)
+        np.testing.assert_array_equal(io_tools.load_memmap(os.path.join(directory, "arr.raw"), arr.shape), arr)
@@ -3,15 +3,13 @@ import time
 
 import numpy as np
 import networkx as nx
-from scipy.ndimage import convolve
 
 
 """
 program to look up adjacent elements and calculate degree
-this dictionary can be used for graph creation
-since networkx graph based on looking up the array and the
-adjacent coordinates takes long time. create a dict
-using dict_of_indices_and_adjacent_coordinates.
+the edges between adjacent nonzero elements are looked up
+for all of them at once as integer arrays and the networkx
+graph is created from them. increments around a voxel at origin
 (-1 -1 -1) (-1 0 -1) (-1 1 -1)
 (-1 -1 0)  (-1 0 0)  (-1 1 0)
 (-1 -1 1)  (-1 0 1)  (-1 1 1)
@@ -35,85 +33,281 @@ LIST_STEP_DIRECTIONS2D = list(itertools.product((-1, 0, 1), repeat=2))
 LIST_STEP_DIRECTIONS2D.remove((0, 0))
 
 
-def _get_increments(config_number, dimensions):
+def _get_strides(shape):
+    # flat offset of a step along each dimension of an array of shape
+    return [int(np.prod(shape[dim + 1:])) for dim in range(len(shape))]
+
+
+def _get_half_offsets(shape):
+    # flat offsets in an array of shape of the neighbors after a voxel/pixel in raveled order, every edge
+    # of the second ordered neighborhood is found once from its first voxel
+    strides = _get_strides(shape)
+    list_step_directions = LIST_STEP_DIRECTIONS3D if len(shape) == 3 else LIST_STEP_DIRECTIONS2D
+    offsets = [sum(increment * stride for increment, stride in zip(increments, strides))
+               for increments in list_step_directions]
+    return [offset for offset in offsets if offset > 0]
+
+
+def _get_triangles(dimensions):
+    """
+    Return the 3 vertex cliques of the second ordered neighborhood and the edges removed from them
+    Returns
+    -------
+    list of tuples
+        (corners, removed_edges, common_neighbors) of every triangle, corners are the increments from its first
+        voxel in raveled order to all three, removed_edges are pairs of corners of the edges _remove_clique_edges
+        removes from it and common_neighbors the increments of the voxels adjacent to all three corners,
+        the triangle is not a 3 vertex clique if any of them is nonzero
+
+    Notes
+    ------
+    The rules only depend on the edge lengths and directions of a triangle, they are decided once
+    for every triangle of the neighborhood. A triangle with edges of equal lengths has exactly one
+    edge in a plane of constant first coordinate, the one removed
+    """
+    list_step_directions = LIST_STEP_DIRECTIONS3D if dimensions == 3 else LIST_STEP_DIRECTIONS2D
+    origin = (0,) * dimensions
+    forward_steps = [step for step in list_step_directions if step > origin]
+    triangles = []
+    for first, second in itertools.combinations(forward_steps, 2):
+        corners = np.array([origin, first, second])
+        if np.max(np.abs(corners[2] - corners[1])) > 1:
+            continue
+        combination_edges = list(itertools.combinations(range(3), 2))
+        lengths = [np.sum((corners[source] - corners[target]) ** 2) for source, target in combination_edges]
+        if len(set(lengths)) != 1:
+            removed_edges = [edge for edge, length in zip(combination_edges, lengths) if length == max(lengths)]
+        else:
+            removed_edges = [(source, target) for source, target in combination_edges
+                             if corners[source][0] == corners[target][0]]
+        common_neighbors = [step for step in list_step_directions
+                            if step not in [first, second] and np.max(np.abs(corners - step)) <= 1]
+        triangles.append((corners, removed_edges, common_neighbors))
+    return triangles
+
+
+# triangles of the three/two dimensional neighborhoods
+TRIANGLES3D = _get_triangles(3)
+
+TRIANGLES2D = _get_triangles(2)
+
+
+def _get_clique_edges(flat, shape, candidates):
+    """
+    Return flat indices of the first and second voxels of the edges removed from 3 vertex cliques
+    Parameters
+    ----------
+    flat : numpy array
+        raveled binary array of shape, padded with zeros
+
+    shape : tuple
+        shape of the padded array
+
+    candidates : numpy array
+        flat indices of the nonzero voxels with two or more neighbors after them in raveled order,
+        the first voxels of all the triangles
+
+    Returns
+    -------
+    sources, targets : numpy array
+        flat indices of the two voxels of every edge removed, sources before targets, same edges
+        _remove_clique_edges removes from the graph of the array
+    """
+    strides = _get_strides(shape)
+    sources = []
+    targets = []
+    for corners, removed_edges, common_neighbors in (TRIANGLES3D if len(shape) == 3 else TRIANGLES2D):
+        corner_offsets = np.dot(corners, strides)
+        firsts = candidates[flat[candidates + corner_offsets[1]] & flat[candidates + corner_offsets[2]]]
+        # triangles in a larger clique are not 3 vertex cliques
+        in_larger_clique = np.zeros(len(firsts), dtype=bool)
+        for offset in [sum(increment * stride for increment, stride in zip(step, strides)) for step in common_neighbors]:
+            in_larger_clique |= flat[firsts + offset]
+        firsts = firsts[~in_larger_clique]
+        for source, target in removed_edges:
+            sources.append(firsts + corner_offsets[source])
+            targets.append(firsts + corner_offsets[target])
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def _get_flat_edges(padded, indices, remove_cliques):
+    """
+    Return flat indices of the first and second voxels of the edges from the voxels at indices
+    Parameters
+    ----------
+    padded : numpy array
+        binary array padded with zeros
+
+    indices : numpy array
+        sorted flat indices of nonzero voxels of padded, only their edges to the voxels after them in
+        raveled order are found
+
+    remove_cliques : boolean
+        if True the edges _remove_clique_edges removes from 3 vertex cliques are left out
+
+    Returns
+    -------
+    sources, targets : numpy array
+        flat indices of the two voxels of every edge, sources before targets
     """
-    Return position of non zero voxels/pixels in the
-    binary string of config number
+    flat = padded.reshape(-1)
+    half_offsets = _get_half_offsets(padded.shape)
+    count_forward_neighbors = np.zeros(len(indices), dtype=np.uint8)
+    sources = []
+    targets = []
+    for offset in half_offsets:
+        is_neighbor = flat[indices + offset]
+        count_forward_neighbors += is_neighbor
+        neighbors = indices[is_neighbor]
+        sources.append(neighbors)
+        targets.append(neighbors + offset)
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    if remove_cliques:
+        clique_sources, clique_targets = _get_clique_edges(flat, padded.shape, indices[count_forward_neighbors >= 2])
+        # an edge is its first voxel and the offset to the second one
+        key_base = max(half_offsets) + 1
+        keep = ~np.in1d(sources * key_base + (targets - sources),
+                        clique_sources * key_base + (clique_targets - clique_sources))
+        sources = sources[keep]
+        targets = targets[keep]
+    return sources, targets
+
+
+def get_nodes_and_edges(arr, remove_cliques=False):
+    """
+    Return coordinates of the nonzero voxels/pixels and the edges between them
     Parameters
     ----------
-    config_number : int64
-        integer less than 2 ** 26
+    arr : numpy array
+        binary numpy array can only be 2D Or 3D
 
-    dimensions: int
-        number of dimensions, can only be 2 or 3
+    remove_cliques : boolean
+        if True the edges _remove_clique_edges removes from 3 vertex cliques are left out
 
     Returns
     -------
-    list
-        a list of incremental direction of a non zero voxel/pixel
+    coordinates : numpy array
+        np.intp array of shape (number of nonzero voxels, arr.ndim), coordinates in raveled order
+
+    edges : numpy array
+        np.intp array of shape (number of edges, 2), rows in coordinates of the two voxels of every edge
+        in their second ordered neighborhood, each edge once
 
     Notes
     ------
-    As in the beginning of the program, there are incremental directions
-    around a voxel at origin (0, 0, 0) which are returned by this function.
-    config_number is a decimal number representation of 26 binary numbers
-    around a voxel at the origin in a second ordered neighborhood
+    Only the nonzero voxels are visited, the neighbors of all of them are looked up at once
+    at every flat offset in the array padded with zeros, 1 byte per voxel of the array.
+    Triangles are looked up the same way, only from the voxels with two or more neighbors
+    after them in raveled order
     """
-    config_number = np.int64(config_number)
-    if dimensions == 3:
-        # convert decimal number to a binary string
-        list_step_directions = LIST_STEP_DIRECTIONS3D
-    elif dimensions == 2:
-        list_step_directions = LIST_STEP_DIRECTIONS2D
-    neighbor_values = [(config_number >> digit) & 0x01 for digit in range(3 ** dimensions - 1)]
-    return [neighbor_value * increment for neighbor_value, increment in zip(neighbor_values, list_step_directions)]
+    dimensions = arr.ndim
+    assert dimensions in [2, 3], "array dimensions must be 2 or 3, they are {}".format(dimensions)
+    padded = np.pad(np.asarray(arr, dtype=bool), 1, mode='constant')
+    # flat indices of the nonzero voxels in padded, sorted, the padding is never nonzero
+    indices = np.flatnonzero(padded)
+    sources, targets = _get_flat_edges(padded, indices, remove_cliques)
+    edges = np.column_stack([np.searchsorted(indices, sources), np.searchsorted(indices, targets)]).astype(np.intp)
+    coordinates = np.column_stack(np.unravel_index(indices, padded.shape)).astype(np.intp) - 1
+    return coordinates.reshape(-1, dimensions), edges.reshape(-1, 2)
+
 
+def _get_raveled_ids(flat_indices, padded_shape, first, shape):
+    # raveled indices in an array of shape of flat indices in its slices from first on, padded with zeros
+    coordinates = np.unravel_index(flat_indices, padded_shape)
+    coordinates = [coordinates[0] + first - 1] + [coordinate - 1 for coordinate in coordinates[1:]]
+    return np.ravel_multi_index(coordinates, shape).astype(np.int64)
 
-def _set_adjacency_list(arr):
+
+def get_slab_nodes_and_edges(arr, start, stop, remove_cliques=False):
     """
-    Return position of non zero voxels/pixels in the
-    binary string of config number
+    Return raveled indices of the nonzero voxels/pixels of a slab of slices and of the edges from them
     Parameters
     ----------
     arr : numpy array
-        binary numpy array can only be 2D Or 3D
+        binary numpy array can only be 2D Or 3D, can be memory-mapped, only the slab, two slices
+        before it and one after it are read
+
+    start, stop : int
+        first slice along the first dimension of the slab and the slice after its last one
+
+    remove_cliques : boolean
+        if True the edges _remove_clique_edges removes from 3 vertex cliques are left out
 
     Returns
     -------
-    dict_of_indices_and_adjacent_coordinates: Dictionary
-        key is the nonzero coordinate in input "arr" and value
-        is all the position of nonzero coordinates around it
-        in it's second order neighborhood
+    node_ids : numpy array
+        np.int64 raveled indices in arr of the nonzero voxels of the slab, sorted
+
+    sources, targets : numpy array
+        np.int64 raveled indices in arr of the two voxels of every edge whose first voxel in raveled
+        order is in the slab, the second one can be in the slice after it
 
+    Notes
+    ------
+    The edges of consecutive slabs of an array are the edges of get_nodes_and_edges of the whole array.
+    The triangles removing edges of the slab start in it or in the slice before it, the voxels adjacent to
+    all the corners of a triangle are at most a slice before its first voxel and after its last one
     """
     dimensions = arr.ndim
     assert dimensions in [2, 3], "array dimensions must be 2 or 3, they are {}".format(dimensions)
-    if dimensions == 3:
-        # flipped 3D template in advance
-        template = np.array([[[33554432, 16777216, 8388608], [4194304, 2097152, 1048576], [524288, 262144, 131072]],
-                            [[65536, 32768, 16384], [8192, 0, 4096], [2048, 1024, 512]],
-                            [[256, 128, 64], [32, 16, 8], [4, 2, 1]]], dtype=np.uint64)
-    else:
-        # 2 dimensions
-        template = np.array([[128, 64, 32], [16, 0, 8], [4, 2, 1]], dtype=np.uint64)
-    # convert the binary array to a configuration number array of same size
-    # by convolving with template
-    arr = np.ascontiguousarray(arr, dtype=np.uint64)
-    result = convolve(arr, template, mode='constant', cval=0)
-    # set the values in convolution result to zero which were zero in 'arr'
-    result[arr == 0] = 0
-    dict_of_indices_and_adjacent_coordinates = {}
-    # list of nonzero tuples
-    non_zeros = list(set(map(tuple, np.transpose(np.nonzero(arr)))))
-    if np.sum(arr) == 1:
-        # if there is just one nonzero element there are no adjacent coordinates
-        dict_of_indices_and_adjacent_coordinates[non_zeros[0]] = []
-    else:
-        for item in non_zeros:
-            adjacent_coordinate_list = [tuple(np.array(item) + np.array(increments))
-                                        for increments in _get_increments(result[item], dimensions) if increments != ()]
-            dict_of_indices_and_adjacent_coordinates[item] = adjacent_coordinate_list
-    return dict_of_indices_and_adjacent_coordinates
+    # the triangles of the slice before the slab remove edges of the slab, they are traced from it too
+    first = max(start - 2, 0)
+    padded = np.pad(np.asarray(arr[first:min(stop + 1, arr.shape[0])], dtype=bool), 1, mode='constant')
+    slice_size = int(np.prod(padded.shape[1:]))
+    traced_start = (max(start - 1, 0) - first + 1) * slice_size
+    slab_start = (start - first + 1) * slice_size
+    slab_stop = (stop - first + 1) * slice_size
+    indices = np.flatnonzero(padded.reshape(-1)[traced_start:slab_stop]) + traced_start
+    sources, targets = _get_flat_edges(padded, indices, remove_cliques)
+    in_slab = sources >= slab_start
+    indices = indices[indices >= slab_start]
+    sources = sources[in_slab]
+    targets = targets[in_slab]
+    return [_get_raveled_ids(flat_indices, padded.shape, first, arr.shape) for flat_indices in [indices, sources, targets]]
+
+
+def get_edges_near(padded, node_ids, remove_cliques=False):
+    """
+    Return raveled indices of the nonzero voxels/pixels next to some voxels and of the edges from them
+    Parameters
+    ----------
+    padded : numpy array
+        binary numpy array padded with zeros by one voxel, can only be 2D Or 3D
+
+    node_ids : numpy array
+        raveled indices in the array without padding of the voxels, nonzero or not
+
+    remove_cliques : boolean
+        if True the edges _remove_clique_edges removes from 3 vertex cliques are left out
+
+    Returns
+    -------
+    near_ids : numpy array
+        np.int64 raveled indices of the nonzero voxels in the second ordered neighborhood of node_ids
+        or at node_ids, sorted
+
+    sources, targets : numpy array
+        np.int64 raveled indices of the two voxels of every edge whose first voxel in raveled order is
+        in near_ids, same edges as get_nodes_and_edges of the whole array
+
+    Notes
+    ------
+    Whether an edge is in a 3 vertex clique only depends on the voxels adjacent to both of its voxels,
+    the edges near voxels zeroed in an array are the only edges of its graph changed by them.
+    The triangles removing the edges start at near_ids or at a voxel before one of them
+    """
+    shape = tuple(dimension - 2 for dimension in padded.shape)
+    flat = padded.reshape(-1)
+    indices = np.ravel_multi_index([coordinate + 1 for coordinate in np.unravel_index(node_ids, shape)], padded.shape)
+    half_offsets = np.array(_get_half_offsets(padded.shape))
+    offsets = np.concatenate([[0], half_offsets, -half_offsets])
+    near = np.unique((indices[:, None] + offsets).ravel())
+    near = near[flat[near]]
+    traced = np.unique((near[:, None] - np.concatenate([[0], half_offsets])).ravel())
+    sources, targets = _get_flat_edges(padded, traced[flat[traced]], remove_cliques)
+    keep = np.in1d(sources, near)
+    return [_get_raveled_ids(flat_indices, padded.shape, 0, shape) for flat_indices in [near, sources[keep], targets[keep]]]
 
 
 def _remove_clique_edges(networkx_graph):
@@ -172,7 +366,7 @@ def _remove_clique_edges(networkx_graph):
     return networkx_graph
 
 
-def get_networkx_graph_from_array(binary_arr):
+def get_networkx_graph_from_array(binary_arr, spacing=None):
     """
     Return a networkx graph from a binary numpy array
     Parameters
@@ -180,15 +374,30 @@ def get_networkx_graph_from_array(binary_arr):
     binary_arr : numpy array
         binary numpy array can only be 2D Or 3D
 
+    spacing : tuple
+        physical size of a voxel along each dimension, saved as the 'spacing' attribute of the graph so
+        pruning and segment statistics measure lengths in the same units. None for unit voxels
+
     Returns
     -------
     networkx_graph : Networkx graph
-        graphical representation of the input array after clique removal
+        graphical representation of the input array after clique removal, nodes are voxel indices
+
+    Notes
+    ------
+    Cliques are removed on the voxel grid, the graph is the same for any spacing.
+    The edges of the 3 vertex cliques are left out as the arrays of edges are found,
+    the same edges _remove_clique_edges removes from a graph
     """
     assert np.max(binary_arr) in [0, 1], "input must always be a binary array"
     start = time.time()
-    dict_of_indices_and_adjacent_coordinates = _set_adjacency_list(binary_arr)
-    networkx_graph = nx.from_dict_of_lists(dict_of_indices_and_adjacent_coordinates)
-    _remove_clique_edges(networkx_graph)
+    coordinates, edges = get_nodes_and_edges(binary_arr, remove_cliques=True)
+    nodes = list(map(tuple, coordinates.tolist()))
+    networkx_graph = nx.Graph()
+    networkx_graph.add_nodes_from(nodes)
+    networkx_graph.add_edges_from((nodes[source], nodes[target]) for source, target in edges.tolist())
+    if spacing is not None:
+        assert len(spacing) == binary_arr.ndim, "spacing must have {} values, it is {}".format(binary_arr.ndim, spacing)
+        networkx_graph.graph['spacing'] = tuple(spacing)
     print("time taken to obtain networkxgraph is %0.3f seconds" % (time.time() - start))
     return networkx_graph
@@ -3,7 +3,7 @@ import numpy as np
 import networkx as nx
 from skimage.morphology import skeletonize
 
-from skeleton.networkx_graph_from_array import get_networkx_graph_from_array
+from skeleton.networkx_graph_from_array import _remove_clique_edges, get_networkx_graph_from_array, get_nodes_and_edges
 
 
 def _helper_networkx_graph(sample_image, expected_edges, expected_disjoint_graphs):
@@ -49,3 +49,36 @@ def test_special_case_graph():
                                   [[0, 0, 0], [0, 1, 0], [0, 0, 0]],
                                   [[0, 1, 0], [0, 0, 1], [0, 0, 0]]], dtype=bool)
     _helper_networkx_graph(special_case_array, 2, 1)
+
+
+def _get_adjacent_pairs(sample_image):
+    # pairs of coordinates of adjacent nonzero voxels, looked up one voxel at a time
+    coordinates = [tuple(coordinate) for coordinate in np.transpose(np.nonzero(sample_image))]
+    return {frozenset([first, second]) for first in coordinates for second in coordinates
+            if first != second and max(abs(i - j) for i, j in zip(first, second)) == 1}
+
+
+def test_nodes_and_edges():
+    for shape in [(6, 7), (5, 6, 7), (1, 4, 1)]:
+        sample_image = np.random.random(shape) > 0.6
+        coordinates, edges = get_nodes_and_edges(sample_image)
+        np.testing.assert_array_equal(coordinates, np.transpose(np.nonzero(sample_image)))
+        pairs = {frozenset([tuple(coordinates[source]), tuple(coordinates[target])]) for source, target in edges}
+        nose.tools.assert_equal(len(pairs), len(edges))
+        nose.tools.assert_equal(pairs, _get_adjacent_pairs(sample_image))
+
+
+def test_clique_edges():
+    # triangles removed from the neighborhood offsets are the ones removed from the cliques of the graph
+    for shape in [(7, 8), (6, 7, 8), (3, 3, 3)]:
+        for density in [0.3, 0.6, 0.9]:
+            sample_image = np.random.random(shape) < density
+            coordinates, edges = get_nodes_and_edges(sample_image)
+            nodes = list(map(tuple, coordinates.tolist()))
+            networkx_graph = nx.Graph()
+            networkx_graph.add_nodes_from(nodes)
+            networkx_graph.add_edges_from((nodes[source], nodes[target]) for source, target in edges.tolist())
+            _remove_clique_edges(networkx_graph)
+            obtained_graph = get_networkx_graph_from_array(sample_image)
+            nose.tools.assert_equal(set(map(frozenset, obtained_graph.edges())),
+                                    set(map(frozenset, networkx_graph.edges())))
@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+
+import skeleton.rotational_operators as rotational_operators
+from skeleton.deletion_rules import is_deletable
+
+"""
+Thinning vectorized with numpy, the engine get_thinned falls back on when the compiled thinning
+extension is not available. The configuration numbers of all the border points of a subiteration
+are gathered from the padded volume at once and decided by the same lookup array (or decision diagram)
+"""
+
+# bit each of the 26 neighbors sets in the configuration number of every direction, the center voxel is skipped
+DIRECTION_BITS = [[int(weight).bit_length() - 1 for weight in kernel.ravel()]
+                  for kernel in rotational_operators.DIRECTIONS_LIST]
+
+
+def _get_offsets(paddedShape):
+    # flat offsets of the 27 neighbors in the padded volume, same order as POSITION_VECTORS
+    strides = (paddedShape[1] * paddedShape[2], paddedShape[2], 1)
+    return [sum(increment * stride for increment, stride in zip(position, strides))
+            for position in rotational_operators.POSITION_VECTORS]
+
+
+def _update_padding(padded):
+    # repeat the edge voxels in the padding, as 'reflect' pads the volume
+    padded[0] = padded[1]
+    padded[-1] = padded[-2]
+    padded[:, 0] = padded[:, 1]
+    padded[:, -1] = padded[:, -2]
+    padded[:, :, 0] = padded[:, :, 1]
+    padded[:, :, -1] = padded[:, :, -2]
+
+
+def _get_border(padded):
+    # flat indices in padded of the interior foreground voxels with a background voxel in their 6 neighborhood
+    center = padded[1:-1, 1:-1, 1:-1]
+    interior = center.copy()
+    interior &= padded[:-2, 1:-1, 1:-1]
+    interior &= padded[2:, 1:-1, 1:-1]
+    interior &= padded[1:-1, :-2, 1:-1]
+    interior &= padded[1:-1, 2:, 1:-1]
+    interior &= padded[1:-1, 1:-1, :-2]
+    interior &= padded[1:-1, 1:-1, 2:]
+    zs, xs, ys = np.nonzero(center & ~interior)
+    return np.ravel_multi_index((zs + 1, xs + 1, ys + 1), padded.shape)
+
+
+def get_thinned_numpy(binaryArr, mode='reflect', cval=0, rule='table', checkpoint=None, startIteration=0):
+    """
+    Return thinned output of the numpy engine
+    Parameters
+    ----------
+    binaryArr : Numpy array
+        3D binary numpy array
+
+    mode : string
+        boundary mode, can be either 'constant' or 'reflect'
+
+    cval : int
+        value to pad with if mode is 'constant'
+
+    rule : string
+        deletion rule, one of deletion_rules.RULES
+
+    checkpoint : thinning_checkpoint.ThinningCheckpoint
+        saves the voxels after every iteration it is due, none are saved if it is None
+
+    startIteration : int
+        number of iterations binaryArr was thinned for before, binaryArr is a checkpoint of a run that is resumed
+
+    Returns
+    -------
+    result : boolean Numpy array
+        3D binary thinned numpy array of the same shape, same as thinning.cy_get_thinned_3d gives
+    """
+    assert mode in ['reflect', 'constant'], "mode must be either 'constant' or 'reflect', it is {}".format(mode)
+    assert mode == 'reflect' or cval in [0, 1], "cval must be 0 or 1, it is {}".format(cval)
+    if mode == 'reflect':
+        padded = np.pad(np.asarray(binaryArr, dtype=bool), 1, mode='edge')
+    else:
+        padded = np.pad(np.asarray(binaryArr, dtype=bool), 1, mode='constant', constant_values=bool(cval))
+    flat = padded.reshape(-1)
+    offsets = _get_offsets(padded.shape)
+    numVoxelsRemoved = 1
+    iterCount = startIteration
+    while numVoxelsRemoved > 0:
+        iterTime = time.time()
+        numVoxelsRemoved = 0
+        border = _get_border(padded)
+        for direction in range(12):
+            # border points of the iteration that are still foreground, all decided before any is deleted
+            border = border[flat[border]]
+            configs = np.zeros(border.shape, dtype=np.int64)
+            for offset, bit in zip(offsets, DIRECTION_BITS[direction]):
+                if bit >= 0:
+                    configs |= flat[border + offset].astype(np.int64) << bit
+            deleted = border[is_deletable(configs, rule)]
+            flat[deleted] = False
+            if mode == 'reflect':
+                _update_padding(padded)
+            numVoxelsRemoved += len(deleted)
+        iterCount += 1
+        print("Finished iteration %i, %0.2f s, removed %i pixels" % (iterCount, time.time() - iterTime, numVoxelsRemoved))
+        if checkpoint is not None and numVoxelsRemoved > 0 and checkpoint.isDue(iterCount):
+            checkpoint.save(iterCount, padded[1:-1, 1:-1, 1:-1])
+    return padded[1:-1, 1:-1, 1:-1].copy()
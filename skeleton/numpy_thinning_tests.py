@@ -0,0 +1,32 @@
+import numpy as np
+import scipy.ndimage as ndimage
+
+import skeleton.deletion_rules as deletion_rules
+import skeleton.thinVolume as thin_volume
+from skeleton.numpy_thinning import get_thinned_numpy
+
+
+def get_blobs():
+    return [ndimage.gaussian_filter(np.random.uniform(size=shape), 2) > 0.5 for shape in [(12, 14, 5), (20, 17, 30)]]
+
+
+def test_same_as_table():
+    for blob in get_blobs():
+        for mode, cval in [('reflect', 0), ('constant', 0), ('constant', 1)]:
+            expected_result = thin_volume.get_thinned(blob.copy(), mode=mode, cval=cval, engine='convolve')
+            for rule in deletion_rules.RULES:
+                result = get_thinned_numpy(blob, mode, cval, rule)
+                np.testing.assert_array_equal(result, expected_result,
+                                              err_msg="{} {} {} {}".format(blob.shape, mode, cval, rule))
+
+
+def test_fallback_without_extension():
+    # the engines of the extension thin with the numpy engine when it is not available
+    blob = get_blobs()[-1]
+    expected_result = thin_volume.get_thinned(blob)
+    thinning = thin_volume.thinning
+    thin_volume.thinning = None
+    try:
+        np.testing.assert_array_equal(thin_volume.get_thinned(blob, engine='parallel'), expected_result)
+    finally:
+        thin_volume.thinning = thinning
@@ -1,11 +1,20 @@
+import heapq
 import itertools
 import time
 
 import networkx as nx
+import numpy as np
+
+from skeleton.segment_graph import SegmentGraph
+from skeleton.skeleton_graph import SkeletonGraph
 """
 program to prune segments of length less than cutoff in  a 3D/2D Array
 """
 
+# 'walks' walks the segments of the junction graph from all the end points at once, 'paths' enumerates the
+# simple paths of the voxel graph from every end point to every branch point, both remove the same voxels
+ENGINES = ('walks', 'paths')
+
 
 def _countBranchPointsOnSimplePath(simplePath, listBranchIndices):
     """
@@ -26,6 +35,25 @@ def _countBranchPointsOnSimplePath(simplePath, listBranchIndices):
     return sum([1 for point in simplePath if point in listBranchIndices])
 
 
+def _getPathLength(simplePath, spacing):
+    """
+    Find physical length of a path
+    Parameters
+    ----------
+    simplePath : list
+        list of nodes on the path
+
+    spacing : tuple
+        physical size of a voxel along each dimension
+
+    Returns
+    -------
+    float
+        sum of the lengths of the edges on the path
+    """
+    return np.sum(np.linalg.norm(np.diff(simplePath, axis=0) * spacing, axis=1))
+
+
 def _removeNodesOnPath(simplePaths, skel):
     """
     Returns array changed in place after zeroing out the nodes on simplePath
@@ -43,7 +71,175 @@ def _removeNodesOnPath(simplePaths, skel):
             skel[pointsSmallBranches] = 0
 
 
-def getPrunedSkeleton(skeletonStack, networkxGraph, cutoff=9):
+def _getSpurPaths(skeletonGraph, endPoint, isBranch, depth):
+    """
+    Find simple paths of a SkeletonGraph from an end point to the branch points
+    Parameters
+    ----------
+    skeletonGraph : SkeletonGraph
+        graph of the skeleton
+
+    endPoint : int
+        node the paths start from
+
+    isBranch : numpy array
+        boolean array, True for the branch nodes
+
+    depth : int
+        maximum number of edges on a path
+
+    Returns
+    -------
+    generator
+        lists of nodes on the paths, same paths as nx.all_simple_paths from endPoint to every branch point gives
+    """
+    if depth < 1:
+        return
+    path = [endPoint]
+    onPath = {endPoint}
+    # neighbors of every node on the path not tried yet
+    stack = [iter(skeletonGraph.neighbors(endPoint).tolist())]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            onPath.discard(path.pop())
+        elif node not in onPath:
+            if isBranch[node]:
+                yield path + [node]
+            if len(path) < depth:
+                path.append(node)
+                onPath.add(node)
+                stack.append(iter(skeletonGraph.neighbors(node).tolist()))
+
+
+def _getPrunedSkeletonGraph(skeletonStack, skeletonGraph, cutoff, spacing, depth):
+    # getPrunedSkeleton of a SkeletonGraph, paths are searched from every end point to all the branch points at once
+    degree = skeletonGraph.degree()
+    isBranch = (degree != 2) & (degree != 1)
+    endPoints = np.flatnonzero(degree == 1)
+    for index, endPoint in enumerate(endPoints.tolist()):
+        for simplePath in _getSpurPaths(skeletonGraph, endPoint, isBranch, depth):
+            coordinates = skeletonGraph.coordinates[simplePath]
+            if spacing is None or _getPathLength(coordinates, spacing) <= cutoff:
+                skeletonStack[tuple(coordinates[1:].T)] = 0
+        progress = int((100 * (index + 1)) / len(endPoints))
+        print("pruning in progress {}% \r".format(progress), end="", flush=True)
+    return skeletonStack
+
+
+def _getIncidentSegments(segmentGraph):
+    # CSR arrays of the segments of every junction and the junction at their other end, self loops left out
+    starts, ends = segmentGraph.segmentNodes.T
+    isLoop = starts == ends
+    segments = np.flatnonzero(~isLoop)
+    nodes = np.concatenate([starts[~isLoop], ends[~isLoop]])
+    order = np.argsort(nodes, kind='mergesort')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(nodes, minlength=segmentGraph.numberOfNodes))])
+    return indptr, np.concatenate([segments, segments])[order], np.concatenate([ends[~isLoop], starts[~isLoop]])[order]
+
+
+def _getSegmentLengths(segmentGraph, cutoff, spacing, depth):
+    # lengths of the segments and the limit of the length of a spur, a path of a physical length up to cutoff
+    # has at most depth edges
+    if spacing is not None:
+        return segmentGraph.getLengths(spacing), cutoff
+    return np.diff(segmentGraph.segmentIndptr) - 1, depth
+
+
+def _getSpurVoxels(segmentGraph, cutoff, spacing, depth):
+    """
+    Find voxels of the segments from an end point to a branch point of a SegmentGraph within the cutoff
+    Parameters
+    ----------
+    segmentGraph : SegmentGraph
+        junction graph of the skeleton
+
+    cutoff, spacing, depth : same as in getPrunedSkeleton
+
+    Returns
+    -------
+    numpy array
+        raveled indices of the voxels of the spurs, their end points included and their branch points left out
+
+    Notes
+    ------
+    A branch point all of whose segments are spurs keeps its longest one, no voxel is left without neighbors
+    """
+    lengths, limit = _getSegmentLengths(segmentGraph, cutoff, spacing, depth)
+    degrees = segmentGraph.nodeDegrees
+    isEnd = degrees == 1
+    isBranch = (degrees != 2) & (degrees != 1)
+    starts, ends = segmentGraph.segmentNodes.T
+    endFirst = isEnd[starts] & isBranch[ends]
+    isSpur = (endFirst | (isEnd[ends] & isBranch[starts])) & (lengths <= limit)
+    branchPoints = np.where(endFirst, ends, starts)
+    # every edge of a branch point starts one of its segments
+    spurCounts = np.bincount(branchPoints[isSpur], minlength=segmentGraph.numberOfNodes)
+    onlySpurs = np.flatnonzero(isSpur & (spurCounts[branchPoints] == degrees[branchPoints]))
+    onlySpurs = onlySpurs[np.lexsort((-lengths[onlySpurs], branchPoints[onlySpurs]))]
+    isLongest = np.concatenate([[True], branchPoints[onlySpurs][1:] != branchPoints[onlySpurs][:-1]])
+    isSpur[onlySpurs[isLongest[:len(onlySpurs)]]] = False
+    # voxels of the spurs but their branch points, the last voxel of the spurs starting at their end point
+    indptr = segmentGraph.segmentIndptr
+    segments = np.repeat(np.arange(segmentGraph.numberOfSegments), np.diff(indptr))
+    isBranchVoxel = np.zeros(len(segmentGraph.segmentVoxels), dtype=bool)
+    isBranchVoxel[np.where(endFirst, indptr[1:] - 1, indptr[:-1])[isSpur]] = True
+    return segmentGraph.segmentVoxels[isSpur[segments] & ~isBranchVoxel]
+
+
+def _getWalkedVoxels(segmentGraph, cutoff, spacing, depth):
+    """
+    Find voxels of the spurs of a SegmentGraph
+    Parameters
+    ----------
+    segmentGraph : SegmentGraph
+        junction graph of the skeleton
+
+    cutoff, spacing, depth : same as in getPrunedSkeleton
+
+    Returns
+    -------
+    numpy array
+        raveled indices of the voxels on the simple paths from an end point to a branch point of at most depth
+        edges, and of a physical length up to cutoff if there is a spacing, the end points left out
+
+    Notes
+    ------
+    The shortest walks from the end points through branch points are found once, for all the end points
+    together. A segment is on one of the paths if one of its junctions is a branch point and the walk to
+    the other one and the segment are within the cutoff. If the shortest walk to that junction passes the
+    branch point, the walk to the branch point and the segment the other way round are shorter, the path
+    is still simple. Paths of any number of branch points are walked in time n log n in the number of
+    segments, however many there are
+    """
+    lengths, limit = _getSegmentLengths(segmentGraph, cutoff, spacing, depth)
+    isBranch = (segmentGraph.nodeDegrees != 2) & (segmentGraph.nodeDegrees != 1)
+    indptr, incidentSegments, otherNodes = _getIncidentSegments(segmentGraph)
+    endPoints = np.flatnonzero(segmentGraph.nodeDegrees == 1)
+    walked = np.full(segmentGraph.numberOfNodes, np.inf)
+    walked[endPoints] = 0
+    heap = [(0, endPoint) for endPoint in endPoints.tolist()]
+    while heap:
+        length, node = heapq.heappop(heap)
+        if length > walked[node] or (length and not isBranch[node]):
+            continue
+        for segment, otherNode in zip(incidentSegments[indptr[node]:indptr[node + 1]].tolist(),
+                                      otherNodes[indptr[node]:indptr[node + 1]].tolist()):
+            otherLength = length + lengths[segment]
+            if otherLength <= limit and otherLength < walked[otherNode]:
+                walked[otherNode] = otherLength
+                heapq.heappush(heap, (otherLength, otherNode))
+    starts, ends = segmentGraph.segmentNodes.T
+    removed = (starts != ends) & ((isBranch[ends] & (walked[starts] + lengths <= limit)) |
+                                  (isBranch[starts] & (walked[ends] + lengths <= limit)))
+    voxels = [segmentGraph.segmentVoxels[segmentGraph.segmentIndptr[segment]:segmentGraph.segmentIndptr[segment + 1]]
+              for segment in np.flatnonzero(removed)]
+    voxels = np.concatenate(voxels) if voxels else np.zeros(0, dtype=np.int64)
+    return np.setdiff1d(voxels, segmentGraph.nodeIds[endPoints])
+
+
+def getPrunedSkeleton(skeletonStack, networkxGraph, cutoff=9, spacing=None, engine='walks'):
     """
     Returns an array changed in place with segments less than cutoff removed
     Parameters
@@ -51,14 +247,42 @@ def getPrunedSkeleton(skeletonStack, networkxGraph, cutoff=9):
     skeletonStack : numpy array
         2D or 3D numpy array
 
-    networkxGraph : Networkx graph
-        graph to remove cliques from
+    networkxGraph : Networkx graph, SkeletonGraph or SegmentGraph
+        graph of the skeleton, it is collapsed to a SegmentGraph by the 'walks' engine
+
+    cutoff : integer or float
+        cutoff of segment length to be removed, number of edges of the segment if there is no spacing,
+        physical length otherwise
 
-    cutoff : integer
-        cutoff of segment length to be removed
+    spacing : tuple
+        physical size of a voxel along each dimension, the 'spacing' attribute of networkxGraph by default
+
+    engine : string
+        one of ENGINES, 'walks' takes time linear in the size of the skeleton (n log n in its number of segments),
+        'paths' enumerates the paths of the voxel graph for every end point and branch point
 
     """
+    assert engine in ENGINES, "engine must be one of {}, it is {}".format(ENGINES, engine)
+    if spacing is None:
+        spacing = networkxGraph.graph.get('spacing')
+    # no segment of a physical length up to cutoff has more edges than depth
+    depth = cutoff if spacing is None else int(cutoff // min(spacing))
     start_prune = time.time()
+    if engine == 'walks':
+        if isinstance(networkxGraph, SkeletonGraph):
+            segmentGraph = SegmentGraph.fromSkeletonGraph(networkxGraph)
+        elif isinstance(networkxGraph, SegmentGraph):
+            segmentGraph = networkxGraph
+        else:
+            segmentGraph = SegmentGraph.fromNetworkx(networkxGraph, skeletonStack.shape)
+        voxels = _getWalkedVoxels(segmentGraph, cutoff, spacing, depth)
+        skeletonStack[np.unravel_index(voxels, skeletonStack.shape)] = 0
+        print("time taken to prune is %0.3f seconds" % (time.time() - start_prune))
+        return skeletonStack
+    if isinstance(networkxGraph, SkeletonGraph):
+        _getPrunedSkeletonGraph(skeletonStack, networkxGraph, cutoff, spacing, depth)
+        print("time taken to prune is %0.3f seconds" % (time.time() - start_prune))
+        return skeletonStack
     ndd = nx.degree(networkxGraph)
     listEndIndices = [k for (k, v) in ndd.items() if v == 1]
     listBranchIndices = [k for (k, v) in ndd.items() if v != 2 and v != 1]
@@ -67,9 +291,64 @@ def getPrunedSkeleton(skeletonStack, networkxGraph, cutoff=9):
     for index, (endPoint, branchPoint) in enumerate(branchEndPermutations):
         if nx.has_path(networkxGraph, endPoint, branchPoint):  # is it on the same subgraph
             simplePaths = [simplePath for simplePath in nx.all_simple_paths(networkxGraph, source=endPoint,
-                           target=branchPoint, cutoff=cutoff) if _countBranchPointsOnSimplePath(simplePath, listBranchIndices)]
+                           target=branchPoint, cutoff=depth) if _countBranchPointsOnSimplePath(simplePath, listBranchIndices)
+                           and (spacing is None or _getPathLength(simplePath, spacing) <= cutoff)]
             _removeNodesOnPath(simplePaths, skeletonStack)
         progress = int((100 * (index + 1)) / totalSteps)
         print("pruning in progress {}% \r".format(progress), end="", flush=True)
     print("time taken to prune is %0.3f seconds" % (time.time() - start_prune))
     return skeletonStack
+
+
+def getIterativelyPrunedSkeleton(skeletonStack, networkxGraph, cutoff=9, spacing=None):
+    """
+    Returns an array changed in place with segments less than cutoff removed until none is left and its graph
+    Parameters
+    ----------
+    skeletonStack : numpy array
+        2D or 3D numpy array
+
+    networkxGraph : Networkx graph or SkeletonGraph
+        graph of the skeleton, a SkeletonGraph is changed in place
+
+    cutoff, spacing : same as in getPrunedSkeleton
+
+    Returns
+    -------
+    skeletonStack : numpy array
+        the array changed in place
+
+    skeletonGraph : SkeletonGraph
+        graph of the pruned array after clique removal, same as SkeletonGraph.fromArray of it gives
+
+    Notes
+    ------
+    Every round removes the segments from an end point to a branch point within the cutoff, the end points
+    included and the branch points kept, a branch point all of whose segments are spurs keeps its longest one.
+    The spurs left by removing the spurs of the previous round, as a branch point becomes an end point, are
+    removed by the next one. Unlike getPrunedSkeleton no branch point is removed, the network is not eroded
+    round after round and no voxel is left without neighbors. The graph is updated in place as voxels are
+    removed, only the edges near them are traced again and the degrees of the next round are counted from it
+    """
+    if spacing is None:
+        spacing = networkxGraph.graph.get('spacing')
+    depth = cutoff if spacing is None else int(cutoff // min(spacing))
+    start_prune = time.time()
+    if isinstance(networkxGraph, SkeletonGraph):
+        skeletonGraph = networkxGraph
+    else:
+        skeletonGraph = SkeletonGraph.fromNetworkx(networkxGraph, skeletonStack.shape)
+    padded = np.pad(skeletonStack.astype(bool), 1, mode='constant')
+    isRemoved = np.zeros(skeletonGraph.numberOfNodes, dtype=bool)
+    rounds = 0
+    while True:
+        voxels = _getSpurVoxels(SegmentGraph.fromSkeletonGraph(skeletonGraph), cutoff, spacing, depth)
+        if len(voxels) == 0:
+            break
+        rounds += 1
+        skeletonStack[np.unravel_index(voxels, skeletonStack.shape)] = 0
+        nodes = np.searchsorted(skeletonGraph.nodeIds, voxels)
+        isRemoved[nodes] = True
+        skeletonGraph.removeNodes(nodes, padded)
+    print("time taken to prune in %d rounds is %0.3f seconds" % (rounds, time.time() - start_prune))
+    return skeletonStack, skeletonGraph.getSubgraph(np.flatnonzero(~isRemoved))
@@ -1,6 +1,12 @@
+import nose.tools
 import numpy as np
 from scipy import ndimage
 
+from skeleton import skeleton_testlib
+from skeleton.networkx_graph_from_array import get_networkx_graph_from_array
+from skeleton.pruning import getIterativelyPrunedSkeleton, getPrunedSkeleton
+from skeleton.segment_graph import SegmentGraph
+from skeleton.skeleton_graph import SkeletonGraph
 from skeleton.skeletonClass import Skeleton
 
 """
@@ -38,3 +44,49 @@ def test_rectangle():
 def test_rectangleNoise():
     # Test 2 rectangle with noise must prune
     checkAlgorithmSameObjects(getRectangleNoise())
+
+
+def test_spacing():
+    # pruning is the same if the spacing and the cutoff are scaled together
+    image = getRectangleNoise()
+    results = []
+    for scale in [1, 2.5]:
+        skel = Skeleton(image, spacing=(scale, scale, scale))
+        skel.setPrunedSkeletonOutput()
+        nose.tools.assert_equal(skel.graph.graph['spacing'], (scale, scale, scale))
+        results.append(getPrunedSkeleton(skel.skeletonStack.copy(), skel.graph, cutoff=9 * scale))
+    np.testing.assert_array_equal(results[0], results[1])
+
+
+def test_engines():
+    # walks of the segments remove the voxels of the paths between end points and branch points
+    for image in [skeleton_testlib.get_tiny_loop_with_branches(), skeleton_testlib.get_disjoint_crosses(),
+                  skeleton_testlib.get_single_voxel_line(), skeleton_testlib.get_hilbert_curve()]:
+        for cutoff, spacing in [(3, None), (9, None), (4.5, (1, 2, 0.5))]:
+            graph = get_networkx_graph_from_array(image, spacing)
+            np.testing.assert_array_equal(getPrunedSkeleton(image.copy(), graph, cutoff, engine='walks'),
+                                          getPrunedSkeleton(image.copy(), graph, cutoff, engine='paths'))
+
+
+def test_iterative_pruning():
+    # spurs are removed until none is left, their branch points are kept and no voxel is left without neighbors
+    cutoff = 3
+    for image in [skeleton_testlib.get_tiny_loop_with_branches(), skeleton_testlib.get_disjoint_crosses(),
+                  skeleton_testlib.get_thinnedRandomBlob()]:
+        inputGraph = SegmentGraph.fromArray(image)
+        result, graph = getIterativelyPrunedSkeleton(image.copy(), get_networkx_graph_from_array(image), cutoff=cutoff)
+        # the graph updated in place is the graph of the pruned array
+        expectedGraph = SkeletonGraph.fromArray(result)
+        np.testing.assert_array_equal(graph.nodeIds, expectedGraph.nodeIds)
+        nose.tools.assert_equal(set(map(frozenset, graph.getEdges().tolist())), set(map(frozenset, expectedGraph.edges.tolist())))
+        nose.tools.assert_equal(np.count_nonzero(graph.degree() == 0), 0)
+        nose.tools.assert_greater(np.count_nonzero(result), 0)
+        # branch points of the segments longer than cutoff are kept
+        longSegments = inputGraph.segmentNodes[inputGraph.getLengths() > cutoff].ravel()
+        branchPoints = longSegments[inputGraph.nodeDegrees[longSegments] > 2]
+        nose.tools.assert_true(np.all(result.ravel()[inputGraph.nodeIds[branchPoints]]))
+        # no spur within the cutoff is left
+        segmentGraph = SegmentGraph.fromArray(result)
+        degrees = segmentGraph.nodeDegrees[segmentGraph.segmentNodes]
+        isSpur = (np.min(degrees, axis=1) == 1) & (np.max(degrees, axis=1) > 2)
+        nose.tools.assert_false(np.any(isSpur & (segmentGraph.getLengths() <= cutoff)))
@@ -127,4 +127,7 @@ DIRECTIONS_LIST = get_directions_list(REFERENCE_ARRAY)
 # Path of pre-generated lookuparray.npz
 LOOKUP_ARRAY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lookuparray.npz')
 
+# Path of the bit-packed, uncompressed lookup array thinning memory-maps, written from lookuparray.npz on first use
+PACKED_LOOKUP_ARRAY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lookuparray_packed.npy')
+
 POSITION_VECTORS = list(itertools.product((-1, 0, 1), repeat=3))
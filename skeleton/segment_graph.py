@@ -0,0 +1,185 @@
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, depth_first_order
+
+from skeleton.skeleton_graph import SkeletonGraph
+
+"""
+Junction graph of a skeleton, its nodes are the end points, branch points and isolated voxels and its edges are the
+segments of voxels between them, most of the voxels of a skeleton are on a segment and are not nodes.
+Segments are traced from a SkeletonGraph
+    1) the edges between two junctions are segments of no voxels in between
+    2) the voxels of degree 2 are split into chains, connected components of the edges between them
+    3) every chain is ordered from one of its ends by a single depth first search over all of them
+    4) a chain is a segment between the junctions at its two ends, a chain with no junction is a cycle,
+       one of its voxels is a node of the junction graph, the segment starts and ends on it
+"""
+
+
+class SegmentGraph:
+    """
+    Undirected multigraph of the junctions (end points, branch points and isolated voxels) and segments of a skeleton
+    Parameters
+    ----------
+    shape : tuple
+        shape of the skeleton array
+
+    nodeIds : numpy array
+        raveled indices of the junction voxels in the skeleton array
+
+    nodeDegrees : numpy array
+        degree of every junction voxel in the skeleton graph, 2 for the node of a cycle
+
+    segmentNodes : numpy array
+        array of shape (number of segments, 2), rows in nodeIds of the start and end of every segment
+
+    segmentVoxels : numpy array
+        raveled indices of the voxels of all the segments one after the other, every segment in order from
+        its start to its end node, both included
+
+    segmentIndptr : numpy array
+        the voxels of segment i are segmentVoxels[segmentIndptr[i]:segmentIndptr[i + 1]]
+
+    spacing : tuple
+        physical size of a voxel along each dimension, saved in the graph attributes
+
+    Examples
+    ------
+           SegmentGraph.nodeCoordinates - array of shape (number of nodes, number of dimensions) of the junctions
+
+           SegmentGraph.getSegment(i) - array of shape (number of voxels, number of dimensions) of segment i
+    """
+    def __init__(self, shape, nodeIds, nodeDegrees, segmentNodes, segmentVoxels, segmentIndptr, spacing=None):
+        self.shape = tuple(shape)
+        self.nodeIds = np.asarray(nodeIds, dtype=np.int64)
+        self.nodeDegrees = np.asarray(nodeDegrees, dtype=np.int64)
+        self.nodeCoordinates = np.column_stack(np.unravel_index(self.nodeIds, self.shape)).reshape(-1, len(self.shape))
+        self.segmentNodes = np.asarray(segmentNodes, dtype=np.int64).reshape(-1, 2)
+        self.segmentVoxels = np.asarray(segmentVoxels, dtype=np.int64)
+        self.segmentIndptr = np.asarray(segmentIndptr, dtype=np.int64)
+        self.graph = {}
+        if spacing is not None:
+            self.graph['spacing'] = tuple(spacing)
+
+    @classmethod
+    def fromSkeletonGraph(cls, skeletonGraph):
+        """
+        Return SegmentGraph of the edges not removed of a SkeletonGraph
+        """
+        numNodes = skeletonGraph.numberOfNodes
+        edges = skeletonGraph.getEdges()
+        degree = skeletonGraph.degree()
+        isJunction = degree != 2
+        junctionEdges = isJunction[edges[:, 0]] & isJunction[edges[:, 1]]
+        chainEdges = ~isJunction[edges[:, 0]] & ~isJunction[edges[:, 1]]
+        # voxel of degree 2 and junction of every edge between a chain and a junction
+        attached = edges[~junctionEdges & ~chainEdges]
+        attached = np.where(isJunction[attached[:, 0]][:, None], attached[:, ::-1], attached)
+        attached = attached[np.argsort(attached[:, 0], kind='mergesort')]
+        chains = csr_matrix((np.ones(np.count_nonzero(chainEdges), dtype=bool),
+                             (edges[chainEdges, 0], edges[chainEdges, 1])), shape=(numNodes, numNodes))
+        labels = connected_components(chains, directed=False)[1]
+        # one end of every chain, the first voxel attached to a junction, any voxel of a cycle
+        inChain = np.flatnonzero(~isJunction)
+        order = np.lexsort((inChain, ~np.in1d(inChain, attached[:, 0]), labels[inChain]))
+        chainLabels = labels[inChain][order]
+        isFirst = np.concatenate([[True], chainLabels[1:] != chainLabels[:-1]]) if len(order) else np.zeros(0, bool)
+        starts = inChain[order][isFirst]
+        # depth first search from a root joined to the start of every chain visits the chains one after the other
+        root = numNodes
+        sources = np.concatenate([edges[chainEdges, 0], edges[chainEdges, 1], np.full(len(starts), root)])
+        targets = np.concatenate([edges[chainEdges, 1], edges[chainEdges, 0], starts])
+        search = csr_matrix((np.ones(len(sources), dtype=bool), (sources, targets)), shape=(numNodes + 1,) * 2)
+        visited = depth_first_order(search, root, directed=True, return_predecessors=False)[1:]
+        visitedLabels = labels[visited]
+        chainStarts = np.flatnonzero(np.concatenate([[True], visitedLabels[1:] != visitedLabels[:-1]]))
+        orderedChains = np.split(visited, chainStarts[1:]) if len(visited) else []
+
+        nodes = np.flatnonzero(isJunction).tolist()
+        nodeIndex = {node: index for index, node in enumerate(nodes)}
+        segmentNodes = []
+        segments = []
+        for source, target in edges[junctionEdges].tolist():
+            segmentNodes.append((nodeIndex[source], nodeIndex[target]))
+            segments.append(np.array([source, target]))
+        for chain in orderedChains:
+            first = np.searchsorted(attached[:, 0], chain[0])
+            last = np.searchsorted(attached[:, 0], chain[-1])
+            if first == len(attached) or attached[first, 0] != chain[0]:
+                # cycle, its start voxel is a node
+                nodeIndex[chain[0]] = len(nodes)
+                nodes.append(chain[0])
+                segmentNodes.append((nodeIndex[chain[0]], nodeIndex[chain[0]]))
+                segments.append(np.concatenate([chain, chain[:1]]))
+                continue
+            # a chain of one voxel is attached to both of its junctions
+            if len(chain) == 1:
+                last += 1
+            start, end = attached[first, 1], attached[last, 1]
+            segmentNodes.append((nodeIndex[start], nodeIndex[end]))
+            segments.append(np.concatenate([[start], chain, [end]]))
+        nodes = np.array(nodes, dtype=np.int64)
+        segmentIndptr = np.concatenate([[0], np.cumsum([len(segment) for segment in segments])])
+        segmentVoxels = skeletonGraph.nodeIds[np.concatenate(segments)] if segments else np.zeros(0, dtype=np.int64)
+        return cls(skeletonGraph.shape, skeletonGraph.nodeIds[nodes], degree[nodes], segmentNodes, segmentVoxels,
+                   segmentIndptr, skeletonGraph.graph.get('spacing'))
+
+    @classmethod
+    def fromArray(cls, binaryArr, spacing=None):
+        """
+        Return SegmentGraph of a binary array after clique removal
+        """
+        return cls.fromSkeletonGraph(SkeletonGraph.fromArray(binaryArr, spacing))
+
+    @classmethod
+    def fromNetworkx(cls, networkxGraph, shape=None):
+        """
+        Return SegmentGraph of a networkx graph whose nodes are voxel coordinates, in an array of shape,
+        the smallest shape holding all the nodes by default
+        """
+        if shape is None:
+            shape = tuple(np.max(np.array(networkxGraph.nodes()), axis=0) + 1)
+        return cls.fromSkeletonGraph(SkeletonGraph.fromNetworkx(networkxGraph, shape))
+
+    @property
+    def numberOfNodes(self):
+        return len(self.nodeIds)
+
+    @property
+    def numberOfSegments(self):
+        return len(self.segmentNodes)
+
+    def getSegment(self, segment):
+        # coordinates of the voxels of a segment in order
+        voxels = self.segmentVoxels[self.segmentIndptr[segment]:self.segmentIndptr[segment + 1]]
+        return np.column_stack(np.unravel_index(voxels, self.shape))
+
+    def getLengths(self, spacing=None):
+        """
+        Return physical length of every segment, in voxels if there is no spacing,
+        the 'spacing' attribute of the graph by default
+        """
+        if spacing is None:
+            spacing = self.graph.get('spacing')
+        steps = np.diff(np.column_stack(np.unravel_index(self.segmentVoxels, self.shape)), axis=0).astype(np.float64)
+        if spacing is not None:
+            steps *= spacing
+        stepLengths = np.concatenate([[0], np.sqrt(np.sum(steps ** 2, axis=1))]) if len(steps) else np.zeros(1)
+        # length of a segment is the sum of the steps from its first voxel, the step into it is not counted
+        cumulative = np.cumsum(stepLengths)
+        return cumulative[self.segmentIndptr[1:] - 1] - cumulative[self.segmentIndptr[:-1]]
+
+    def toNetworkx(self):
+        """
+        Return networkx multigraph of the junctions, nodes are coordinate tuples and every segment is an edge
+        with its 'voxels' array of coordinates and 'length'
+        """
+        nodes = list(map(tuple, self.nodeCoordinates.tolist()))
+        networkxGraph = nx.MultiGraph()
+        networkxGraph.graph.update(self.graph)
+        networkxGraph.add_nodes_from(nodes)
+        for segment, (start, end), length in zip(range(self.numberOfSegments), self.segmentNodes.tolist(),
+                                                 self.getLengths()):
+            networkxGraph.add_edge(nodes[start], nodes[end], voxels=self.getSegment(segment), length=length)
+        return networkxGraph
@@ -0,0 +1,72 @@
+import nose.tools
+import numpy as np
+
+from skeleton import skeleton_testlib
+from skeleton.networkx_graph_from_array import get_networkx_graph_from_array
+from skeleton.segment_graph import SegmentGraph
+from skeleton.skeleton_graph import SkeletonGraph
+
+
+def _get_segment_edges(segmentGraph):
+    # edges between consecutive voxels of all the segments
+    edges = []
+    for segment in range(segmentGraph.numberOfSegments):
+        voxels = list(map(tuple, segmentGraph.getSegment(segment).tolist()))
+        edges.extend(frozenset(edge) for edge in zip(voxels[:-1], voxels[1:]))
+    return edges
+
+
+def _check_segments(sampleImage, expectedNodes, expectedSegments):
+    segmentGraph = SegmentGraph.fromArray(sampleImage)
+    nose.tools.assert_equal(segmentGraph.numberOfNodes, expectedNodes)
+    nose.tools.assert_equal(segmentGraph.numberOfSegments, expectedSegments)
+    # every edge of the skeleton is on exactly one segment
+    networkxGraph = get_networkx_graph_from_array(sampleImage)
+    edges = _get_segment_edges(segmentGraph)
+    nose.tools.assert_equal(len(edges), len(set(edges)))
+    nose.tools.assert_equal(set(edges), set(map(frozenset, networkxGraph.edges())))
+    for segment, (start, end) in enumerate(segmentGraph.segmentNodes):
+        voxels = segmentGraph.getSegment(segment)
+        np.testing.assert_array_equal(voxels[0], segmentGraph.nodeCoordinates[start])
+        np.testing.assert_array_equal(voxels[-1], segmentGraph.nodeCoordinates[end])
+    return segmentGraph
+
+
+def test_tiny_loop_with_branches():
+    _check_segments(skeleton_testlib.get_tiny_loop_with_branches(), 4, 4)
+
+
+def test_disjoint_crosses():
+    _check_segments(skeleton_testlib.get_disjoint_crosses(), 10, 8)
+
+
+def test_single_voxel_line():
+    segmentGraph = _check_segments(skeleton_testlib.get_single_voxel_line(), 2, 1)
+    np.testing.assert_allclose(segmentGraph.getLengths(), [4])
+    np.testing.assert_allclose(segmentGraph.getLengths(spacing=(1, 2.5, 1)), [10])
+
+
+def test_cycle_and_isolated_voxel():
+    sampleImage = np.zeros((3, 8, 8), dtype=bool)
+    sampleImage[1, 1:5, 1] = sampleImage[1, 1:5, 4] = 1
+    sampleImage[1, 1, 1:5] = sampleImage[1, 4, 1:5] = 1
+    sampleImage[1, 7, 7] = 1
+    segmentGraph = _check_segments(sampleImage, 2, 1)
+    start, end = segmentGraph.segmentNodes[0]
+    nose.tools.assert_equal(start, end)
+    nose.tools.assert_equal(sorted(segmentGraph.nodeDegrees.tolist()), [0, 2])
+    np.testing.assert_allclose(segmentGraph.getLengths(), [12])
+
+
+def test_from_networkx():
+    sampleImage = skeleton_testlib.get_tiny_loop_with_branches()
+    networkxGraph = get_networkx_graph_from_array(sampleImage, spacing=(1, 2, 2))
+    segmentGraph = SegmentGraph.fromNetworkx(networkxGraph, sampleImage.shape)
+    nose.tools.assert_equal(segmentGraph.graph['spacing'], (1, 2, 2))
+    np.testing.assert_allclose(sorted(segmentGraph.getLengths()),
+                               sorted(SegmentGraph.fromSkeletonGraph(SkeletonGraph.fromArray(sampleImage)).getLengths() * 2))
+    junctionGraph = segmentGraph.toNetworkx()
+    nose.tools.assert_equal(junctionGraph.number_of_nodes(), 4)
+    nose.tools.assert_equal(junctionGraph.number_of_edges(), 4)
+    np.testing.assert_allclose(sum(length for _, _, length in junctionGraph.edges(data='length')),
+                               np.sum(segmentGraph.getLengths()))
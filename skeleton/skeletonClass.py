@@ -1,23 +1,47 @@
 import os
 
 import numpy as np
-from scipy import ndimage
 
+from skeleton.binary_resample import resample_binary
 from skeleton.io_tools import loadStack, saveStack
 from metrics.segmentStats import SegmentStats
 from skeleton.networkx_graph_from_array import get_networkx_graph_from_array
-# NOTE This does the pyx compilation of this extension
-import pyximport; pyximport.install() # NOQA
 from skeleton.thinVolume import get_thinned
-from skeleton.pruning import getPrunedSkeleton
+from skeleton.pruning import getIterativelyPrunedSkeleton, getPrunedSkeleton
+from skeleton.stage_cache import StageCache, getArrayDigest, packArray, packGraph, unpackArray, unpackGraph
 
 """
 abstract class that encompasses all stages of skeletonization leading to quantification
     1) thinning
     2) pruning
     3) graph conversion
+every stage is computed when it is first asked for and kept until a parameter it depends on changes,
+    input -> thinned -> graph -> pruned -> pruned graph -> stats after pruning
+    input -> input graph -> stats before pruning
 """
 
+# parameters of the stages and their defaults
+PARAMETERS = {"mode": "reflect", "spacing": None, "cutoff": 9, "iterativePruning": False}
+
+# stages the output of every stage is computed from and parameters it depends on, in order
+STAGES = [("thinned", (), ("mode",)),
+          ("graph", ("thinned",), ("spacing",)),
+          ("pruned", ("thinned", "graph"), ("cutoff", "iterativePruning")),
+          ("prunedGraph", ("pruned",), ("spacing",)),
+          ("statsAfter", ("prunedGraph",), ()),
+          ("inputGraph", (), ("spacing",)),
+          ("statsBefore", ("inputGraph",), ())]
+
+# stages saved in the on-disk cache, the stats are quick to compute from the graphs
+CACHED_STAGES = ("thinned", "graph", "pruned", "prunedGraph", "inputGraph")
+
+
+def _getParameterValues(parameters):
+    # parameters as they are compared and keyed, spacing of any sequence is a tuple of floats
+    if parameters.get("spacing") is not None:
+        parameters = dict(parameters, spacing=tuple(float(size) for size in parameters["spacing"]))
+    return parameters
+
 
 class Skeleton:
     def __init__(self, path, **kwargs):
@@ -25,6 +49,13 @@ class Skeleton:
         # path : can be an 3D binary array or a numpy(.npy) array
         # if path is a 3D volume saveSkeletonStack, saves series of
         # skeleton pngs in present directory
+        # spacing : physical size of a voxel along each dimension, the skeleton is found on the native grid and
+        # its graph, pruning and statistics are measured in these units. aspectRatio resamples the input instead,
+        # slab by slab with resampleThreads threads, into a .npy file memory-mapped at resampledPath if it is given
+        # mode, cutoff : thinning mode and pruning cutoff, can be changed later with setParameters
+        # iterativePruning : prunes until no segment less than the cutoff is left, the graph is pruned with the array
+        # cacheDir : directory of a StageCache shared by runs and processes, the stage outputs of the same input
+        # and parameters are loaded from it, cacheSize is its size limit in bytes
         if type(path) is str:
             if path.endswith("npy"):
                 # extract rootDir of path
@@ -36,33 +67,130 @@ class Skeleton:
         else:
             self.path = os.getcwd()
             self.inputStack = path
-        if kwargs != {}:
+        self.parameters = _getParameterValues({name: kwargs.get(name, default) for name, default in PARAMETERS.items()})
+        self._stages = {}
+        if "aspectRatio" in kwargs:
             aspectRatio = kwargs["aspectRatio"]
-            self.inputStack = ndimage.interpolation.zoom(self.inputStack, zoom=aspectRatio, order=2, prefilter=False)
+            self.inputStack = resample_binary(self.inputStack, aspectRatio, output=kwargs.get("resampledPath"),
+                                              numThreads=kwargs.get("resampleThreads", 1))
+        self._cache = None
+        if kwargs.get("cacheDir") is not None:
+            self._cache = StageCache(kwargs["cacheDir"], kwargs.get("cacheSize", 2 ** 30))
+            # the input is hashed after resampling, its digest stands for the aspect ratio too
+            self._inputDigest = getArrayDigest(self.inputStack)
+
+    def setParameters(self, **parameters):
+        # change parameters, the stages depending on the changed ones and the stages after them are computed again
+        unknown = set(parameters) - set(PARAMETERS)
+        assert not unknown, "parameters must be in {}, they are {}".format(sorted(PARAMETERS), sorted(unknown))
+        parameters = _getParameterValues(parameters)
+        changed = {name for name, value in parameters.items() if self.parameters[name] != value}
+        self.parameters.update(parameters)
+        invalid = set()
+        for name, inputs, stageParameters in STAGES:
+            if changed.intersection(stageParameters) or invalid.intersection(inputs):
+                invalid.add(name)
+                self._stages.pop(name, None)
+
+    def getStage(self, name):
+        # output of a stage, computed at most once until its parameters change, loaded from the cache if it is there
+        if name not in self._stages:
+            if self._cache is not None and name in CACHED_STAGES:
+                self._stages[name] = self._getCachedStage(name)
+            else:
+                self._stages[name] = getattr(self, "_get" + name[0].upper() + name[1:])()
+        return self._stages[name]
+
+    def _getStageParameters(self, name):
+        # parameters of a stage and of all the stages it is computed from
+        stages = {stageName: (inputs, stageParameters) for stageName, inputs, stageParameters in STAGES}
+        inputs, stageParameters = stages[name]
+        parameters = {parameter: self.parameters[parameter] for parameter in stageParameters}
+        for inputName in inputs:
+            parameters.update(self._getStageParameters(inputName))
+        return parameters
+
+    def _getCachedStage(self, name):
+        shape = self.inputStack.shape
+        key = self._cache.getKey(self._inputDigest, name, self._getStageParameters(name))
+        record = self._cache.get(key)
+        if record is not None:
+            if name == "thinned":
+                return unpackArray(record)
+            if name == "pruned":
+                return unpackArray(record), unpackGraph(record, "graph") if "graphnodeIds" in record else None
+            return unpackGraph(record)
+        output = getattr(self, "_get" + name[0].upper() + name[1:])()
+        if name == "thinned":
+            record = packArray(output)
+        elif name == "pruned":
+            record = packArray(output[0])
+            if output[1] is not None:
+                record.update(packGraph(output[1], shape, "graph"))
+        else:
+            record = packGraph(output, shape)
+        self._cache.put(key, record)
+        return output
+
+    def _getThinned(self):
+        return get_thinned(self.inputStack, self.parameters["mode"])
+
+    def _getGraph(self):
+        return get_networkx_graph_from_array(self.getStage("thinned"), self.parameters["spacing"])
+
+    def _getPruned(self):
+        # the thinned array is kept, a copy of it is pruned, iterative pruning gives the pruned graph with it
+        skeletonStack = self.getStage("thinned").copy()
+        if self.parameters["iterativePruning"]:
+            outputStack, outputGraph = getIterativelyPrunedSkeleton(skeletonStack, self.getStage("graph"),
+                                                                    self.parameters["cutoff"])
+            return outputStack, outputGraph.toNetworkx()
+        return getPrunedSkeleton(skeletonStack, self.getStage("graph"), self.parameters["cutoff"]), None
+
+    def _getPrunedGraph(self):
+        outputStack, outputGraph = self.getStage("pruned")
+        if outputGraph is None:
+            outputGraph = get_networkx_graph_from_array(outputStack, self.parameters["spacing"])
+        return outputGraph
+
+    def _getStatsAfter(self):
+        stats = SegmentStats(self.getStage("prunedGraph"))
+        stats.setStats()
+        return stats
+
+    def _getInputGraph(self):
+        return get_networkx_graph_from_array(self.inputStack, self.parameters["spacing"])
+
+    def _getStatsBefore(self):
+        stats = SegmentStats(self.getStage("inputGraph"))
+        stats.setStats()
+        return stats
 
     def setThinningOutput(self, mode="reflect"):
         # Thinning output
-        self.skeletonStack = get_thinned(self.inputStack, mode)
+        self.setParameters(mode=mode)
+        self.skeletonStack = self.getStage("thinned")
 
     def setNetworkGraph(self, findSkeleton=False):
         # Network graph of the crowded region removed output
         # Generally the function expects a skeleton
         # and findSkeleton is False by default
         if findSkeleton is True:
-            self.setThinningOutput()
+            self.skeletonStack = self.getStage("thinned")
+            self.graph = self.getStage("graph")
         else:
             self.skeletonStack = self.inputStack
-        self.graph = get_networkx_graph_from_array(self.skeletonStack)
+            self.graph = self.getStage("inputGraph")
 
     def setPrunedSkeletonOutput(self):
         # Prune unnecessary segments in crowded regions removed skeleton
         self.setNetworkGraph(findSkeleton=True)
-        self.outputStack = getPrunedSkeleton(self.skeletonStack, self.graph)
+        self.outputStack = self.getStage("pruned")[0]
 
     def getNetworkGraph(self):
-        # Network graph of the final output skeleton stack
+        # Network graph of the final output skeleton stack, iterative pruning gives it with the pruned stack
         self.setPrunedSkeletonOutput()
-        self.outputGraph = get_networkx_graph_from_array(self.outputStack)
+        self.outputGraph = self.getStage("prunedGraph")
 
     def saveSkeletonStack(self):
         # Save output skeletonized stack as series of pngs in the path under a subdirectory skeleton
@@ -73,11 +201,9 @@ class Skeleton:
     def getSegmentStatsBeforePruning(self):
         # stats before pruning the braches
         self.setNetworkGraph()
-        self.statsBefore = SegmentStats(self.graph)
-        self.statsBefore.setStats()
+        self.statsBefore = self.getStage("statsBefore")
 
     def setSegmentStatsAfterPruning(self):
         # stats after pruning the braches
         self.getNetworkGraph()
-        self.statsAfter = SegmentStats(self.outputGraph)
-        self.statsAfter.setStats()
+        self.statsAfter = self.getStage("statsAfter")
@@ -82,3 +82,30 @@ def test_crosPair():
 def test_singleVoxelLine():
     # Test 8 single voxel line should still be the same
     checkSameObjects(skeleton_testlib.get_single_voxel_line())
+
+
+def test_stagesComputedOnce():
+    # Test 9 every stage is computed once and again only after a parameter it depends on changes
+    skel = Skeleton(skeleton_testlib.get_tiny_loop_with_branches())
+    skel.setSegmentStatsAfterPruning()
+    thinned, graph, outputStack = skel.skeletonStack, skel.graph, skel.outputStack
+    skel.setPrunedSkeletonOutput()
+    skel.getNetworkGraph()
+    assert skel.skeletonStack is thinned and skel.graph is graph and skel.outputStack is outputStack
+    assert thinned is not outputStack
+    skel.setParameters(cutoff=3)
+    skel.setSegmentStatsAfterPruning()
+    assert skel.skeletonStack is thinned and skel.graph is graph and skel.outputStack is not outputStack
+    skel.setThinningOutput(mode="constant")
+    assert skel.skeletonStack is not thinned
+    # spacing of an array or a list is the same parameter as its tuple, only a different spacing changes the graph
+    skel = Skeleton(skeleton_testlib.get_tiny_loop_with_branches(), spacing=np.array([1., 1., 2.]))
+    skel.setSegmentStatsAfterPruning()
+    thinned, graph = skel.skeletonStack, skel.graph
+    assert graph.graph['spacing'] == (1, 1, 2)
+    skel.setParameters(spacing=[1, 1, 2])
+    skel.getNetworkGraph()
+    assert skel.skeletonStack is thinned and skel.graph is graph
+    skel.setParameters(spacing=np.array([1., 1., 3.]))
+    skel.getNetworkGraph()
+    assert skel.skeletonStack is thinned and skel.graph is not graph and skel.graph.graph['spacing'] == (1, 1, 3)
@@ -0,0 +1,226 @@
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from skeleton.networkx_graph_from_array import get_edges_near, get_nodes_and_edges, get_slab_nodes_and_edges
+
+"""
+Compact graph of a skeleton, integer arrays in place of the networkx graph keyed by coordinate tuples
+    nodes : raveled indices of the skeleton voxels in the array, sorted, a node is its row in them
+    edges : pairs of node rows, an edge is its row in them
+    adjacency : CSR arrays of the neighbor rows of every node and the edge of each neighbor
+Removed edges are only masked, the node arrays never change after the graph is built and edges are only
+appended, the graph of a skeleton is updated in place as voxels are removed from it.
+A networkx graph of any of its nodes is made only when it is asked for
+"""
+
+
+class SkeletonGraph:
+    """
+    Undirected graph of the voxels/pixels of a skeleton
+    Parameters
+    ----------
+    shape : tuple
+        shape of the skeleton array
+
+    nodeIds : numpy array
+        raveled indices of the nonzero voxels in the skeleton array, sorted
+
+    edges : numpy array
+        array of shape (number of edges, 2), rows in nodeIds of the two voxels of every edge
+
+    spacing : tuple
+        physical size of a voxel along each dimension, saved in the graph attributes as networkx graphs
+        of skeletons save it
+
+    Examples
+    ------
+           SkeletonGraph.coordinates - array of shape (number of nodes, number of dimensions) of the node voxels
+
+           SkeletonGraph.indptr, SkeletonGraph.indices - CSR adjacency, the neighbors of node i are
+                                                           indices[indptr[i]:indptr[i + 1]]
+
+           SkeletonGraph.edgeIndices - edge of every neighbor in indices
+
+           SkeletonGraph.edgeMask - False for the edges removed
+    """
+    def __init__(self, shape, nodeIds, edges, spacing=None):
+        self.shape = tuple(shape)
+        self.nodeIds = np.asarray(nodeIds, dtype=np.int64)
+        self.coordinates = np.column_stack(np.unravel_index(self.nodeIds, self.shape)).reshape(-1, len(self.shape))
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.edgeMask = np.ones(len(self.edges), dtype=bool)
+        self.graph = {}
+        if spacing is not None:
+            assert len(spacing) == len(self.shape), "spacing must have {} values, it is {}".format(len(self.shape), spacing)
+            self.graph['spacing'] = tuple(spacing)
+        self._setAdjacency()
+
+    def _setAdjacency(self):
+        # every edge is a neighbor of both of its nodes
+        rows = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        order = np.argsort(rows, kind='mergesort')
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(self.nodeIds)))]).astype(np.int64)
+        self.indices = np.concatenate([self.edges[:, 1], self.edges[:, 0]])[order]
+        self.edgeIndices = np.concatenate([np.arange(len(self.edges))] * 2)[order]
+
+    @classmethod
+    def fromNetworkx(cls, networkxGraph, shape):
+        """
+        Return SkeletonGraph of a networkx graph whose nodes are voxel coordinates in an array of shape
+        """
+        coordinates = np.array(networkxGraph.nodes(), dtype=np.int64).reshape(-1, len(shape))
+        nodeIds = np.sort(np.ravel_multi_index(coordinates.T, shape))
+        edges = np.array(networkxGraph.edges(), dtype=np.int64).reshape(-1, 2, len(shape))
+        edges = np.column_stack([np.searchsorted(nodeIds, np.ravel_multi_index(edges[:, end].T, shape))
+                                 for end in range(2)])
+        return cls(shape, nodeIds, edges, networkxGraph.graph.get('spacing'))
+
+    @classmethod
+    def fromArray(cls, binaryArr, spacing=None):
+        """
+        Return SkeletonGraph of a binary array after clique removal, same as get_networkx_graph_from_array gives
+        """
+        assert np.max(binaryArr) in [0, 1], "input must always be a binary array"
+        coordinates, edges = get_nodes_and_edges(binaryArr, remove_cliques=True)
+        return cls(binaryArr.shape, np.ravel_multi_index(coordinates.T, binaryArr.shape), edges, spacing)
+
+    @classmethod
+    def fromSlabs(cls, binaryArr, slabSize=64, spacing=None):
+        """
+        Return SkeletonGraph of a binary array after clique removal built a slab of slabSize slices
+        along the first dimension at a time, same as fromArray gives.
+        binaryArr can be memory-mapped or the path of a .npy file, only a slab and the slices around it
+        are read at a time, the memory needed is a slab and the arrays of the graph
+        """
+        if isinstance(binaryArr, str):
+            binaryArr = np.load(binaryArr, mmap_mode='r')
+        nodeIds = []
+        sources = []
+        targets = []
+        for start in range(0, binaryArr.shape[0], slabSize):
+            slabNodeIds, slabSources, slabTargets = get_slab_nodes_and_edges(
+                binaryArr, start, min(start + slabSize, binaryArr.shape[0]), remove_cliques=True)
+            nodeIds.append(slabNodeIds)
+            sources.append(slabSources)
+            targets.append(slabTargets)
+        # slabs are in raveled order, the node ids of all of them are sorted
+        nodeIds = np.concatenate(nodeIds) if nodeIds else np.zeros(0, dtype=np.int64)
+        edges = np.column_stack([np.searchsorted(nodeIds, np.concatenate(ends)) if ends else np.zeros(0, dtype=np.int64)
+                                 for ends in [sources, targets]])
+        return cls(binaryArr.shape, nodeIds, edges, spacing)
+
+    @property
+    def numberOfNodes(self):
+        return len(self.nodeIds)
+
+    @property
+    def numberOfEdges(self):
+        return int(np.count_nonzero(self.edgeMask))
+
+    def getNode(self, coordinate):
+        # row of the node of a voxel coordinate
+        nodeId = np.ravel_multi_index(tuple(coordinate), self.shape)
+        node = int(np.searchsorted(self.nodeIds, nodeId))
+        if node == len(self.nodeIds) or self.nodeIds[node] != nodeId:
+            raise KeyError(coordinate)
+        return node
+
+    def getEdges(self):
+        # array of shape (number of edges, 2) of the edges not removed
+        return self.edges[self.edgeMask]
+
+    def degree(self):
+        # number of edges not removed of every node
+        return np.bincount(self.getEdges().ravel(), minlength=len(self.nodeIds))
+
+    def neighbors(self, node):
+        # rows of the nodes joined to node by edges not removed
+        start, stop = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:stop][self.edgeMask[self.edgeIndices[start:stop]]]
+
+    def removeEdges(self, edges):
+        # masks edges, edge rows or a boolean array of all the edges
+        self.edgeMask[edges] = False
+
+    def addEdges(self, edges):
+        # appends edges, array of shape (number of edges, 2) of node rows
+        self.edges = np.concatenate([self.edges, np.asarray(edges, dtype=np.int64).reshape(-1, 2)])
+        self.edgeMask = np.concatenate([self.edgeMask, np.ones(len(self.edges) - len(self.edgeMask), dtype=bool)])
+        self._setAdjacency()
+
+    def removeNodes(self, nodes, padded=None):
+        """
+        Remove the edges of nodes, node rows or a boolean array of all the nodes, the nodes are left with no edges.
+        padded is the skeleton array padded with zeros by one voxel, if it is given the voxels of the nodes are
+        zeroed in it and the edges near them are traced again, the graph stays the graph of the array
+        after clique removal
+        """
+        isRemoved = np.zeros(len(self.nodeIds), dtype=bool)
+        isRemoved[nodes] = True
+        self.removeEdges(isRemoved[self.edges[:, 0]] | isRemoved[self.edges[:, 1]])
+        if padded is None:
+            return
+        removedIds = self.nodeIds[isRemoved]
+        padded[tuple(coordinate + 1 for coordinate in np.unravel_index(removedIds, self.shape))] = 0
+        nearIds, sources, targets = get_edges_near(padded, removedIds, remove_cliques=True)
+        # nodes are sorted by their voxels, the first voxel of an edge is its smaller node
+        isNear = np.zeros(len(self.nodeIds), dtype=bool)
+        isNear[np.searchsorted(self.nodeIds, nearIds)] = True
+        firsts = np.minimum(self.edges[:, 0], self.edges[:, 1])
+        seconds = np.maximum(self.edges[:, 0], self.edges[:, 1])
+        nearEdges = np.flatnonzero(self.edgeMask & isNear[firsts])
+        nearKeys = firsts[nearEdges] * len(self.nodeIds) + seconds[nearEdges]
+        tracedEdges = np.column_stack([np.searchsorted(self.nodeIds, sources), np.searchsorted(self.nodeIds, targets)])
+        tracedKeys = tracedEdges[:, 0] * len(self.nodeIds) + tracedEdges[:, 1]
+        self.removeEdges(nearEdges[~np.in1d(nearKeys, tracedKeys)])
+        newEdges = tracedEdges[~np.in1d(tracedKeys, nearKeys)]
+        if len(newEdges):
+            self.addEdges(newEdges)
+
+    def getSubgraph(self, nodes):
+        """
+        Return SkeletonGraph of the nodes, sorted rows, and the edges not removed between them
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        rows = np.full(len(self.nodeIds), -1, dtype=np.int64)
+        rows[nodes] = np.arange(len(nodes))
+        edges = rows[self.getEdges()]
+        return SkeletonGraph(self.shape, self.nodeIds[nodes], edges[np.all(edges >= 0, axis=1)], self.graph.get('spacing'))
+
+    def getComponents(self):
+        """
+        Return number of connected components and the component of every node
+        """
+        edges = self.getEdges()
+        adjacency = csr_matrix((np.ones(len(edges), dtype=bool), (edges[:, 0], edges[:, 1])),
+                               shape=(len(self.nodeIds),) * 2)
+        return connected_components(adjacency, directed=False)
+
+    def getComponentNodes(self):
+        # list of the arrays of the nodes of every connected component
+        count, labels = self.getComponents()
+        order = np.argsort(labels, kind='mergesort')
+        return np.split(order, np.cumsum(np.bincount(labels, minlength=count))[:-1])
+
+    def toNetworkx(self, nodes=None):
+        """
+        Return networkx graph of the nodes, all by default, and the edges not removed between them,
+        nodes are coordinate tuples as get_networkx_graph_from_array makes them
+        """
+        if nodes is None:
+            nodes = np.arange(len(self.nodeIds))
+            edges = self.getEdges()
+        else:
+            nodes = np.asarray(nodes, dtype=np.int64)
+            isIn = np.zeros(len(self.nodeIds), dtype=bool)
+            isIn[nodes] = True
+            edges = self.getEdges()
+            edges = edges[isIn[edges[:, 0]] & isIn[edges[:, 1]]]
+        coordinates = list(map(tuple, self.coordinates.tolist()))
+        networkxGraph = nx.Graph()
+        networkxGraph.graph.update(self.graph)
+        networkxGraph.add_nodes_from(coordinates[node] for node in nodes.tolist())
+        networkxGraph.add_edges_from((coordinates[source], coordinates[target]) for source, target in edges.tolist())
+        return networkxGraph
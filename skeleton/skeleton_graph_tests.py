@@ -0,0 +1,97 @@
+import os
+import tempfile
+
+import nose.tools
+import numpy as np
+
+from metrics.segmentStats import SegmentStats
+from skeleton import skeleton_testlib
+from skeleton.networkx_graph_from_array import get_networkx_graph_from_array
+from skeleton.pruning import getPrunedSkeleton
+from skeleton.skeleton_graph import SkeletonGraph
+
+
+def _get_edge_set(networkxGraph):
+    return set(map(frozenset, networkxGraph.edges()))
+
+
+def test_same_as_networkx():
+    for sampleImage in [skeleton_testlib.get_tiny_loop_with_branches(), skeleton_testlib.get_disjoint_crosses(),
+                        skeleton_testlib.get_single_voxel_line()]:
+        networkxGraph = get_networkx_graph_from_array(sampleImage)
+        skeletonGraph = SkeletonGraph.fromArray(sampleImage)
+        nose.tools.assert_equal(skeletonGraph.numberOfNodes, networkxGraph.number_of_nodes())
+        nose.tools.assert_equal(skeletonGraph.numberOfEdges, networkxGraph.number_of_edges())
+        networkxDegrees = networkxGraph.degree()
+        for node, coordinate in enumerate(map(tuple, skeletonGraph.coordinates)):
+            nose.tools.assert_equal(skeletonGraph.degree()[node], networkxDegrees[coordinate])
+            nose.tools.assert_equal({tuple(skeletonGraph.coordinates[neighbor])
+                                     for neighbor in skeletonGraph.neighbors(node)},
+                                    set(networkxGraph.neighbors(coordinate)))
+        converted = skeletonGraph.toNetworkx()
+        nose.tools.assert_equal(set(converted.nodes()), set(networkxGraph.nodes()))
+        nose.tools.assert_equal(_get_edge_set(converted), _get_edge_set(networkxGraph))
+
+
+def test_components_and_removed_edges():
+    skeletonGraph = SkeletonGraph.fromArray(skeleton_testlib.get_disjoint_crosses())
+    count, labels = skeletonGraph.getComponents()
+    nose.tools.assert_equal(count, 2)
+    nose.tools.assert_equal(sorted(map(len, skeletonGraph.getComponentNodes())), [9, 9])
+    center = skeletonGraph.getNode((0, 2, 2))
+    nose.tools.assert_equal(skeletonGraph.degree()[center], 4)
+    skeletonGraph.removeEdges(skeletonGraph.edgeIndices[skeletonGraph.indptr[center]:skeletonGraph.indptr[center + 1]])
+    nose.tools.assert_equal(skeletonGraph.degree()[center], 0)
+    nose.tools.assert_equal(len(skeletonGraph.neighbors(center)), 0)
+    nose.tools.assert_equal(skeletonGraph.getComponents()[0], 6)
+    nose.tools.assert_equal(skeletonGraph.toNetworkx().number_of_edges(), 12)
+    nose.tools.assert_raises(KeyError, skeletonGraph.getNode, (1, 2, 2))
+
+
+def test_pruning_and_stats():
+    sampleImage = skeleton_testlib.get_tiny_loop_with_branches()
+    networkxGraph = get_networkx_graph_from_array(sampleImage)
+    skeletonGraph = SkeletonGraph.fromNetworkx(networkxGraph, sampleImage.shape)
+    for cutoff in [1, 3, 9]:
+        np.testing.assert_array_equal(getPrunedSkeleton(sampleImage.copy(), skeletonGraph, cutoff),
+                                      getPrunedSkeleton(sampleImage.copy(), networkxGraph, cutoff))
+    stats = SegmentStats(networkxGraph)
+    stats.setStats()
+    csrStats = SegmentStats(skeletonGraph)
+    csrStats.setStats()
+    # segments are keyed by the nodes they are traced from, which depend on the order of the edges
+    np.testing.assert_allclose(sorted(csrStats.lengthDict.values()), sorted(stats.lengthDict.values()))
+    nose.tools.assert_equal(csrStats.typeGraphdict, stats.typeGraphdict)
+    nose.tools.assert_equal((csrStats.countEndPoints, csrStats.countBranchPoints),
+                            (stats.countEndPoints, stats.countBranchPoints))
+
+
+def test_slabs():
+    # graphs built slab by slab are the graphs of the whole arrays, cliques across slabs are removed alike
+    for shape in [(9, 7), (9, 6, 7)]:
+        sampleImage = np.random.random(shape) < 0.5
+        skeletonGraph = SkeletonGraph.fromArray(sampleImage)
+        expectedEdges = set(map(frozenset, skeletonGraph.nodeIds[skeletonGraph.edges].tolist()))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "skeleton.npy")
+            np.save(path, sampleImage)
+            for slabSize in [1, 2, 4, 20]:
+                slabGraph = SkeletonGraph.fromSlabs(path, slabSize)
+                np.testing.assert_array_equal(slabGraph.nodeIds, skeletonGraph.nodeIds)
+                nose.tools.assert_equal(set(map(frozenset, slabGraph.nodeIds[slabGraph.edges].tolist())), expectedEdges)
+
+
+def test_remove_nodes():
+    # removing nodes from the graph of an array traces the edges of the 3 vertex cliques near them again
+    sampleImage = np.random.random((8, 8, 8)) < 0.2
+    skeletonGraph = SkeletonGraph.fromArray(sampleImage)
+    padded = np.pad(sampleImage, 1, mode='constant')
+    removed = np.random.choice(skeletonGraph.numberOfNodes, skeletonGraph.numberOfNodes // 4, replace=False)
+    skeletonGraph.removeNodes(removed, padded)
+    nose.tools.assert_equal(np.count_nonzero(skeletonGraph.degree()[removed]), 0)
+    sampleImage[tuple(skeletonGraph.coordinates[removed].T)] = 0
+    np.testing.assert_array_equal(padded[1:-1, 1:-1, 1:-1], sampleImage)
+    expectedGraph = SkeletonGraph.fromArray(sampleImage)
+    subgraph = skeletonGraph.getSubgraph(np.setdiff1d(np.arange(skeletonGraph.numberOfNodes), removed))
+    np.testing.assert_array_equal(subgraph.nodeIds, expectedGraph.nodeIds)
+    nose.tools.assert_equal(set(map(frozenset, subgraph.getEdges().tolist())), set(map(frozenset, expectedGraph.edges.tolist())))
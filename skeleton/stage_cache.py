@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+import numpy as np
+
+import skeleton.io_tools as io_tools
+from skeleton.generate_lookup_array import get_templates_hash
+from skeleton.rotational_operators import LOOKUP_ARRAY_PATH
+from skeleton.skeleton_graph import SkeletonGraph
+from skeleton.thinning_extension import get_source_hash
+
+"""
+Content addressed cache of the outputs of the stages of skeletonization on disk
+    key : sha1 of the digest of the input array, the stage, its parameters and the version of the code
+    entry : compressed .npz file of the arrays of an output, binary arrays are packed 8 voxels to a byte
+            and graphs are saved as the raveled indices of their voxels and the rows of their edges
+Entries are written to a temporary file and renamed, processes sharing a directory never read half an entry.
+The least recently used entries are evicted once the entries are larger than the size limit, the modification
+time of an entry is the time it was last used
+"""
+
+# version of the format of the entries, changing it invalidates all of them
+CACHE_VERSION = 1
+
+# sources of the modules computing the stage outputs, they and all the modules of the package they import decide
+# the entries, the thinning extension is compiled from thinning.pyx and loaded by thinVolume without importing it
+STAGE_SOURCES = ["thinVolume.py", "thinning.pyx", "networkx_graph_from_array.py", "pruning.py", "skeleton_graph.py",
+                 "segment_graph.py", "binary_resample.py"]
+
+# modules of the package imported by a python or cython source, import skeleton.x, from skeleton.x (c)import ...
+# and from skeleton import x, y
+IMPORT_PATTERN = re.compile(r"^\s*(?:import\s+skeleton\.(\w+)|from\s+skeleton\.(\w+)\s+c?import|"
+                            r"from\s+skeleton\s+import[ \t]+([\w \t,]+))", re.MULTILINE)
+
+
+def _getImportedSources(sourceName):
+    # file names of the modules of the package a source imports
+    with open(io_tools.module_relative_path(sourceName), encoding="utf-8") as sourceFile:
+        source = sourceFile.read()
+    names = set()
+    for module, fromModule, fromNames in IMPORT_PATTERN.findall(source):
+        names.update([module, fromModule] + [name.strip() for name in fromNames.split(",")])
+    return {name + ".py" for name in names if name and os.path.exists(io_tools.module_relative_path(name + ".py"))}
+
+
+def getStageSources():
+    """
+    Return sorted file names of the sources of the package the stage outputs are computed with,
+    STAGE_SOURCES and all the modules they import one after the other
+    """
+    sources = set()
+    toVisit = list(STAGE_SOURCES)
+    while toVisit:
+        sourceName = toVisit.pop()
+        if sourceName not in sources:
+            sources.add(sourceName)
+            toVisit.extend(_getImportedSources(sourceName))
+    return sorted(sources)
+
+
+def getCodeVersion():
+    """
+    Return digest of the sources of the modules computing the stage outputs, the source of the compiled
+    thinning extension, the templates of the deletion rule and the lookup array generated from them
+    """
+    digest = hashlib.sha1(str(CACHE_VERSION).encode())
+    for sourceName in getStageSources():
+        with open(io_tools.module_relative_path(sourceName), "rb") as sourceFile:
+            digest.update(sourceFile.read())
+    digest.update(get_source_hash().encode())
+    digest.update(get_templates_hash().encode())
+    if os.path.exists(LOOKUP_ARRAY_PATH):
+        with open(LOOKUP_ARRAY_PATH, "rb") as lookupFile:
+            digest.update(lookupFile.read())
+    return digest.hexdigest()
+
+
+def _getJsonValue(value):
+    # json value of a numpy array or scalar among the parameters of a key, an array is keyed as its list
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError("parameter {!r} of type {} can not be keyed".format(value, type(value).__name__))
+
+
+def getArrayDigest(arr, slabSize=64):
+    """
+    Return sha1 hex digest of the shape, type and values of an array, read a slab of slabSize slices
+    along the first dimension at a time, arr can be memory-mapped
+    """
+    digest = hashlib.sha1("{} {}".format(arr.shape, arr.dtype.str).encode())
+    for start in range(0, arr.shape[0], slabSize):
+        digest.update(np.ascontiguousarray(arr[start:start + slabSize]).tobytes())
+    return digest.hexdigest()
+
+
+def packArray(arr, prefix=""):
+    # record of a binary array, 8 voxels to a byte
+    return {prefix + "packed": np.packbits(np.asarray(arr, dtype=bool).ravel()),
+            prefix + "shape": np.array(arr.shape, dtype=np.int64), prefix + "dtype": np.array(arr.dtype.str)}
+
+
+def unpackArray(record, prefix=""):
+    # binary array of a record of packArray
+    shape = tuple(record[prefix + "shape"].tolist())
+    values = np.unpackbits(record[prefix + "packed"])[:int(np.prod(shape))].reshape(shape)
+    return values.astype(str(record[prefix + "dtype"]))
+
+
+def packGraph(networkxGraph, shape, prefix=""):
+    # record of a networkx graph whose nodes are voxel coordinates in an array of shape
+    skeletonGraph = SkeletonGraph.fromNetworkx(networkxGraph, shape)
+    spacing = skeletonGraph.graph.get("spacing")
+    return {prefix + "nodeIds": skeletonGraph.nodeIds, prefix + "edges": skeletonGraph.edges,
+            prefix + "shape": np.array(shape, dtype=np.int64),
+            prefix + "spacing": np.array(spacing if spacing is not None else [], dtype=np.float64)}
+
+
+def unpackGraph(record, prefix=""):
+    # networkx graph of a record of packGraph
+    spacing = record[prefix + "spacing"]
+    return SkeletonGraph(tuple(record[prefix + "shape"].tolist()), record[prefix + "nodeIds"], record[prefix + "edges"],
+                         tuple(spacing.tolist()) if len(spacing) else None).toNetworkx()
+
+
+class StageCache:
+    """
+    Cache of stage outputs in a directory, shared by all the processes using it
+    Parameters
+    ----------
+    directory : str
+        directory of the entries, made if it does not exist
+
+    maxSize : int
+        size limit of the entries in bytes, 1 GiB by default
+
+    Examples
+    ------
+           key = cache.getKey(inputDigest, "thinned", {"mode": "reflect"})
+
+           cache.put(key, packArray(thinned)) - save an entry, evicting the least recently used ones
+
+           unpackArray(cache.get(key)) - the record saved, None if there is no entry of the key
+    """
+    def __init__(self, directory, maxSize=2 ** 30):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.codeVersion = getCodeVersion()
+        os.makedirs(directory, exist_ok=True)
+
+    def getKey(self, inputDigest, stage, parameters):
+        # hex key of the output of a stage of an input for parameters, a dictionary of json values or numpy arrays
+        description = json.dumps([self.codeVersion, inputDigest, stage, parameters], sort_keys=True,
+                                 default=_getJsonValue)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def _getPath(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """
+        Return record of an entry, dictionary of its arrays, None if there is none
+        """
+        path = self._getPath(key)
+        try:
+            with np.load(path) as entry:
+                record = {name: entry[name] for name in entry.files}
+            os.utime(path)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # no entry or an entry evicted by another process while it was read
+            return None
+        return record
+
+    def put(self, key, record):
+        # save a record of arrays as the entry of key
+        descriptor, temporaryPath = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(descriptor, "wb") as temporaryFile:
+            np.savez_compressed(temporaryFile, **record)
+        os.replace(temporaryPath, self._getPath(key))
+        self.evict()
+
+    def getEntries(self):
+        # list of (last used time, size, path) of the entries, least recently used first
+        entries = []
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(".npz"):
+                path = os.path.join(self.directory, fileName)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        # remove the least recently used entries until the entries are within the size limit
+        entries = self.getEntries()
+        size = sum(entrySize for _, entrySize, _ in entries)
+        for _, entrySize, path in entries:
+            if size <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entrySize
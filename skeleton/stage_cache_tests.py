@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+import nose.tools
+import numpy as np
+
+import skeleton.stage_cache as stage_cache
+
+from skeleton import skeleton_testlib
+from skeleton.networkx_graph_from_array import get_networkx_graph_from_array
+from skeleton.skeletonClass import Skeleton
+from skeleton.stage_cache import StageCache, getArrayDigest, packArray, packGraph, unpackArray, unpackGraph
+
+
+def _get_edge_set(networkxGraph):
+    return set(map(frozenset, networkxGraph.edges()))
+
+
+def test_records():
+    sampleImage = skeleton_testlib.get_tiny_loop_with_branches()
+    for arr in [sampleImage, sampleImage.astype(bool)]:
+        unpacked = unpackArray(packArray(arr))
+        np.testing.assert_array_equal(unpacked, arr)
+        nose.tools.assert_equal(unpacked.dtype, arr.dtype)
+    networkxGraph = get_networkx_graph_from_array(sampleImage, spacing=(1, 2, 0.5))
+    unpacked = unpackGraph(packGraph(networkxGraph, sampleImage.shape, "graph"), "graph")
+    nose.tools.assert_equal(set(unpacked.nodes()), set(networkxGraph.nodes()))
+    nose.tools.assert_equal(_get_edge_set(unpacked), _get_edge_set(networkxGraph))
+    nose.tools.assert_equal(unpacked.graph, {'spacing': (1, 2, 0.5)})
+    changed = sampleImage.copy()
+    changed[0, 0, 0] = 1 - changed[0, 0, 0]
+    nose.tools.assert_not_equal(getArrayDigest(sampleImage), getArrayDigest(changed))
+    nose.tools.assert_equal(getArrayDigest(sampleImage), getArrayDigest(sampleImage.copy(), slabSize=1))
+
+
+def test_code_version():
+    # the modules the thinning imports and the templates of its deletion rule change the keys
+    sources = stage_cache.getStageSources()
+    for sourceName in ["deletion_rules.py", "generate_lookup_array.py", "decision_diagram.py", "numpy_thinning.py",
+                       "bitsliced_thinning.py", "thinning_extension.py", "bitVolume.py", "thinning.pyx"]:
+        nose.tools.assert_in(sourceName, sources)
+    codeVersion = stage_cache.getCodeVersion()
+    getTemplatesHash = stage_cache.get_templates_hash
+    try:
+        stage_cache.get_templates_hash = lambda: "changed templates"
+        nose.tools.assert_not_equal(stage_cache.getCodeVersion(), codeVersion)
+    finally:
+        stage_cache.get_templates_hash = getTemplatesHash
+
+
+def test_least_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = StageCache(directory)
+        keys = [cache.getKey("input", "thinned", {"mode": mode}) for mode in ["reflect", "constant", "wrap"]]
+        nose.tools.assert_equal(len(set(keys)), 3)
+        # numpy parameters are keyed as their values
+        nose.tools.assert_equal(cache.getKey("input", "graph", {"spacing": np.array([1., 1., 2.])}),
+                                cache.getKey("input", "graph", {"spacing": (1., 1., 2.)}))
+        for time, key in enumerate(keys):
+            cache.put(key, {"values": np.full(1000, time)})
+            os.utime(cache._getPath(key), (time, time))
+        cache.get(keys[0])
+        # a size limit of two entries evicts the entry used longest ago
+        cache.maxSize = sum(size for _, size, _ in cache.getEntries()) - 1
+        cache.evict()
+        nose.tools.assert_is_none(cache.get(keys[1]))
+        np.testing.assert_array_equal(cache.get(keys[0])["values"], 0)
+        np.testing.assert_array_equal(cache.get(keys[2])["values"], 2)
+
+
+def test_skeleton_cache():
+    # a second Skeleton of the same input loads the stages the first one saved
+    sampleImage = skeleton_testlib.get_tiny_loop_with_branches()
+    expected = Skeleton(sampleImage)
+    expected.getNetworkGraph()
+    with tempfile.TemporaryDirectory() as directory:
+        for iterativePruning in [False, True]:
+            for run in range(2):
+                skel = Skeleton(sampleImage, cacheDir=directory, iterativePruning=iterativePruning)
+                skel.getNetworkGraph()
+                np.testing.assert_array_equal(skel.skeletonStack, expected.skeletonStack)
+                nose.tools.assert_equal(skel.skeletonStack.dtype, expected.skeletonStack.dtype)
+                nose.tools.assert_equal(_get_edge_set(skel.graph), _get_edge_set(expected.graph))
+                if not iterativePruning:
+                    np.testing.assert_array_equal(skel.outputStack, expected.outputStack)
+                    nose.tools.assert_equal(_get_edge_set(skel.outputGraph), _get_edge_set(expected.outputGraph))
+        # thinned, graph, pruned and pruned graph of both pruning modes, thinning and the graph are shared
+        nose.tools.assert_equal(len(skel._cache.getEntries()), 6)
+
+
+def test_array_spacing():
+    # a spacing array is the same parameter as its tuple, cached stages of either are shared
+    sampleImage = skeleton_testlib.get_tiny_loop_with_branches()
+    with tempfile.TemporaryDirectory() as directory:
+        skel = Skeleton(sampleImage, spacing=np.array([1., 1., 2.]), cacheDir=directory)
+        skel.setSegmentStatsAfterPruning()
+        nose.tools.assert_equal(skel.outputGraph.graph, {'spacing': (1, 1, 2)})
+        numEntries = len(skel._cache.getEntries())
+        cached = Skeleton(sampleImage, spacing=(1, 1, 2), cacheDir=directory)
+        cached.setSegmentStatsAfterPruning()
+        nose.tools.assert_equal(len(cached._cache.getEntries()), numEntries)
+        nose.tools.assert_equal(_get_edge_set(cached.outputGraph), _get_edge_set(skel.outputGraph))
@@ -1,10 +1,20 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import numpy as np
+from scipy import ndimage
 from skimage.morphology import skeletonize
-# NOTE This does the pyx compilation of this extension
-import pyximport; pyximport.install() # NOQA
-import skeleton.thinning as thinning
+from skeleton.bitVolume import BitVolume
+from skeleton.bitsliced_thinning import get_thinned_bitsliced
+from skeleton.numpy_thinning import get_thinned_numpy
+from skeleton.thinning_checkpoint import ThinningCheckpoint
+from skeleton.thinning_extension import load_thinning
 
 """
 Thinning algorithm as described in
@@ -13,35 +23,401 @@ Volume 61, Issue 4, July 1999, Pages 199-221 Attila Kuba, 1999
 z is the nth image of the stack in 3D array and is the first dimension in this program
 """
 
+# NOTE compiled extension built in place, cached or compiled once, None if it can not be compiled
+thinning = load_thinning()
 
-def get_thinned(binaryArr, mode: str='reflect', cval=0):
+# engines of thinning.cy_get_thinned_3d, thinned by the numpy engine if the extension is not available
+EXTENSION_ENGINES = ('config', 'convolve', 'frontier', 'parallel')
+
+# and the bitsliced engine that evaluates the templates on bit-packed words
+ENGINES = EXTENSION_ENGINES + ('bitsliced', 'numpy')
+
+
+def _resume(binaryArr, resume, thinningCheckpoint):
+    """
+    Return (number of iterations done, binary array) of the last checkpoint in resume,
+    (0, binaryArr) if there is none yet
+    """
+    if thinningCheckpoint is not None and os.path.abspath(resume) == os.path.abspath(thinningCheckpoint.path):
+        # checkpoints of the resumed run are saved next to the ones it resumes from
+        state = thinningCheckpoint.load()
+    else:
+        state = ThinningCheckpoint(resume, binaryArr.shape).load()
+    if state is None:
+        return 0, binaryArr
+    print("Resuming from checkpoint of iteration %i in %s" % (state[0], resume))
+    return state
+
+
+def get_thinned(binaryArr, mode: str='reflect', cval=0, engine: str='config', numThreads: int=0, rule: str='table',
+                checkpoint=None, checkpointIterations: int=0, checkpointSeconds: float=0, resume=None):
     """
     Return thinned output
     Parameters
     ----------
-    binaryArr : Numpy array
-        2D or 3D binary numpy array
+    binaryArr : Numpy array or bitVolume.BitVolume
+        2D or 3D binary numpy array, or a bit-packed 3D volume
+
+    mode : string
+        boundary mode, can be either 'constant' or 'reflect'
+
+    cval : int
+        value to pad with if mode is 'constant'
+
+    engine : string
+        thinning engine of 3D arrays, one of ENGINES, 'config' by default
+
+    numThreads : int
+        number of threads of the 'parallel' engine, 0 uses the OpenMP default
+
+    rule : string
+        deletion rule of all the engines but 'bitsliced', one of deletion_rules.RULES, 'table' by default
+
+    checkpoint : str
+        path of the .npy file checkpoints of a 3D numpy array are saved to, by all the engines but 'bitsliced',
+        resume if resume is given and checkpoint is not
+
+    checkpointIterations : int
+        saves a checkpoint every checkpointIterations iterations, never if 0
+
+    checkpointSeconds : float
+        saves a checkpoint after the first iteration that ends checkpointSeconds seconds after the last one,
+        never if 0
+
+    resume : str
+        path of the checkpoints of a run of get_thinned on the same binaryArr that was killed, thinning
+        continues from the last of them, or from binaryArr if there is none yet
 
     Returns
     -------
-    result : boolean Numpy array
-        2D or 3D binary thinned numpy array of the same shape
+    result : boolean Numpy array or bitVolume.BitVolume
+        2D or 3D binary thinned numpy array of the same shape, a new BitVolume if binaryArr is one
     """
+    assert engine in ENGINES, "engine must be one of {}, it is {}".format(ENGINES, engine)
+    if engine in EXTENSION_ENGINES and thinning is None:
+        engine = 'numpy'
+    if checkpoint is None:
+        checkpoint = resume
+    thinningCheckpoint = None
+    if checkpoint is not None:
+        assert not isinstance(binaryArr, BitVolume) and binaryArr.ndim == 3 and engine != 'bitsliced', \
+            "checkpoints are saved of 3D numpy arrays by the engines of the extension and the numpy engine"
+        thinningCheckpoint = ThinningCheckpoint(checkpoint, binaryArr.shape, checkpointIterations, checkpointSeconds)
+    startIteration = 0
+    if resume is not None:
+        startIteration, binaryArr = _resume(binaryArr, resume, thinningCheckpoint)
+    if isinstance(binaryArr, BitVolume):
+        voxCount = binaryArr.countNonzero()
+        if voxCount == 0 or voxCount == binaryArr.size:
+            return binaryArr.copy()
+        start_time = time.time()
+        if engine == 'bitsliced':
+            result = get_thinned_bitsliced(binaryArr, mode, cval)
+        elif engine == 'numpy':
+            result = BitVolume.fromArray(get_thinned_numpy(binaryArr.toArray(), mode, cval, rule))
+        else:
+            result = thinning.cy_get_thinned_3d(binaryArr.copy(), mode, cval, engine, numThreads, rule)
+        print("thinned %i number of pixels in %0.2f seconds" % (voxCount, time.time() - start_time))
+        return result
     assert np.max(binaryArr) in [0, 1], "input must always be a binary array"
     voxCount = np.sum(binaryArr)
     if voxCount == 0 or voxCount == binaryArr.size:
         return binaryArr
     elif len(binaryArr.shape) == 2:
         return skeletonize(binaryArr).astype(bool)
+    elif engine == 'bitsliced':
+        return get_thinned(BitVolume.fromArray(binaryArr), mode, cval, engine).toArray()
     else:
         start_time = time.time()
-        # cast to uint64 to make configuration number calculation return the right range of values
-        result = thinning.cy_get_thinned_3d(np.uint64(binaryArr), mode, cval)
+        if engine == 'numpy':
+            result = get_thinned_numpy(binaryArr, mode, cval, rule, thinningCheckpoint, startIteration)
+        else:
+            # thinned in place, on a copy of one byte per voxel
+            result = thinning.cy_get_thinned_3d(np.array(binaryArr, dtype=bool), mode, cval, engine, numThreads,
+                                                rule, thinningCheckpoint, startIteration)
         print(
             "thinned %i number of pixels in %0.2f seconds" % (voxCount, time.time() - start_time))
+        if thinningCheckpoint is not None:
+            print("saved %i checkpoints in %0.2f seconds" % (thinningCheckpoint.numSaved, thinningCheckpoint.totalTime))
         return result
 
 
+def _thin_batch_item(binaryArr, mode, cval, engine, rule, workspaces):
+    # thinned binaryArr of get_thinned_batch, with the workspace of the thread
+    binaryArr = np.asarray(binaryArr)
+    if binaryArr.dtype != bool:
+        assert np.max(binaryArr) in [0, 1], "input must always be a binary array"
+    voxCount = np.count_nonzero(binaryArr)
+    if voxCount == 0 or voxCount == binaryArr.size:
+        return binaryArr.astype(bool)
+    if binaryArr.ndim != 3 or engine not in EXTENSION_ENGINES or thinning is None:
+        return get_thinned(binaryArr, mode, cval, engine, rule=rule)
+    if not hasattr(workspaces, 'workspace'):
+        workspaces.workspace = thinning.ThinningWorkspace()
+    # thinned in place, on a copy of one byte per voxel
+    return thinning.cy_get_thinned_3d(np.array(binaryArr, dtype=bool), mode, cval, engine, 1, rule,
+                                      workspace=workspaces.workspace, verbose=False)
+
+
+def get_thinned_batch(binaryArrs, mode: str='reflect', cval=0, engine: str='config', rule: str='table',
+                      workers: int=1):
+    """
+    Return generator of the thinned outputs of many binary arrays, in the order of binaryArrs
+    Parameters
+    ----------
+    binaryArrs : iterable of Numpy arrays
+        binary numpy arrays, usually thousands of small 3D cubelets, read as they are thinned
+
+    mode : string
+        boundary mode, can be either 'constant' or 'reflect'
+
+    cval : int
+        value to pad with if mode is 'constant'
+
+    engine : string
+        thinning engine, one of ENGINES, 'config' by default. The 'parallel' engine runs on one thread
+
+    rule : string
+        deletion rule, one of deletion_rules.RULES, 'table' by default
+
+    workers : int
+        number of threads thinning arrays at once
+
+    Returns
+    -------
+    results : generator of boolean Numpy arrays
+        same as get_thinned gives for each of binaryArrs
+
+    Notes
+    -----
+    Every thread thins its arrays with a thinning.ThinningWorkspace, the buffers of one are reused by
+    the next, and nothing is printed per array. The extension releases the GIL while thinning, all the threads
+    share the lookup array. At most 2 * workers arrays are read ahead of the result yielded
+    """
+    assert engine in ENGINES, "engine must be one of {}, it is {}".format(ENGINES, engine)
+    assert mode in ['reflect', 'constant'], "mode must be either 'constant' or 'reflect', it is {}".format(mode)
+    thinItem = partial(_thin_batch_item, mode=mode, cval=cval, engine=engine, rule=rule, workspaces=threading.local())
+    if workers == 1:
+        for binaryArr in binaryArrs:
+            yield thinItem(binaryArr)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for binaryArr in binaryArrs:
+            pending.append(executor.submit(thinItem, binaryArr))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _get_component_crops(binaryArr):
+    """
+    Return list of (tuple of slices, boolean Numpy array) of the 26-connected components of binaryArr,
+    each cropped to its bounding box grown by one voxel of background inside binaryArr, largest first
+    """
+    labels, _ = ndimage.label(binaryArr, structure=np.ones((3, 3, 3), dtype=bool))
+    crops = []
+    for label, box in enumerate(ndimage.find_objects(labels), 1):
+        box = tuple(slice(max(item.start - 1, 0), min(item.stop + 1, extent))
+                    for item, extent in zip(box, binaryArr.shape))
+        crops.append((box, labels[box] == label))
+    crops.sort(key=lambda crop: crop[1].size, reverse=True)
+    return crops
+
+
+def _thin_crop(crop, mode, cval, engine, rule):
+    # thinned crop of a component, module level so the processes of a pool can unpickle it
+    box, componentArr = crop
+    return box, get_thinned(componentArr, mode, cval, engine, rule=rule)
+
+
+def _is_on_faces(componentArr):
+    # True if a voxel of the crop is on one of its faces, only the faces on the edges of the array can have any
+    return componentArr[[0, -1]].any() or componentArr[:, [0, -1]].any() or componentArr[:, :, [0, -1]].any()
+
+
+def _thin_crops_here(crops, thinCrop, mode):
+    # generator of the thinned crops, components of one or two voxels are already thin unless
+    # 'reflect' repeats their voxels in the padding
+    for box, componentArr in crops:
+        if np.count_nonzero(componentArr) <= 2 and (mode == 'constant' or not _is_on_faces(componentArr)):
+            yield box, componentArr
+        else:
+            yield thinCrop((box, componentArr))
+
+
+def get_thinned_components(binaryArr, mode: str='reflect', cval=0, engine: str='config', rule: str='table',
+                           numProcesses=None, minPoolSize=4096):
+    """
+    Return thinned output of a 3D binary array thinned one 26-connected component at a time
+    Parameters
+    ----------
+    binaryArr : Numpy array
+        3D binary numpy array
+
+    mode : string
+        boundary mode, can be either 'constant' or 'reflect'
+
+    cval : int
+        value to pad with if mode is 'constant'
+
+    engine : string
+        thinning engine of the components, one of ENGINES, 'config' by default
+
+    rule : string
+        deletion rule, one of deletion_rules.RULES, 'table' by default
+
+    numProcesses : int
+        number of processes thinning the components, all the cpus by default, 1 thins them in this process
+
+    minPoolSize : int
+        components with fewer voxels in their bounding box are thinned in this process, cheaper than
+        sending them to the pool
+
+    Returns
+    -------
+    result : boolean Numpy array
+        3D binary thinned numpy array of the same shape, identical to get_thinned(binaryArr)
+
+    Notes
+    -----
+    A voxel is deleted or not by its 26 neighbors, which all belong to its own component or to the
+    padding, so every component is thinned on its own in its bounding box with a margin of background.
+    Components of one or two voxels away from the edges are never thinned, none of their voxels has more
+    than one neighbor.
+    With mode 'constant' and cval 1 the padding of a crop is not background and the whole array is thinned
+    """
+    assert binaryArr.ndim == 3, "component thinning needs a 3D array, it has {} dimensions".format(binaryArr.ndim)
+    assert mode in ['reflect', 'constant'], "mode must be either 'constant' or 'reflect', it is {}".format(mode)
+    if mode == 'constant' and cval:
+        return get_thinned(np.array(binaryArr, dtype=bool), mode, cval, engine, rule=rule)
+    start_time = time.time()
+    crops = _get_component_crops(binaryArr)
+    result = np.zeros(binaryArr.shape, dtype=bool)
+    thinCrop = partial(_thin_crop, mode=mode, cval=cval, engine=engine, rule=rule)
+    pooledCrops = [] if numProcesses == 1 else [crop for crop in crops if crop[1].size >= minPoolSize]
+    if len(pooledCrops) < 2:
+        # a single large component is thinned as fast here
+        pooledCrops = []
+    thinnedCrops = _thin_crops_here(crops[len(pooledCrops):], thinCrop, mode)
+    if pooledCrops:
+        with multiprocessing.get_context("spawn").Pool(processes=numProcesses) as pool:
+            # largest components start first, so the processes are never left waiting on one of them,
+            # the small ones are thinned here meanwhile
+            for box, thinnedArr in itertools.chain(thinnedCrops, pool.imap_unordered(thinCrop, pooledCrops)):
+                result[box] |= thinnedArr
+    else:
+        for box, thinnedArr in thinnedCrops:
+            result[box] |= thinnedArr
+    print("thinned %i components in %0.2f seconds" % (len(crops), time.time() - start_time))
+    return result
+
+
+def _get_tiles(shape, tileShape):
+    """
+    Return list of (grid index, tuple of slices) of the tiles covering an array of shape
+    """
+    ranges = [range(0, extent, tileExtent) for extent, tileExtent in zip(shape, tileShape)]
+    return [(tuple(start // tileExtent for start, tileExtent in zip(starts, tileShape)),
+             tuple(slice(start, min(start + tileExtent, extent))
+                   for start, tileExtent, extent in zip(starts, tileShape, shape)))
+            for starts in itertools.product(*ranges)]
+
+
+def _get_tile_block(stateArr, tile, mode, cval):
+    """
+    Return C contiguous copy of a tile of stateArr with one voxel of its neighbors on each side,
+    padded as in mode at the edges of stateArr
+    """
+    halo = tuple(slice(max(item.start - 1, 0), min(item.stop + 1, extent))
+                 for item, extent in zip(tile, stateArr.shape))
+    block = np.array(stateArr[halo], dtype=np.uint8)
+    padWidth = [(int(item.start == 0), int(item.stop == extent)) for item, extent in zip(tile, stateArr.shape)]
+    if mode == 'reflect':
+        block = np.pad(block, padWidth, mode='edge')
+    else:
+        block = np.pad(block, padWidth, mode='constant', constant_values=cval * thinning.TILE_FOREGROUND)
+    return np.ascontiguousarray(block)
+
+
+def get_thinned_tiled(binaryArr, outputPath, tileShape=(128, 128, 128), mode: str='reflect', cval=0):
+    """
+    Return thinned output of a 3D binary array thinned one tile at a time
+    Parameters
+    ----------
+    binaryArr : Numpy array
+        3D binary numpy array, usually a memory-mapped array from io_tools.load_memmap
+
+    outputPath : str
+        path of the .npy file the result is memory-mapped to
+
+    tileShape : tuple
+        shape of the tiles, only a tile and the voxels around it are in memory at a time
+
+    mode : string
+        boundary mode, can be either 'constant' or 'reflect'
+
+    cval : int
+        value to pad with if mode is 'constant'
+
+    Returns
+    -------
+    result : memory-mapped boolean Numpy array
+        3D binary thinned numpy array of the same shape as binaryArr, identical to get_thinned(binaryArr)
+
+    Notes
+    -----
+    The output file holds the flags of every voxel while thinning, every subiteration reads each
+    active tile with one voxel of its neighbors, marks the voxels to delete and deletes the marks of the
+    previous subiteration. Tiles are active if voxels were deleted in them or in their neighbor tiles in
+    this or the previous iteration
+    """
+    assert binaryArr.ndim == 3, "tiled thinning needs a 3D array, it has {} dimensions".format(binaryArr.ndim)
+    assert mode in ['reflect', 'constant'], "mode must be either 'constant' or 'reflect', it is {}".format(mode)
+    assert thinning is not None, "tiled thinning needs the compiled thinning extension"
+    start_time = time.time()
+    result = np.lib.format.open_memmap(outputPath, mode='w+', dtype=bool, shape=binaryArr.shape)
+    stateArr = result.view(np.uint8)
+    tiles = _get_tiles(binaryArr.shape, tileShape)
+    gridShape = tuple(max(index) + 1 for index in zip(*(gridIndex for gridIndex, tile in tiles)))
+    changedTiles = np.zeros(gridShape, dtype=bool)
+    for gridIndex, tile in tiles:
+        tileArr = np.asarray(binaryArr[tile])
+        assert np.max(tileArr) in [0, 1], "input must always be a binary array"
+        stateArr[tile] = tileArr
+        changedTiles[gridIndex] = tileArr.any()
+    voxCount = 0
+    step = 0
+    numVoxelsRemoved = 1
+    while numVoxelsRemoved > 0:
+        iter_time = time.time()
+        previousChangedTiles = changedTiles
+        changedTiles = np.zeros(gridShape, dtype=bool)
+        numVoxelsRemoved = 0
+        for direction in range(12):
+            appliedMark = thinning.TILE_MARKS[(step - 1) % 2]
+            newMark = thinning.TILE_MARKS[step % 2]
+            activeTiles = ndimage.binary_dilation(previousChangedTiles | changedTiles, np.ones((3, 3, 3), dtype=bool))
+            for gridIndex, tile in tiles:
+                if not activeTiles[gridIndex]:
+                    continue
+                block = _get_tile_block(stateArr, tile, mode, cval)
+                numMarked = thinning.cy_thin_block(block, direction, appliedMark, newMark, direction == 0)
+                stateArr[tile] = block[1:-1, 1:-1, 1:-1]
+                if numMarked:
+                    changedTiles[gridIndex] = True
+                    numVoxelsRemoved += numMarked
+            step += 1
+        voxCount += numVoxelsRemoved
+        print("Finished iteration %i, %0.2f s, removed %i pixels" % (step // 12, time.time() - iter_time, numVoxelsRemoved))
+    for gridIndex, tile in tiles:
+        stateArr[tile] &= thinning.TILE_FOREGROUND
+    result.flush()
+    print("thinned %i number of pixels in %0.2f seconds" % (voxCount, time.time() - start_time))
+    return result
+
+
 if __name__ == '__main__':
     sample = np.ones((5, 5, 5), dtype=np.uint8)
     resultSkel = get_thinned(sample)
@@ -1,4 +1,6 @@
 import itertools
+import os
+import tempfile
 
 import nose.tools
 import numpy as np
@@ -301,3 +303,35 @@ def test_wide_lines():
             # all points are in the center of the thick line
             nose.tools.assert_in(center, p1)
             nose.tools.assert_in(center, p2)
+
+
+def test_tiled_random_images():
+    for image, mode in zip(get_rand_images(), itertools.cycle(['reflect', 'constant'])):
+        expected_result = thin_volume.get_thinned(image.copy(), mode=mode)
+        with tempfile.TemporaryDirectory() as directory:
+            for tile_shape in [(8, 8, 8), (10, 7, 25), (4, 30, 6)]:
+                result = thin_volume.get_thinned_tiled(image, os.path.join(directory, "thinned.npy"),
+                                                       tile_shape, mode=mode)
+                np.testing.assert_array_equal(result, expected_result)
+
+
+def test_components_random_images():
+    components = ndimage.gaussian_filter(np.random.uniform(size=(30, 40, 50)), 1.5) > 0.6
+    for image in get_rand_images() + [components]:
+        for mode, cval in [('reflect', 0), ('constant', 0), ('constant', 1)]:
+            expected_result = thin_volume.get_thinned(image.copy(), mode=mode, cval=cval)
+            for num_processes in [1, 2]:
+                result = thin_volume.get_thinned_components(image, mode=mode, cval=cval,
+                                                            numProcesses=num_processes, minPoolSize=64)
+                np.testing.assert_array_equal(result, expected_result, err_msg="{} {}".format(mode, cval))
+
+
+def test_batch_random_images():
+    images = get_rand_images() + [ndimage.gaussian_filter(np.random.uniform(size=(20, 24, 16)), 1.5) > 0.5,
+                                  np.zeros((5, 5, 5), dtype=bool), np.ones((5, 5, 5), dtype=np.uint8)]
+    for mode, cval in [('reflect', 0), ('constant', 0), ('constant', 1)]:
+        expected_results = [thin_volume.get_thinned(image.copy(), mode=mode, cval=cval) for image in images]
+        for workers in [1, 3]:
+            results = thin_volume.get_thinned_batch(iter(images), mode=mode, cval=cval, workers=workers)
+            for result, expected_result in itertools.zip_longest(results, expected_results):
+                np.testing.assert_array_equal(result, expected_result, err_msg="{} {}".format(mode, cval))
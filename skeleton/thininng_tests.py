@@ -1,3 +1,6 @@
+import subprocess
+import sys
+
 import nose.tools
 import numpy as np
 import scipy.ndimage.filters as sci_filter
@@ -63,6 +66,60 @@ def test_cy_convole_vs_scipy():
     nose.tools.assert_equal(result[1], np_result[0, 0, 0])
 
 
+def test_cy_convolve_all_points_vs_scipy():
+    small_domain = np.random.randint(2, size=(4, 5, 6)).astype(np.uint64)
+    kernel = np.random.randint(2, size=(3, 3, 3)).astype(np.uint64)
+    points = np.ascontiguousarray(np.transpose(np.nonzero(np.ones(small_domain.shape))), dtype=np.int)
+    for mode in ['constant', 'reflect']:
+        np_result = sci_filter.convolve(small_domain, kernel, mode=mode, cval=0)
+        result = thinning.cy_convolve(small_domain, kernel[::-1, ::-1, ::-1], points, mode, 0)
+        np.testing.assert_array_equal(result, np_result.ravel())
+
+
+def test_cy_get_thinned_3d_engines():
+    # every engine must remove the same voxels
+    blob = sci_filter.gaussian_filter(np.random.uniform(size=(20, 22, 24)), 2) > 0.5
+    for mode in ['constant', 'reflect']:
+        expected_result = thinning.cy_get_thinned_3d(blob.astype(np.uint64), mode, 0, 'convolve')
+        for engine in thinning.ENGINES:
+            for rule in thinning.RULES:
+                result = thinning.cy_get_thinned_3d(blob.astype(np.uint64), mode, 0, engine, 0, rule)
+                np.testing.assert_array_equal(result, expected_result, err_msg="{} {} {}".format(engine, mode, rule))
+
+
+def test_only_rule_loaded():
+    # thinning by one rule never builds the other one, in a new process where neither is loaded yet
+    script = """
+import numpy as np
+import skeleton.deletion_rules as deletion_rules
+from skeleton.thinning_extension import load_thinning
+blob = np.zeros((9, 9, 9), dtype=np.uint8)
+blob[2:7, 2:7, 2:7] = 1
+load_thinning().cy_get_thinned_3d(blob, 'constant', 0, 'config', 0, '{}')
+print(deletion_rules._PACKED_LOOKUP_ARRAY is None, deletion_rules._DELETION_DIAGRAM is None)
+"""
+    for rule, loaded in [('diagram', 'True False'), ('table', 'False True')]:
+        output = subprocess.check_output([sys.executable, '-c', script.format(rule)], universal_newlines=True)
+        nose.tools.assert_equal(output.strip().splitlines()[-1], loaded)
+
+
+def test_lookup():
+    # bit-packed lookup array gives the same flags as lookuparray.npz
+    with np.load(rop.LOOKUP_ARRAY_PATH) as lua:
+        lookup_array = lua["lua"]
+    configs = np.concatenate([np.arange(2 ** 16), np.random.randint(2 ** 26, size=2 ** 16)])
+    np.testing.assert_array_equal(thinning.lookup(configs), lookup_array[configs])
+    nose.tools.assert_equal(thinning.get_lookup_array().nbytes, 2 ** 23)
+
+
+def test_cy_get_thinned_3d_parallel_threads():
+    # result of the parallel engine must not depend on the number of threads
+    blob = sci_filter.gaussian_filter(np.random.uniform(size=(24, 20, 22)), 2) > 0.5
+    expected_result = thinning.cy_get_thinned_3d(blob.astype(np.uint64), 'reflect', 0, 'parallel', 1)
+    for num_threads in [2, 3, 8]:
+        result = thinning.cy_get_thinned_3d(blob.astype(np.uint64), 'reflect', 0, 'parallel', num_threads)
+        np.testing.assert_array_equal(result, expected_result, err_msg="{} threads".format(num_threads))
+
 # def test_cy_convolve_harder():
 #     cylinder_radius = 5
 #     shape = (32, 32, 32)
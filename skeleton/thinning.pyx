@@ -2,25 +2,596 @@ import time
 
 import numpy as np
 cimport cython
+cimport openmp
+from cython.parallel cimport prange
 
 import skeleton.rotational_operators as rotational_operators
-import skeleton.image_tools as image_tools
+from skeleton.bitVolume import BitVolume
+from skeleton.deletion_rules import RULES, get_deletion_diagram, get_lookup_array, lookup
 """
 cython convolve to speed up thinning
+
+All the kernels below work on a copy of the input padded by one voxel on every side,
+the padding holds the boundary condition ('reflect' or 'constant'), so the 27 neighbors
+of any interior voxel are at fixed flat offsets from it and no bounds checks are needed
 """
-with np.load(rotational_operators.LOOKUP_ARRAY_PATH)as lua:
-    LOOKUP_ARRAY = lua["lua"]
 
 
 SELEMENT = np.array([[[False, False, False], [False,  True, False], [False, False, False]],
                      [[False,  True, False], [True,  False,  True], [False,  True, False]],
                      [[False, False, False], [False,  True, False], [False, False, False]]], dtype=np.uint64)
 
+ENGINES = ('config', 'convolve', 'frontier', 'parallel')
+
+# 12 direction kernels flattened in the order of rotational_operators.POSITION_VECTORS
+DIRECTION_KERNELS = np.ascontiguousarray([kernel.ravel() for kernel in rotational_operators.DIRECTIONS_LIST],
+                                         dtype=np.uint64)
+
+# (z, x, y) increments of the 27 voxels in a 3 x 3 x 3 neighborhood, same order as POSITION_VECTORS
+cdef Py_ssize_t POSITION_TABLE[27][3]
+for _n, _position_vector in enumerate(rotational_operators.POSITION_VECTORS):
+    POSITION_TABLE[_n][0], POSITION_TABLE[_n][1], POSITION_TABLE[_n][2] = _position_vector
+
+# bit each of the 27 neighbors sets in the configuration number of every direction, -1 for the center voxel
+DIRECTION_BITS = [[int(weight).bit_length() - 1 for weight in kernel] for kernel in DIRECTION_KERNELS]
+
+# configuration number of the first direction is read from the neighborhood, configuration numbers of all
+# the 12 directions are a permutation of its 26 bits, looked up one byte at a time
+cdef int CONFIG_BIT[27]
+cdef unsigned int PERMUTATION_TABLE[12][4][256]
+for _n in range(27):
+    CONFIG_BIT[_n] = DIRECTION_BITS[0][_n]
+for _direction in range(12):
+    _permutation = {DIRECTION_BITS[0][_n]: DIRECTION_BITS[_direction][_n] for _n in range(27) if _n != 13}
+    for _byte in range(4):
+        for _value in range(256):
+            PERMUTATION_TABLE[_direction][_byte][_value] = sum(
+                1 << _permutation[8 * _byte + _bit] for _bit in range(8)
+                if (_value >> _bit) & 1 and 8 * _byte + _bit < 26)
+
+
+ctypedef fused voxel_t:
+    unsigned char
+    unsigned long long int
+
+
+# bit flags of a voxel in the padded volume, only the 'frontier' engine sets the flags above FOREGROUND
+cdef enum:
+    FOREGROUND = 1
+    BORDER = 2
+    IN_CURRENT = 4
+    IN_PREVIOUS = 8
+    JOINING = 16
+
+# flags of the voxels in tiles given to cy_thin_block, marks of even and odd subiterations alternate
+TILE_FOREGROUND = FOREGROUND
+TILE_MARKS = (4, 8)
+
+# increments of the 6 neighbors of a voxel in POSITION_VECTORS
+cdef Py_ssize_t FACE_NEIGHBORS[6]
+FACE_NEIGHBORS[:] = [4, 10, 12, 14, 16, 22]
+
+
+cdef struct PaddedVolume:
+    # C contiguous binary volume padded by one voxel on each side
+    unsigned char* data
+    Py_ssize_t size
+    Py_ssize_t shape[3]
+    Py_ssize_t z_stride
+    Py_ssize_t x_stride
+    Py_ssize_t offsets[27]
+    bint reflect
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _unpack_bits(const unsigned long long int[:, :, ::1] words, unsigned char[:, :, ::1] padded):
+    # write the voxels of bit-packed words to the interior of an array padded by one voxel on each side
+    cdef Py_ssize_t z, x, y
+    with nogil:
+        for z in range(padded.shape[0] - 2):
+            for x in range(padded.shape[1] - 2):
+                for y in range(padded.shape[2] - 2):
+                    padded[z + 1, x + 1, y + 1] = (words[z, x, y >> 6] >> (y & 63)) & 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _pack_bits(const unsigned char[:, :, ::1] padded, unsigned long long int[:, :, ::1] words):
+    # write the FOREGROUND flags of the interior of a padded array to bit-packed words
+    cdef Py_ssize_t z, x, y
+    with nogil:
+        for z in range(padded.shape[0] - 2):
+            for x in range(padded.shape[1] - 2):
+                for y in range(words.shape[2]):
+                    words[z, x, y] = 0
+                for y in range(padded.shape[2] - 2):
+                    words[z, x, y >> 6] |= <unsigned long long int>(padded[z + 1, x + 1, y + 1] & FOREGROUND) << (y & 63)
+
+
+class ThinningWorkspace:
+    """
+    Buffers cy_get_thinned_3d reuses from one call to the next, grown to fit the largest volume
+    thinned with them. A workspace is used by one thread at a time
+    """
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, size, dtype):
+        # C contiguous 1D array of size items of dtype, the same memory every time it fits
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = self._buffers[name] = np.empty(max(size, 1), dtype=dtype)
+        return buffer[:max(size, 1)]
+
+
+def _repeat_edges(padded):
+    # padding of 'reflect', the edge voxels repeated
+    for axis in range(3):
+        padded.swapaxes(0, axis)[0] = padded.swapaxes(0, axis)[1]
+        padded.swapaxes(0, axis)[-1] = padded.swapaxes(0, axis)[-2]
+
+
+def _get_padded(arr, str mode, int cval, dtype=np.uint64, workspace=None):
+    """
+    Returns a C contiguous copy of arr padded by one voxel on each side
+    'reflect' repeats the edge voxels (same as clamping the indices) and 'constant' pads with cval
+    arr can be a bitVolume.BitVolume, it is unpacked straight into the padded copy.
+    The copy of a numpy array is in the buffer of workspace if it is given
+    """
+    if mode not in ['reflect', 'constant']:
+        raise ValueError("mode must be either 'constant' or 'reflect', it is {}".format(mode))
+    shape = tuple(extent + 2 for extent in arr.shape)
+    if isinstance(arr, BitVolume):
+        padded = np.full(shape, cval if mode == 'constant' else 0, dtype=np.uint8)
+        _unpack_bits(arr.words, padded)
+        if mode == 'reflect':
+            _repeat_edges(padded)
+        return padded.astype(dtype, copy=False)
+    if workspace is not None:
+        padded = workspace.get('padded', shape[0] * shape[1] * shape[2], dtype).reshape(shape)
+        padded[1:-1, 1:-1, 1:-1] = arr
+        if mode == 'reflect':
+            _repeat_edges(padded)
+        else:
+            for axis in range(3):
+                padded.swapaxes(0, axis)[[0, -1]] = cval
+        return padded
+    if mode == 'reflect':
+        return np.ascontiguousarray(np.pad(np.asarray(arr).astype(dtype), 1, mode='edge'))
+    elif mode == 'constant':
+        return np.ascontiguousarray(np.pad(np.asarray(arr).astype(dtype), 1, mode='constant', constant_values=cval))
+    raise ValueError("mode must be either 'constant' or 'reflect', it is {}".format(mode))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _set_offsets(Py_ssize_t* offsets, Py_ssize_t z_stride, Py_ssize_t x_stride) nogil:
+    # flat offsets of the 27 neighbors in a C contiguous padded array
+    cdef Py_ssize_t n
+    for n in range(27):
+        offsets[n] = POSITION_TABLE[n][0] * z_stride + POSITION_TABLE[n][1] * x_stride + POSITION_TABLE[n][2]
+
+
+cdef void _init_volume(PaddedVolume* volume, unsigned char[:, :, ::1] padded, bint reflect):
+    volume.data = &padded[0, 0, 0]
+    volume.shape[0], volume.shape[1], volume.shape[2] = padded.shape[0], padded.shape[1], padded.shape[2]
+    volume.size = padded.shape[0] * padded.shape[1] * padded.shape[2]
+    volume.z_stride = padded.shape[1] * padded.shape[2]
+    volume.x_stride = padded.shape[2]
+    volume.reflect = reflect
+    _set_offsets(volume.offsets, volume.z_stride, volume.x_stride)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline unsigned long long int _convolve_at(voxel_t* data,
+                                                Py_ssize_t index,
+                                                const Py_ssize_t* offsets,
+                                                const unsigned long long int* kernel) nogil:
+    # response of the flattened 3 x 3 x 3 kernel at flat index of the padded array
+    cdef unsigned long long int response = 0
+    cdef Py_ssize_t n
+    for n in range(27):
+        response += <unsigned long long int>data[index + offsets[n]] * kernel[n]
+    return response
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _lookup(const unsigned char* lookup_array, unsigned long long int config) nogil:
+    # deletion flag of a configuration number in the bit-packed lookup array
+    return (lookup_array[config >> 3] >> (7 - (config & 7))) & 1
+
+
+cdef struct DeletionRule:
+    # decision diagram nodes as (bit, low, high), or NULL to look the configuration numbers up in lookup_array
+    const unsigned char* lookup_array
+    const int* diagram
+
+
+cdef DeletionRule _get_deletion_rule(str rule):
+    # only the lookup array or the decision diagram of rule is loaded, deletion_rules keeps it so the pointer
+    # stays valid after this returns
+    cdef DeletionRule deletion_rule
+    cdef const unsigned char[::1] lookup_array
+    cdef const int[:, ::1] diagram
+    assert rule in RULES, "rule must be one of {}, it is {}".format(RULES, rule)
+    deletion_rule.lookup_array = NULL
+    deletion_rule.diagram = NULL
+    if rule == 'diagram':
+        diagram = get_deletion_diagram()
+        deletion_rule.diagram = &diagram[0, 0]
+    else:
+        lookup_array = get_lookup_array()
+        deletion_rule.lookup_array = &lookup_array[0]
+    return deletion_rule
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _is_deletable(const DeletionRule* rule, unsigned long long int config) nogil:
+    # True if the voxel of a configuration number of the first direction is deleted
+    cdef int node = 2
+    if rule.diagram == NULL:
+        return _lookup(rule.lookup_array, config)
+    while node > 1:
+        node = rule.diagram[3 * node + 1 + ((config >> rule.diagram[3 * node]) & 1)]
+    return node
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline unsigned int _get_config(const PaddedVolume* volume, Py_ssize_t index) nogil:
+    # configuration number of the first direction at a flat index, reads the neighborhood once
+    cdef unsigned int config = 0
+    cdef Py_ssize_t n
+    for n in range(13):
+        config |= <unsigned int>(volume.data[index + volume.offsets[n]] & FOREGROUND) << CONFIG_BIT[n]
+    for n in range(14, 27):
+        config |= <unsigned int>(volume.data[index + volume.offsets[n]] & FOREGROUND) << CONFIG_BIT[n]
+    return config
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline unsigned int _permute_config(unsigned int config, int direction) nogil:
+    # configuration number of a direction from the configuration number of the first direction
+    return (PERMUTATION_TABLE[direction][0][config & 255] | PERMUTATION_TABLE[direction][1][(config >> 8) & 255] |
+            PERMUTATION_TABLE[direction][2][(config >> 16) & 255] | PERMUTATION_TABLE[direction][3][config >> 24])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline Py_ssize_t _gallop(const Py_ssize_t* sorted_indices, Py_ssize_t count, Py_ssize_t start, Py_ssize_t value) nogil:
+    # first position at or after start of an ascending array whose value is not less than value,
+    # takes time logarithmic in the distance from start
+    cdef Py_ssize_t low, high, middle
+    cdef Py_ssize_t step = 1
+    if start >= count or sorted_indices[start] >= value:
+        return start
+    low = start
+    high = start + 1
+    while high < count and sorted_indices[high] < value:
+        low = high
+        step <<= 1
+        high = low + step
+    if high > count:
+        high = count
+    low += 1
+    while low < high:
+        middle = (low + high) >> 1
+        if sorted_indices[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _clear_config_bits(const PaddedVolume* volume,
+                                    const Py_ssize_t* border,
+                                    Py_ssize_t num_border_points,
+                                    unsigned int* configs,
+                                    Py_ssize_t index,
+                                    Py_ssize_t* cursors) nogil:
+    # clear the bit of a deleted voxel at flat index in the configuration numbers of the border points around it,
+    # cursors hold one position in border per row of the neighborhood and only move forward
+    cdef Py_ssize_t row, slot, row_center
+    for row in range(9):
+        row_center = index + volume.offsets[3 * row + 1]
+        slot = _gallop(border, num_border_points, cursors[row], row_center - 1)
+        cursors[row] = slot
+        while slot < num_border_points and border[slot] <= row_center + 1:
+            # border point is at increment m from the deleted voxel, deleted voxel is at increment 26 - m from it
+            if 3 * row + 1 + border[slot] - row_center != 13:
+                configs[slot] &= ~(1u << CONFIG_BIT[25 - 3 * row - border[slot] + row_center])
+            slot += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _delete_voxel(PaddedVolume* volume, Py_ssize_t index, Py_ssize_t* deleted) nogil:
+    # zero a voxel of the padded array, if the padding reflects the voxel, zero its copies in the padding as well
+    # flat indices of all the zeroed voxels (at most 8) are written to deleted unless it is NULL, returns their count
+    # copies in the padding belong to a single voxel, so different voxels can be deleted from different threads
+    cdef Py_ssize_t z, x, y, zz, xx, yy
+    cdef Py_ssize_t count = 0
+    if not volume.reflect:
+        volume.data[index] = 0
+        if deleted != NULL:
+            deleted[0] = index
+        return 1
+    z = index // volume.z_stride
+    x = (index % volume.z_stride) // volume.x_stride
+    y = index % volume.x_stride
+    for zz in range(z - (z == 1), z + (z == volume.shape[0] - 2) + 1):
+        for xx in range(x - (x == 1), x + (x == volume.shape[1] - 2) + 1):
+            for yy in range(y - (y == 1), y + (y == volume.shape[2] - 2) + 1):
+                volume.data[zz * volume.z_stride + xx * volume.x_stride + yy] = 0
+                if deleted != NULL:
+                    deleted[count] = zz * volume.z_stride + xx * volume.x_stride + yy
+                count += 1
+    return count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _get_row_border_indices(const PaddedVolume* volume, Py_ssize_t row, Py_ssize_t* border) nogil:
+    # write flat indices of the border points in a row of the interior of the padded array to border unless
+    # it is NULL, return their count. Rows are numbered in C order over the interior (z, x) coordinates
+    # border points are foreground voxels with at least one background voxel in their 6 neighborhood
+    cdef Py_ssize_t y
+    cdef Py_ssize_t count = 0
+    cdef Py_ssize_t index = ((1 + row // (volume.shape[1] - 2)) * volume.z_stride +
+                             (1 + row % (volume.shape[1] - 2)) * volume.x_stride + 1)
+    cdef const unsigned char* data = volume.data
+    for y in range(1, volume.shape[2] - 1):
+        if data[index] & FOREGROUND and not (data[index - volume.z_stride] & data[index + volume.z_stride] &
+                                             data[index - volume.x_stride] & data[index + volume.x_stride] &
+                                             data[index - 1] & data[index + 1] & FOREGROUND):
+            if border != NULL:
+                border[count] = index
+            count += 1
+        index += 1
+    return count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _get_border_indices(const PaddedVolume* volume, Py_ssize_t* border) nogil:
+    # write flat indices of all the interior border points of the padded array to border, return their count
+    cdef Py_ssize_t row
+    cdef Py_ssize_t count = 0
+    for row in range((volume.shape[0] - 2) * (volume.shape[1] - 2)):
+        count += _get_row_border_indices(volume, row, border + count)
+    return count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _get_border_indices_parallel(const PaddedVolume* volume,
+                                             Py_ssize_t* border,
+                                             Py_ssize_t* row_starts,
+                                             int num_threads) nogil:
+    # same as _get_border_indices using num_threads threads, rows are counted first so that every row
+    # is written at its position in the ascending order of flat indices, row_starts holds one item per row
+    cdef Py_ssize_t row, row_count
+    cdef Py_ssize_t num_rows = (volume.shape[0] - 2) * (volume.shape[1] - 2)
+    cdef Py_ssize_t count = 0
+    for row in prange(num_rows, schedule='static', num_threads=num_threads):
+        row_starts[row] = _get_row_border_indices(volume, row, NULL)
+    for row in range(num_rows):
+        row_count = row_starts[row]
+        row_starts[row] = count
+        count += row_count
+    for row in prange(num_rows, schedule='static', num_threads=num_threads):
+        _get_row_border_indices(volume, row, border + row_starts[row])
+    return count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _convolve_iteration(PaddedVolume* volume,
+                                    const Py_ssize_t* border,
+                                    Py_ssize_t num_border_points,
+                                    const unsigned long long int* kernels,
+                                    const DeletionRule* rule,
+                                    unsigned long long int* configs) nogil:
+    # 12 subiterations convolving the neighborhood of the border points with each direction kernel
+    cdef Py_ssize_t n, index
+    cdef Py_ssize_t num_voxels_removed = 0
+    cdef Py_ssize_t deleted[8]
+    cdef int direction
+    for direction in range(12):
+        for n in range(num_border_points):
+            configs[n] = _convolve_at(volume.data, border[n], volume.offsets, kernels + 27 * direction)
+        for n in range(num_border_points):
+            index = border[n]
+            if volume.data[index] and _is_deletable(rule, configs[n]):
+                _delete_voxel(volume, index, deleted)
+                num_voxels_removed += 1
+    return num_voxels_removed
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _config_iteration(PaddedVolume* volume,
+                                  const Py_ssize_t* border,
+                                  Py_ssize_t num_border_points,
+                                  const DeletionRule* rule,
+                                  unsigned int* configs,
+                                  Py_ssize_t* marked) nogil:
+    # 12 subiterations reading the neighborhood of every border point once, configuration numbers
+    # of the border points are updated in place as their neighbors are deleted
+    cdef Py_ssize_t n, k, j, row, num_marked, num_deleted
+    cdef Py_ssize_t num_voxels_removed = 0
+    cdef Py_ssize_t deleted[8]
+    cdef Py_ssize_t cursors[9]
+    cdef Py_ssize_t mirror_cursors[9]
+    cdef int direction
+    for n in range(num_border_points):
+        configs[n] = _get_config(volume, border[n])
+    for direction in range(12):
+        num_marked = 0
+        for n in range(num_border_points):
+            if volume.data[border[n]] and _is_deletable(rule, _permute_config(configs[n], direction)):
+                marked[num_marked] = border[n]
+                num_marked += 1
+        # marked voxels are in ascending order so the cursors sweep border once per subiteration
+        for row in range(9):
+            cursors[row] = 0
+        for k in range(num_marked):
+            num_deleted = _delete_voxel(volume, marked[k], deleted)
+            _clear_config_bits(volume, border, num_border_points, configs, marked[k], cursors)
+            for j in range(num_deleted):
+                # copies of the voxel in the padding of a 'reflect' volume
+                if deleted[j] != marked[k]:
+                    for row in range(9):
+                        mirror_cursors[row] = 0
+                    _clear_config_bits(volume, border, num_border_points, configs, deleted[j], mirror_cursors)
+        num_voxels_removed += num_marked
+    return num_voxels_removed
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _parallel_iteration(PaddedVolume* volume,
+                                    const Py_ssize_t* border,
+                                    Py_ssize_t num_border_points,
+                                    const DeletionRule* rule,
+                                    unsigned char* marks,
+                                    int num_threads) nogil:
+    # 12 subiterations on num_threads threads, every border point is evaluated against the volume as it was
+    # at the start of the subiteration and the marked ones are deleted after all of them are evaluated,
+    # so the result does not depend on the number of threads
+    cdef Py_ssize_t n
+    cdef Py_ssize_t num_voxels_removed = 0
+    cdef int direction
+    for direction in range(12):
+        for n in prange(num_border_points, schedule='static', num_threads=num_threads):
+            marks[n] = (volume.data[border[n]] & FOREGROUND and
+                        _is_deletable(rule, _permute_config(_get_config(volume, border[n]), direction)))
+        for n in prange(num_border_points, schedule='static', num_threads=num_threads):
+            if marks[n]:
+                _delete_voxel(volume, border[n], NULL)
+                num_voxels_removed += 1
+    return num_voxels_removed
+
+
+cdef struct Frontier:
+    # border points to evaluate in an iteration of the 'frontier' engine, previous holds the ones whose
+    # neighborhood changed in the last iteration, current the ones that changed or became border points
+    # in this iteration and joining the voxels that become border points in the next iteration
+    Py_ssize_t* previous
+    Py_ssize_t* current
+    Py_ssize_t* joining
+    Py_ssize_t* marked
+    Py_ssize_t num_previous
+    Py_ssize_t num_current
+    Py_ssize_t num_joining
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _is_interior(const PaddedVolume* volume, Py_ssize_t index) nogil:
+    # True if flat index is a voxel of the padded volume outside its padding
+    cdef Py_ssize_t z = index // volume.z_stride
+    cdef Py_ssize_t x = (index % volume.z_stride) // volume.x_stride
+    cdef Py_ssize_t y = index % volume.x_stride
+    return (0 < z < volume.shape[0] - 1) and (0 < x < volume.shape[1] - 1) and (0 < y < volume.shape[2] - 1)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _frontier_delete(PaddedVolume* volume, Frontier* frontier, Py_ssize_t index) nogil:
+    # delete a voxel and add the border points whose neighborhood it changes to the current iteration,
+    # foreground voxels it exposes become border points in the next iteration
+    cdef Py_ssize_t j, m, neighbor, num_deleted
+    cdef Py_ssize_t deleted[8]
+    cdef unsigned char* data = volume.data
+    num_deleted = _delete_voxel(volume, index, deleted)
+    for j in range(num_deleted):
+        for m in range(27):
+            neighbor = deleted[j] + volume.offsets[m]
+            if (0 <= neighbor < volume.size and
+                    data[neighbor] & (FOREGROUND | BORDER | IN_CURRENT) == FOREGROUND | BORDER):
+                data[neighbor] |= IN_CURRENT
+                frontier.current[frontier.num_current] = neighbor
+                frontier.num_current += 1
+        for m in range(6):
+            neighbor = deleted[j] + volume.offsets[FACE_NEIGHBORS[m]]
+            if (0 <= neighbor < volume.size and
+                    data[neighbor] & (FOREGROUND | BORDER | JOINING) == FOREGROUND and
+                    _is_interior(volume, neighbor)):
+                data[neighbor] |= JOINING
+                frontier.joining[frontier.num_joining] = neighbor
+                frontier.num_joining += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _frontier_advance(PaddedVolume* volume, Frontier* frontier) nogil:
+    # border points that changed in this iteration are evaluated in the next one too, together with
+    # the new border points
+    cdef Py_ssize_t k, index
+    cdef Py_ssize_t num_previous = 0
+    cdef Py_ssize_t* swap = frontier.previous
+    cdef unsigned char* data = volume.data
+    for k in range(frontier.num_previous):
+        data[frontier.previous[k]] &= ~IN_PREVIOUS
+    frontier.previous = frontier.current
+    frontier.current = swap
+    for k in range(frontier.num_current):
+        index = frontier.previous[k]
+        if data[index] & FOREGROUND:
+            data[index] = (data[index] & ~IN_CURRENT) | IN_PREVIOUS
+            frontier.previous[num_previous] = index
+            num_previous += 1
+    frontier.num_previous = num_previous
+    for k in range(frontier.num_joining):
+        index = frontier.joining[k]
+        data[index] = (data[index] & ~JOINING) | BORDER | IN_CURRENT
+        frontier.current[k] = index
+    frontier.num_current = frontier.num_joining
+    frontier.num_joining = 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _frontier_iteration(PaddedVolume* volume, Frontier* frontier, const DeletionRule* rule) nogil:
+    # 12 subiterations evaluating only the border points whose neighborhood changed in this or the last
+    # iteration, every other border point was already kept in all the 12 directions with the same neighborhood
+    cdef Py_ssize_t k, index, num_marked
+    cdef Py_ssize_t num_voxels_removed = 0
+    cdef unsigned char* data = volume.data
+    cdef int direction
+    for direction in range(12):
+        num_marked = 0
+        for k in range(frontier.num_previous):
+            index = frontier.previous[k]
+            if data[index] & FOREGROUND and _is_deletable(rule, _permute_config(_get_config(volume, index), direction)):
+                frontier.marked[num_marked] = index
+                num_marked += 1
+        for k in range(frontier.num_current):
+            index = frontier.current[k]
+            if (data[index] & (FOREGROUND | IN_PREVIOUS) == FOREGROUND and
+                    _is_deletable(rule, _permute_config(_get_config(volume, index), direction))):
+                frontier.marked[num_marked] = index
+                num_marked += 1
+        for k in range(num_marked):
+            _frontier_delete(volume, frontier, frontier.marked[k])
+        num_voxels_removed += num_marked
+    _frontier_advance(volume, frontier)
+    return num_voxels_removed
+
+
 @cython.boundscheck(False) # turn off bounds-checking for entire function
 @cython.wraparound(False)  # turn off negative index wrapping for entire function
-def cy_convolve(unsigned long long int[:, :, :] binary_arr, 
-                unsigned long long int[:, :, :] kernel, 
-                Py_ssize_t[:, ::1]  points, 
+def cy_convolve(unsigned long long int[:, :, :] binary_arr,
+                unsigned long long int[:, :, :] kernel,
+                Py_ssize_t[:, ::1]  points,
                 str mode,
                 int cval):
     """
@@ -45,35 +616,26 @@ def cy_convolve(unsigned long long int[:, :, :] binary_arr,
     responses : Numpy array
         3D convolved numpy array only at "points"
     """
-    cdef Py_ssize_t y, z, x, n, i, j, k
+    cdef Py_ssize_t n
     cdef Py_ssize_t npoints = points.shape[0]
+    cdef Py_ssize_t offsets[27]
     cdef unsigned long long int[::1] responses = np.zeros(npoints, dtype='u8')
-    z_extent, x_extent, y_extent = np.asarray(binary_arr).shape
-    extent = [z_extent - 1, x_extent - 1, y_extent - 1]
-    for n in range(npoints):
-        z = points[n, 0]
-        x = points[n, 1]
-        y = points[n, 2]
-        for k, i, j in rotational_operators.POSITION_VECTORS:
-            if (z + k < 0 or z + k > extent[0] or 
-                  x + i < 0 or x + i > extent[1] or 
-                  y + j < 0 or y + j > extent[2]):
-                if mode == 'reflect':
-                    incremented = [z+k, x+i, y+j]
-                    indexes = [0 if item < 0 else item for item in incremented]
-                    indexes_new = [extent[nth] if value > extent[nth] else value for nth, value in enumerate(indexes)]
-                    binary_arr_val = binary_arr[indexes_new[0], indexes_new[1], indexes_new[2]]
-                elif mode == 'constant':
-                    binary_arr_val = cval
-            else:
-                binary_arr_val = binary_arr[z + k, x + i, y + j]
-            responses[n] += binary_arr_val * kernel[k + 1, i + 1, j + 1]
+    cdef unsigned long long int[:, :, ::1] padded = _get_padded(binary_arr, mode, cval)
+    cdef unsigned long long int[::1] flat_kernel = np.ascontiguousarray(np.asarray(kernel).ravel(), dtype=np.uint64)
+    cdef Py_ssize_t z_stride = padded.shape[1] * padded.shape[2]
+    cdef Py_ssize_t x_stride = padded.shape[2]
+    _set_offsets(offsets, z_stride, x_stride)
+    with nogil:
+        for n in range(npoints):
+            responses[n] = _convolve_at(&padded[0, 0, 0],
+                                        (points[n, 0] + 1) * z_stride + (points[n, 1] + 1) * x_stride + points[n, 2] + 1,
+                                        offsets, &flat_kernel[0])
     return np.asarray(responses, order='C')
 
 
 @cython.boundscheck(False) # turn off bounds-checking for entire function
 @cython.wraparound(False)  # turn off negative index wrapping for entire function
-def get_border_coords(unsigned long long int[:, :, :] arr, 
+def get_border_coords(unsigned long long int[:, :, :] arr,
                       Py_ssize_t[:, ::1] points,
                       str mode,
                       int cval):
@@ -98,55 +660,183 @@ def get_border_coords(unsigned long long int[:, :, :] arr,
         N * 3 array list of borders of objects in the arr
     """
     conv_arr = cy_convolve(arr, kernel=SELEMENT, points=points, mode=mode, cval=cval)
-    border_point_arr_coordinates =  [index for value, index in zip(conv_arr, points) 
-                                     if value != 6]
-    return np.asarray(border_point_arr_coordinates, order='C')
+    return np.ascontiguousarray(np.asarray(points)[conv_arr != 6])
 
 
 @cython.boundscheck(False) # turn off bounds-checking for entire function
 @cython.wraparound(False)  # turn off negative index wrapping for entire function
-def cy_get_thinned_3d(unsigned long long int[:, :, :] arr, str mode, int cval):
+def cy_get_thinned_3d(arr, str mode, int cval, str engine='config', int num_threads=0, str rule='table',
+                      checkpoint=None, Py_ssize_t start_iteration=0, workspace=None, bint verbose=True):
     """
     Return thinned output
     Parameters
     ----------
-    binary_arr : Numpy array
-        3D np.uint64 numpy array
+    arr : Numpy array or bitVolume.BitVolume
+        3D binary numpy array of any integer or boolean type, or a bit-packed volume. Thinned in place
     mode : string
         convolution mode, can be either 'constant' or 'reflect'
     cval : int
         value to pad with if mode is 'constant'
+    engine : string
+        'config' reads the neighborhood of a border point once per iteration and permutes the bits of
+        its configuration number for every direction, 'convolve' convolves it with each of the 12
+        direction kernels, 'frontier' keeps the border points between iterations and only evaluates
+        the ones around the voxels removed recently and 'parallel' evaluates the border points of
+        every subiteration on num_threads threads before deleting them. All of them give the same result
+    num_threads : int
+        number of OpenMP threads of the 'parallel' engine, 0 uses the OpenMP default
+    rule : string
+        one of RULES, 'table' looks the configuration numbers up in the lookup array and 'diagram'
+        walks the decision diagram of the templates, which fits in the cache. Both give the same result
+    checkpoint : thinning_checkpoint.ThinningCheckpoint
+        saves the voxels after every iteration it is due, none are saved if it is None
+    start_iteration : int
+        number of iterations arr was thinned for before, arr is a checkpoint of a run that is resumed
+    workspace : ThinningWorkspace
+        buffers reused by the calls given the same workspace, allocated for this call if it is None
+    verbose : bool
+        prints the time and number of voxels removed of every iteration
     Returns
     -------
-    Numpy array
-        3D np.bool thinned numpy array of the same shape
+    Numpy array or bitVolume.BitVolume
+        3D np.bool thinned numpy array of the same shape, arr itself if it is a BitVolume
     Notes
     -----
     Nonzero point p is said to be a border point if the set N6(p)[1st orderd neighbors] contains at least one white point.
     In other words it is not a border point if every point is 1 i.e sum of the neighbors N6(p) = 6
+    In every subiteration the configuration numbers of all the border points are found before
+    any of them is deleted
     """
+    assert engine in ENGINES, "engine must be one of {}, it is {}".format(ENGINES, engine)
+    assert mode == 'reflect' or cval in [0, 1], "cval must be 0 or 1, it is {}".format(cval)
     cdef Py_ssize_t num_voxels_removed = 1
-    cdef Py_ssize_t iter_count = 0
-    cdef Py_ssize_t x, y, z
+    cdef Py_ssize_t iter_count = start_iteration
+    cdef Py_ssize_t n, num_border_points
+    cdef PaddedVolume volume
+    cdef bint use_config = engine == 'config'
+    cdef bint use_frontier = engine == 'frontier'
+    cdef bint use_parallel = engine == 'parallel'
+    cdef Frontier frontier
+    if workspace is None:
+        workspace = ThinningWorkspace()
+    padded_arr = _get_padded(arr, mode, cval, dtype=np.uint8, workspace=workspace)
+    _init_volume(&volume, padded_arr, mode == 'reflect')
+    cdef const unsigned long long int[:, ::1] kernels = DIRECTION_KERNELS
+    cdef DeletionRule deletion_rule = _get_deletion_rule(rule)
+    cdef bint is_packed = isinstance(arr, BitVolume)
+    cdef Py_ssize_t num_foreground = max(arr.countNonzero() if is_packed else np.count_nonzero(arr), 1)
+    cdef Py_ssize_t[::1] border = workspace.get('border', num_foreground, np.intp)
+    cdef Py_ssize_t[::1] marked = workspace.get('marked', num_foreground, np.intp)
+    cdef unsigned int[::1] configs = workspace.get('configs', num_foreground if use_config else 1, np.uint32)
+    cdef unsigned long long int[::1] conf_volume = workspace.get(
+        'conf_volume', 1 if use_config or use_frontier else num_foreground, np.uint64)
+    cdef Py_ssize_t[:, ::1] frontier_lists
+    cdef unsigned char[::1] marks = workspace.get('marks', num_foreground if use_parallel else 1, np.uint8)
+    cdef Py_ssize_t[::1] row_starts = workspace.get(
+        'row_starts', padded_arr.shape[0] * padded_arr.shape[1] if use_parallel else 1, np.intp)
+    if num_threads <= 0:
+        num_threads = openmp.omp_get_max_threads()
+    if use_frontier:
+        frontier_lists = workspace.get('frontier_lists', 2 * num_foreground, np.intp).reshape(2, num_foreground)
+        frontier.previous = &frontier_lists[0, 0]
+        frontier.current = &border[0]
+        frontier.joining = &frontier_lists[1, 0]
+        frontier.marked = &marked[0]
+        frontier.num_previous = frontier.num_joining = 0
+        frontier.num_current = _get_border_indices(&volume, frontier.current)
+        for n in range(frontier.num_current):
+            volume.data[frontier.current[n]] |= BORDER | IN_CURRENT
     # Loop until array doesn't change equivalent to you cant remove any pixels => num_voxels_removed = 0
     while num_voxels_removed > 0:
         # loop through all 12 subiterations
         iter_time = time.time()
-        non_zero_coordinates = np.asarray(image_tools.list_of_tuples_of_val(np.asarray(arr), 1), order='C')
-        num_voxels_removed = 0
-        if non_zero_coordinates != []:
-            border_point_arr_coordinates = get_border_coords(arr, non_zero_coordinates, mode, cval)
-            if border_point_arr_coordinates != []:
-                for i in range(12):
-                    conf_volume = cy_convolve(arr, 
-                                            kernel=rotational_operators.DIRECTIONS_LIST[i], 
-                                            points=border_point_arr_coordinates,
-                                            mode=mode,
-                                            cval=cval)
-                    for value, (x, y, z) in zip(conf_volume, border_point_arr_coordinates):
-                        if LOOKUP_ARRAY[value]:
-                            arr[x, y, z] = 0
-                            num_voxels_removed += 1
+        with nogil:
+            if use_frontier:
+                num_voxels_removed = _frontier_iteration(&volume, &frontier, &deletion_rule)
+            elif use_parallel:
+                num_border_points = _get_border_indices_parallel(&volume, &border[0], &row_starts[0], num_threads)
+                num_voxels_removed = _parallel_iteration(&volume, &border[0], num_border_points,
+                                                         &deletion_rule, &marks[0], num_threads)
+            else:
+                num_border_points = _get_border_indices(&volume, &border[0])
+                if use_config:
+                    num_voxels_removed = _config_iteration(&volume, &border[0], num_border_points,
+                                                           &deletion_rule, &configs[0], &marked[0])
+                else:
+                    num_voxels_removed = _convolve_iteration(&volume, &border[0], num_border_points,
+                                                             &kernels[0, 0], &deletion_rule, &conf_volume[0])
         iter_count += 1
-        print("Finished iteration %i, %0.2f s, removed %i pixels" % (iter_count, time.time() - iter_time, num_voxels_removed))
+        if verbose:
+            print("Finished iteration %i, %0.2f s, removed %i pixels" % (iter_count, time.time() - iter_time,
+                                                                        num_voxels_removed))
+        if checkpoint is not None and num_voxels_removed > 0 and checkpoint.isDue(iter_count):
+            checkpoint.save(iter_count, padded_arr[1:-1, 1:-1, 1:-1] & FOREGROUND)
+    if is_packed:
+        _pack_bits(padded_arr, arr.words)
+        return arr
+    np.asarray(arr)[...] = padded_arr[1:-1, 1:-1, 1:-1] & FOREGROUND
     return np.asarray(arr, dtype=np.bool)
+
+
+@cython.boundscheck(False) # turn off bounds-checking for entire function
+@cython.wraparound(False)  # turn off negative index wrapping for entire function
+def cy_thin_block(unsigned char[:, :, ::1] block, int direction, unsigned char applied_mark,
+                  unsigned char new_mark, bint find_border, str rule='table'):
+    """
+    Return number of voxels marked for deletion in one subiteration on the interior of a block
+    Parameters
+    ----------
+    block : Numpy array
+        3D np.uint8 array of voxel flags, a tile of a larger volume with one voxel of its neighbors
+        (or of padding at the edges of the volume) on each side. Changed in place
+    direction : int
+        subiteration, index of the direction in rotational_operators.DIRECTIONS_LIST
+    applied_mark : int
+        flag of the voxels marked in the previous subiteration, they are deleted before this one
+    new_mark : int
+        flag set on the interior voxels that are deleted in this subiteration
+    find_border : bool
+        True in the first subiteration of an iteration, sets the BORDER flag of the interior voxels,
+        later subiterations use the flags found then
+    rule : string
+        one of RULES, as in cy_get_thinned_3d
+    Returns
+    -------
+    int
+        number of voxels marked with new_mark
+    Notes
+    -----
+    Lets the volume be thinned one tile at a time, with the same result as thinning it whole,
+    marks of a subiteration are only applied in the next one so every tile sees its neighbors as
+    they were at the start of the subiteration
+    """
+    cdef Py_ssize_t n, z, x, y, index, num_border_points
+    cdef Py_ssize_t num_marked = 0
+    cdef PaddedVolume volume
+    cdef DeletionRule deletion_rule = _get_deletion_rule(rule)
+    cdef unsigned char[::1] data = np.asarray(block).reshape(-1)
+    cdef Py_ssize_t[::1] border = np.empty(max((block.shape[0] - 2) * (block.shape[1] - 2) * (block.shape[2] - 2), 1),
+                                           dtype=np.intp)
+    _init_volume(&volume, block, False)
+    with nogil:
+        for n in range(volume.size):
+            if data[n] & applied_mark:
+                data[n] = 0
+        if find_border:
+            num_border_points = _get_border_indices(&volume, &border[0])
+            for z in range(1, volume.shape[0] - 1):
+                for x in range(1, volume.shape[1] - 1):
+                    for y in range(1, volume.shape[2] - 1):
+                        data[z * volume.z_stride + x * volume.x_stride + y] &= ~BORDER
+            for n in range(num_border_points):
+                data[border[n]] |= BORDER
+        for z in range(1, volume.shape[0] - 1):
+            for x in range(1, volume.shape[1] - 1):
+                index = z * volume.z_stride + x * volume.x_stride + 1
+                for y in range(1, volume.shape[2] - 1):
+                    if (data[index] & (FOREGROUND | BORDER) == FOREGROUND | BORDER and
+                            _is_deletable(&deletion_rule, _permute_config(_get_config(&volume, index), direction))):
+                        data[index] |= new_mark
+                        num_marked += 1
+                    index += 1
+    return num_marked
@@ -0,0 +1,79 @@
+import os
+import time
+
+import numpy as np
+
+"""
+Checkpoints of long thinning runs, the voxels and the number of iterations done are saved to a
+memory-mapped .npy file every few iterations or seconds, so a run that is killed can be resumed
+from the last checkpoint instead of from the start
+
+The file holds two slots, each checkpoint overwrites the older one and only marks it valid once its
+voxels are flushed, a run killed while saving a checkpoint resumes from the one before
+"""
+
+
+def _get_dtype(shape):
+    # one slot, iteration is -1 while no checkpoint is saved in it, voxels are bit-packed
+    return np.dtype([('iteration', '<i8'), ('shape', '<i8', (3,)),
+                     ('voxels', 'u1', (-(-int(np.prod(shape)) // 8),))])
+
+
+class ThinningCheckpoint:
+    def __init__(self, path, shape, iterations=0, seconds=0):
+        # path : .npy file of the checkpoints
+        # shape : shape of the 3D volume thinned
+        # iterations : saves a checkpoint every iterations iterations, never if 0
+        # seconds : saves a checkpoint when more than seconds seconds passed since the last one, never if 0
+        self.path = path
+        self.shape = tuple(shape)
+        self.iterations = iterations
+        self.seconds = seconds
+        self.numSaved = 0
+        self.totalTime = 0
+        self._lastTime = time.time()
+        self._state = None
+
+    def load(self):
+        """
+        Return (number of iterations done, 3D boolean array of the voxels) of the last checkpoint,
+        None if there is none
+        """
+        if not os.path.exists(self.path):
+            return None
+        state = np.lib.format.open_memmap(self.path, mode='r+')
+        assert state.dtype == _get_dtype(self.shape), "{} is not a checkpoint of shape {}".format(self.path, self.shape)
+        self._state = state
+        slot = int(np.argmax(state['iteration']))
+        # no checkpoint is saved before the first iteration, a slot of a file killed as it was created is 0
+        if state['iteration'][slot] < 1:
+            return None
+        voxels = np.unpackbits(state['voxels'][slot])[:int(np.prod(self.shape))].reshape(self.shape)
+        return int(state['iteration'][slot]), voxels.astype(bool)
+
+    def isDue(self, iteration):
+        # True if a checkpoint is to be saved after iteration
+        return ((self.iterations > 0 and iteration % self.iterations == 0) or
+                (self.seconds > 0 and time.time() - self._lastTime >= self.seconds))
+
+    def save(self, iteration, voxels):
+        """
+        Saves the binary array voxels thinned for iteration iterations, the time it takes is added to totalTime
+        """
+        startTime = time.time()
+        if self._state is None:
+            self._state = np.lib.format.open_memmap(self.path, mode='w+', dtype=_get_dtype(self.shape), shape=(2,))
+            self._state['iteration'] = -1
+            self._state['shape'] = self.shape
+        slot = int(np.argmin(self._state['iteration']))
+        self._state['iteration'][slot] = -1
+        self._state.flush()
+        self._state['voxels'][slot] = np.packbits(voxels)
+        self._state.flush()
+        self._state['iteration'][slot] = iteration
+        self._state.flush()
+        seconds = time.time() - startTime
+        self.numSaved += 1
+        self.totalTime += seconds
+        self._lastTime = time.time()
+        print("Saved checkpoint of iteration %i in %0.2f s" % (iteration, seconds))
@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+import nose.tools
+import numpy as np
+import scipy.ndimage as ndimage
+
+import skeleton.thinVolume as thin_volume
+from skeleton.thinning_checkpoint import ThinningCheckpoint
+
+
+class _KilledCheckpoint(ThinningCheckpoint):
+    # checkpoint of a run that is killed right after saving numSaves checkpoints
+    def __init__(self, path, shape, numSaves):
+        super().__init__(path, shape, iterations=1)
+        self.numSaves = numSaves
+
+    def save(self, iteration, voxels):
+        super().save(iteration, voxels)
+        if self.numSaved == self.numSaves:
+            raise KeyboardInterrupt
+
+
+def test_save_load():
+    arr = np.random.randint(2, size=(5, 6, 7), dtype=bool)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoint.npy")
+        checkpoint = ThinningCheckpoint(path, arr.shape)
+        nose.tools.assert_is_none(checkpoint.load())
+        checkpoint.save(1, arr)
+        checkpoint.save(2, ~arr)
+        iteration, voxels = ThinningCheckpoint(path, arr.shape).load()
+        nose.tools.assert_equal(iteration, 2)
+        np.testing.assert_array_equal(voxels, ~arr)
+        # a checkpoint killed while it is saved is not valid, the one before it is loaded
+        state = np.lib.format.open_memmap(path, mode='r+')
+        state['iteration'][np.argmax(state['iteration'])] = -1
+        state.flush()
+        iteration, voxels = ThinningCheckpoint(path, arr.shape).load()
+        nose.tools.assert_equal(iteration, 1)
+        np.testing.assert_array_equal(voxels, arr)
+
+
+def test_resume():
+    blob = ndimage.gaussian_filter(np.random.uniform(size=(30, 34, 40)), 2) > 0.5
+    for engine in ['config', 'frontier', 'numpy']:
+        expected_result = thin_volume.get_thinned(blob, engine=engine)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.npy")
+            checkpoint = _KilledCheckpoint(path, blob.shape, 2)
+            with nose.tools.assert_raises(KeyboardInterrupt):
+                if engine == 'numpy':
+                    thin_volume.get_thinned_numpy(blob, checkpoint=checkpoint)
+                else:
+                    thin_volume.thinning.cy_get_thinned_3d(blob.copy(), 'reflect', 0, engine, checkpoint=checkpoint)
+            result = thin_volume.get_thinned(blob, engine=engine, checkpointIterations=1, resume=path)
+            np.testing.assert_array_equal(result, expected_result)
@@ -0,0 +1,135 @@
+import hashlib
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+import skeleton
+from skeleton.generate_lookup_array import write_atomically
+
+"""
+Loads the compiled thinning extension (skeleton/thinning.pyx) without compiling it on every fresh machine
+    1) the extension built in place by python setup_cython.py build_ext --inplace, if it is built from the
+       source as it is now, the source hash saved next to it or the source older than it
+    2) the extension compiled before, cached in CACHE_DIR under the hash of its source
+    3) compiled once with Cython into CACHE_DIR
+If it can not be compiled (no Cython or no C compiler) there is no extension and thinVolume.get_thinned
+falls back on the numpy engine
+"""
+
+MODULE_NAME = 'skeleton.thinning'
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thinning.pyx')
+
+BUILD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thinning.pyxbld')
+
+# compiled extensions of every source hash, shared by all the checkouts and processes of a machine
+CACHE_DIR = os.environ.get('SKELETON_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', '3scan-skeleton'))
+
+
+def get_source_hash():
+    """
+    Return sha1 hex digest of the source and build options of the extension, and the python
+    and numpy versions it is compiled against
+    """
+    sha1 = hashlib.sha1()
+    for path in [SOURCE_PATH, BUILD_PATH]:
+        with open(path, 'rb') as f:
+            sha1.update(f.read())
+    sha1.update(sys.version.encode())
+    sha1.update(np.__version__.encode())
+    return sha1.hexdigest()
+
+
+def get_cached_path(sourceHash=None):
+    # path of the compiled extension of sourceHash in CACHE_DIR
+    if sourceHash is None:
+        sourceHash = get_source_hash()
+    return os.path.join(CACHE_DIR, 'thinning-{}{}'.format(sourceHash, importlib.machinery.EXTENSION_SUFFIXES[0]))
+
+
+def get_hash_path(extensionPath):
+    # path of the source hash saved next to an extension built in place
+    return extensionPath + '.sha1'
+
+
+def write_source_hash(extensionPath):
+    # saves the source hash of an extension built in place next to it
+    write_atomically(get_hash_path(extensionPath), lambda f: f.write(get_source_hash().encode()))
+
+
+def is_current(extensionPath):
+    """
+    Return True if the extension at extensionPath is built from the source as it is now, by the source hash
+    saved next to it or if there is none, by the modification times of the source and the extension
+    """
+    hashPath = get_hash_path(extensionPath)
+    if os.path.exists(hashPath):
+        with open(hashPath, 'rb') as f:
+            return f.read().decode() == get_source_hash()
+    return os.path.getmtime(extensionPath) >= max(os.path.getmtime(path) for path in [SOURCE_PATH, BUILD_PATH])
+
+
+def _load(path):
+    # import the compiled extension at path as skeleton.thinning
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[MODULE_NAME]
+        raise
+    skeleton.thinning = module
+    return module
+
+
+def _get_extension():
+    # distutils extension of thinning.pyx with the options of thinning.pyxbld
+    loader = importlib.machinery.SourceFileLoader('thinning_pyxbld', BUILD_PATH)
+    build = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(build)
+    return build.make_ext(MODULE_NAME, SOURCE_PATH)
+
+
+def compile_extension(path):
+    """
+    Compiles thinning.pyx with Cython and saves the extension to path
+    """
+    import pyximport.pyxbuild
+    buildDir = tempfile.mkdtemp(prefix='thinning-build-')
+    try:
+        compiledPath = pyximport.pyxbuild.pyx_to_dll(SOURCE_PATH, _get_extension(), build_in_temp=True,
+                                                     pyxbuild_dir=buildDir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(compiledPath, 'rb') as compiled:
+            write_atomically(path, lambda f: shutil.copyfileobj(compiled, f))
+    finally:
+        shutil.rmtree(buildDir, ignore_errors=True)
+
+
+def load_thinning():
+    """
+    Return the compiled thinning extension module, None if it is not built and can not be compiled
+    """
+    if MODULE_NAME in sys.modules:
+        return sys.modules[MODULE_NAME]
+    # only finds compiled extensions, never the .pyx even if pyximport is installed
+    spec = importlib.machinery.PathFinder.find_spec(MODULE_NAME, skeleton.__path__)
+    if spec is not None:
+        if is_current(spec.origin):
+            return _load(spec.origin)
+        warnings.warn("thinning extension {} is built from an older thinning.pyx, it is not loaded".format(spec.origin))
+    path = get_cached_path()
+    if not os.path.exists(path):
+        try:
+            compile_extension(path)
+        except Exception as error:
+            warnings.warn("thinning extension could not be compiled, {}".format(error))
+            return None
+    return _load(path)
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import time
+
+import nose.tools
+
+import skeleton.thinning_extension as thinning_extension
+import skeleton.thinVolume as thin_volume
+
+
+def test_source_hash():
+    sourceHash = thinning_extension.get_source_hash()
+    nose.tools.assert_equal(sourceHash, thinning_extension.get_source_hash())
+    nose.tools.assert_in(sourceHash, thinning_extension.get_cached_path())
+
+
+def test_load_thinning():
+    # loaded once, the same module every time after
+    thinning = thinning_extension.load_thinning()
+    nose.tools.assert_is_not_none(thinning)
+    nose.tools.assert_is(thin_volume.thinning, thinning)
+    startTime = time.time()
+    nose.tools.assert_is(thinning_extension.load_thinning(), thinning)
+    nose.tools.assert_less(time.time() - startTime, 0.1)
+
+
+def test_compile_extension():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(thinning_extension.get_cached_path()))
+        thinning_extension.compile_extension(path)
+        assert os.path.getsize(path) > 0
+
+
+def test_stale_extension():
+    # an extension built in place is only loaded if its saved source hash is the hash of the source
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "thinning.so")
+        with open(path, "wb") as f:
+            f.write(b"")
+        thinning_extension.write_source_hash(path)
+        nose.tools.assert_true(thinning_extension.is_current(path))
+        with open(thinning_extension.get_hash_path(path), "wb") as f:
+            f.write(b"older source hash")
+        nose.tools.assert_false(thinning_extension.is_current(path))
+        # without a saved hash the extension must be newer than the source
+        os.remove(thinning_extension.get_hash_path(path))
+        os.utime(path, (0, 0))
+        nose.tools.assert_false(thinning_extension.is_current(path))